@@ -161,6 +161,65 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
 ]
 CELERY_BROKER_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+# One queue per kind of work, so a burst of imports cannot starve rule runs
+# or report rendering (see celery.md for the matching workers).
+CELERY_TASK_DEFAULT_QUEUE = "ingest"
+CELERY_TASK_ROUTES = {
+    "ingestion.tasks.parse_import_task": {"queue": "ingest"},
+    "ingestion.rules.tasks.*": {"queue": "rules"},
+    "ingestion.reports.tasks.*": {"queue": "reports"},
+}
+
+# Shared via Redis when available; without it every process has its own
+# cache.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+# Coalesced dispatch and per-user task locks (ingestion.coalesce) keep their
+# state in the cache, so they need it to be shared with the workers.
+TASK_COALESCING = bool(os.getenv("REDIS_URL"))
+# Dashboard response cache (ingestion.dashboard.cache): the data versions
+# are bumped by the Celery workers, so it is only on with a shared cache.
+DASHBOARD_CACHE = bool(os.getenv("REDIS_URL"))
+
+# Statements at least this large are parsed by a process pool
+# (ingestion.imports.parallel); 0 or 1 worker disables it. Off by default:
+# every prefork worker process would start its own pool, so enable it with
+# a low ingest worker concurrency.
+INGEST_PARALLEL_WORKERS = int(os.getenv("INGEST_PARALLEL_WORKERS", 1))
+INGEST_PARALLEL_MIN_BYTES = int(
+    os.getenv("INGEST_PARALLEL_MIN_BYTES", 32 * 1024 * 1024)
+)
+# "fused": parse_import_task categorises every batch before inserting it;
+# "staged": rows are inserted uncategorised and apply_rules_task follows.
+INGEST_PIPELINE = os.getenv("INGEST_PIPELINE", "fused")
+# currency of the rows of statements that do not state one (QIF, OFX
+# without CURDEF)
+INGEST_DEFAULT_CURRENCY = os.getenv("INGEST_DEFAULT_CURRENCY", "HUF")
+# apply_rules_for_user switches to set-based UPDATEs per rule
+# (ingestion.rules.pushdown) from this many uncategorised rows on
+RULES_PUSHDOWN_MIN_ROWS = int(os.getenv("RULES_PUSHDOWN_MIN_ROWS", 20_000))
+# memoised rule matching (ingestion.rules.memo): keys per ruleset, rulesets
+# per process, and whether workers share results through the cache
+RULES_MEMO_SIZE = int(os.getenv("RULES_MEMO_SIZE", 20_000))
+RULES_MEMO_RULESETS = int(os.getenv("RULES_MEMO_RULESETS", 64))
+RULES_MEMO_SHARED = os.getenv("RULES_MEMO_SHARED", "0") == "1"
+# an outflow and an inflow of the same amount booked at most this many days
+# apart in different statements are a transfer between own accounts
+TRANSFER_WINDOW_DAYS = int(os.getenv("TRANSFER_WINDOW_DAYS", 3))
+# a processing import without a progress heartbeat for this long is taken
+# over by the next delivery of its task (ingestion.imports.state)
+IMPORT_STALE_AFTER = int(os.getenv("IMPORT_STALE_AFTER", 300))
 
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
@@ -31,12 +31,13 @@ from ingestion.views import (
     spending_patterns,
     category_coverage,
     avg_expense_per_category,
+    dashboard_bundle,
 )
 
 from django.conf import settings
 from django.conf.urls.static import static
 
-from ingestion.reports.views import monthly_report, report_history
+from ingestion.reports.views import monthly_report, report_history, report_status
 
 from drf_spectacular.views import (
     SpectacularAPIView,
@@ -76,9 +77,13 @@ urlpatterns = [
         avg_expense_per_category,
         name="avg-expense-per-category",
     ),
+    path("api/dashboard/bundle", dashboard_bundle, name="dashboard-bundle"),
     # Report endpoint
     path("api/reports/monthly", monthly_report, name="monthly-report"),
     path("api/reports/history", report_history, name="report-history"),
+    path(
+        "api/reports/<uuid:report_id>/status", report_status, name="report-status"
+    ),
     # OpenAPI schema (JSON/YAML)
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     # Swagger UI
@@ -0,0 +1,71 @@
+"""
+Coalescing dispatch and per-user serialization of follow-up tasks.
+
+Follow-up work such as re-applying rules scans all of a user's rows, so a
+burst of triggers (a dozen statements uploaded in a row) only needs one
+run. dispatch() queues a run with a short countdown unless one is already
+pending for the (task, user); the run calls start_pending() before it
+reads any data, so a trigger that arrives before that point is covered by
+it and a later trigger queues the next run.
+
+user_lock() serializes the runs of a task per user across workers; a run
+that finds the lock taken is retried later by the caller.
+
+Both keep their state in the cache; without a shared cache
+(settings.TASK_COALESCING off) every trigger queues a run and runs are
+not locked.
+"""
+
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+# triggers within this many seconds share a run
+DEBOUNCE_SECONDS = 5
+# a pending marker outlives a lost task message by at most this long
+PENDING_TIMEOUT = 60 * 60
+LOCK_TIMEOUT = 30 * 60
+
+
+class UserLocked(Exception):
+    """Another run of the task holds the user's lock."""
+
+
+def _key(kind: str, task, user_id: str) -> str:
+    return f"tasks:{kind}:{task.name}:{user_id}"
+
+
+def dispatch(task, user_id: str, countdown=DEBOUNCE_SECONDS, **kwargs):
+    """
+    Queue task(user_id, **kwargs) unless a run for the user is already
+    pending. Returns the AsyncResult, or None when the trigger was coalesced.
+    """
+    if settings.TASK_COALESCING and not cache.add(
+        _key("pending", task, user_id), 1, timeout=PENDING_TIMEOUT
+    ):
+        return None
+    return task.apply_async(args=(user_id,), kwargs=kwargs, countdown=countdown)
+
+
+def start_pending(task, user_id: str):
+    """Mark the pending run as started: new triggers queue another run."""
+    cache.delete(_key("pending", task, user_id))
+
+
+@contextmanager
+def user_lock(task, user_id: str, timeout=LOCK_TIMEOUT):
+    if not settings.TASK_COALESCING:
+        yield
+        return
+    key = _key("lock", task, user_id)
+    token = uuid.uuid4().hex
+    if not cache.add(key, token, timeout=timeout):
+        raise UserLocked(key)
+    try:
+        yield
+    finally:
+        # only release our own lock, not one taken after ours expired
+        if cache.get(key) == token:
+            cache.delete(key)
@@ -0,0 +1,96 @@
+"""
+Per-user response cache for the dashboard endpoints.
+
+A response is cached under (user, endpoint, params, data_version). Every
+write path that changes what the dashboard shows calls bump_data_version,
+which moves the user to a fresh version, so stale entries are never read
+again and simply expire. The version also yields the ETag, so a client
+revalidating an unchanged dashboard gets a 304 without any query.
+
+The versions are mostly bumped in Celery workers, so the cache is only used
+with DASHBOARD_CACHE (a cache shared with them); otherwise every request
+runs the view.
+"""
+
+import hashlib
+import time
+from datetime import date
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from ingestion.utils import get_access_token, get_user_id
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(user_id: str) -> str:
+    return f"dashboard:version:{user_id}"
+
+
+def data_version(user_id: str) -> int:
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # unknown (first request or evicted): start a fresh version
+        cache.add(_version_key(user_id), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def bump_data_version(user_id: str):
+    """Invalidate the user's cached dashboard once the current transaction commits."""
+
+    def bump():
+        cache.set(_version_key(user_id), time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def _cache_key(request, endpoint: str, user_id: str) -> str:
+    params = sorted(request.query_params.lists())
+    # monthly-balance is relative to today
+    raw = f"{endpoint}|{params}|{date.today().isoformat()}"
+    digest = hashlib.sha256(raw.encode()).hexdigest()[:32]
+    return f"dashboard:{user_id}:{data_version(user_id)}:{digest}"
+
+
+def cached_dashboard_view(view):
+    """
+    Cache a dashboard view's 200 responses per user and data version and
+    answer If-None-Match with 304. Apply below @api_view.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        user_id = get_user_id(request)
+        if (
+            not settings.DASHBOARD_CACHE
+            or user_id is None
+            or get_access_token(request) is None
+        ):
+            return view(request, *args, **kwargs)
+
+        key = _cache_key(request, view.__name__, user_id)
+        etag = f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+        if etag in request.headers.get("If-None-Match", ""):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = cache.get(key)
+            if data is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data, CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    return wrapper
@@ -0,0 +1,162 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+
+from ingestion.models import MonthlyRollup, Transaction
+
+# (period, weekday, category_id, sign, is_transfer)
+RollupKey = tuple
+
+_SIGN = Case(
+    When(amount__gt=0, then=Value(1)),
+    When(amount__lt=0, then=Value(-1)),
+    default=Value(0),
+    output_field=IntegerField(),
+)
+
+
+def sign_of(amount) -> int:
+    return (amount > 0) - (amount < 0)
+
+
+def bucket_of(booking_date) -> tuple[str, int]:
+    """(period, weekday) of a booking date, weekday numbered like ExtractWeekDay."""
+    if booking_date is None:
+        return "", 0
+    return booking_date.strftime("%Y-%m"), booking_date.isoweekday() % 7 + 1
+
+
+def rollup_key(booking_date, category_id, amount, is_transfer) -> RollupKey:
+    period, weekday = bucket_of(booking_date)
+    return period, weekday, category_id, sign_of(amount), bool(is_transfer)
+
+
+_FROM_TXN = object()
+
+
+class RollupDelta:
+    """Accumulates (total, count) changes per rollup bucket before writing."""
+
+    def __init__(self):
+        self.buckets = defaultdict(lambda: [Decimal(0), 0])
+
+    def add(self, key: RollupKey, total, count=1):
+        bucket = self.buckets[key]
+        bucket[0] += total
+        bucket[1] += count
+
+    def add_txn(self, txn, factor=1, category_id=_FROM_TXN, is_transfer=_FROM_TXN):
+        """
+        Count a Transaction (or values() dict) in or out (factor=-1).
+        `category_id`/`is_transfer` override the row's own values, which is
+        how the bucket a row is moving out of is addressed.
+        """
+        get = txn.get if isinstance(txn, dict) else txn.__dict__.get
+        if category_id is _FROM_TXN:
+            category_id = get("category_id")
+        if is_transfer is _FROM_TXN:
+            is_transfer = get("is_transfer", False)
+        amount = get("amount")
+        key = rollup_key(get("booking_date"), category_id, amount, is_transfer)
+        self.add(key, factor * amount, factor)
+
+    def move_txn(self, txn, old_category_id, new_category_id):
+        self.add_txn(txn, -1, category_id=old_category_id)
+        self.add_txn(txn, 1, category_id=new_category_id)
+
+    def add_queryset(self, qs, factor=1):
+        """Fold a transaction queryset in with one GROUP BY."""
+        rows = (
+            qs.annotate(sign=_SIGN)
+            .values("booking_date", "category_id", "is_transfer", "sign")
+            .annotate(sum_amount=Sum("amount"), n=Count("id"))
+            .order_by()
+        )
+        for r in rows:
+            period, weekday = bucket_of(r["booking_date"])
+            key = (period, weekday, r["category_id"], r["sign"], r["is_transfer"])
+            self.add(key, factor * (r["sum_amount"] or 0), factor * r["n"])
+
+    def apply(self, user_id: str):
+        """Write the accumulated deltas to MonthlyRollup."""
+        with transaction.atomic():
+            for key, (total, count) in self.buckets.items():
+                if total == 0 and count == 0:
+                    continue
+                _apply_bucket(user_id, key, total, count)
+            MonthlyRollup.objects.filter(user_id=user_id, txn_count__lte=0).delete()
+        self.buckets.clear()
+
+
+def _apply_bucket(user_id, key, total, count):
+    period, weekday, category_id, sign, is_transfer = key
+    bucket = MonthlyRollup.objects.filter(
+        user_id=user_id,
+        period=period,
+        weekday=weekday,
+        category_id=category_id,
+        sign=sign,
+        is_transfer=is_transfer,
+    )
+    changes = {"total": F("total") + total, "txn_count": F("txn_count") + count}
+    if bucket.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            MonthlyRollup.objects.create(
+                user_id=user_id,
+                period=period,
+                weekday=weekday,
+                category_id=category_id,
+                sign=sign,
+                is_transfer=is_transfer,
+                total=total,
+                txn_count=count,
+            )
+    except IntegrityError:
+        # created concurrently in the meantime
+        bucket.update(**changes)
+
+
+def add_transactions(user_id: str, qs):
+    delta = RollupDelta()
+    delta.add_queryset(qs)
+    delta.apply(user_id)
+
+
+def remove_transactions(user_id: str, qs):
+    """Call before deleting the rows in `qs`."""
+    delta = RollupDelta()
+    delta.add_queryset(qs, factor=-1)
+    delta.apply(user_id)
+
+
+def move_category(category_id, new_category_id=None):
+    """
+    Re-bucket every user's rollups of a category, e.g. before the category is
+    deleted (its transactions fall back to uncategorized).
+    """
+    by_user = defaultdict(RollupDelta)
+    for r in MonthlyRollup.objects.filter(category_id=category_id):
+        delta = by_user[r.user_id]
+        delta.add(
+            (r.period, r.weekday, category_id, r.sign, r.is_transfer),
+            -r.total,
+            -r.txn_count,
+        )
+        delta.add(
+            (r.period, r.weekday, new_category_id, r.sign, r.is_transfer),
+            r.total,
+            r.txn_count,
+        )
+    for user_id, delta in by_user.items():
+        delta.apply(user_id)
+
+
+def rebuild_for_user(user_id: str):
+    """Recompute a user's rollups from scratch."""
+    with transaction.atomic():
+        MonthlyRollup.objects.filter(user_id=user_id).delete()
+        add_transactions(user_id, Transaction.objects.filter(user_id=user_id))
@@ -0,0 +1,206 @@
+"""
+Dashboard widgets computed from a user's MonthlyRollup rows.
+
+Every widget is a pure function over the rows returned by fetch_rollup_rows,
+so the single endpoints and the bundle endpoint share one implementation and
+the bundle can compute all of them from one fetch.
+"""
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import DecimalField, F, Sum, Value
+
+from ingestion.models import Merchant, MonthlyRollup, Transaction
+
+ROLLUP_VALUES = (
+    "period",
+    "weekday",
+    "category_id",
+    "category__name",
+    "category__type",
+    "sign",
+    "is_transfer",
+    "total",
+    "txn_count",
+)
+
+# Hét napjának sorrendje (Django: 1=Vasárnap, 7=Szombat)
+DAY_MAP = {1: "Sun", 2: "Mon", 3: "Tue", 4: "Wed", 5: "Thu", 6: "Fri", 7: "Sat"}
+
+
+def fetch_rollup_rows(user_id: str) -> list[dict]:
+    return list(MonthlyRollup.objects.filter(user_id=user_id).values(*ROLLUP_VALUES))
+
+
+def parse_period(period: str | None) -> str | None:
+    """Normalise a YYYY-MM period parameter; raises ValueError when invalid."""
+    if not period:
+        return None
+    year, month = map(int, period.split("-"))
+    return date(year, month, 1).strftime("%Y-%m")
+
+
+def cashflow(rows):
+    """Monthly income and expense totals."""
+    months = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    for r in rows:
+        if r["is_transfer"] or not r["period"]:
+            continue
+        if r["sign"] > 0:
+            months[r["period"]][0] += r["total"]
+        elif r["sign"] < 0:
+            months[r["period"]][1] += r["total"]
+    return [
+        {
+            "year": int(period[:4]),
+            "month": int(period[5:]),
+            "income": float(income),
+            "expense": abs(float(expense)),
+        }
+        for period, (income, expense) in sorted(months.items())
+    ]
+
+
+def categories_summary(rows):
+    """Breakdown of expenses by category."""
+    totals = defaultdict(Decimal)
+    for r in rows:
+        if r["is_transfer"] or r["sign"] >= 0:
+            continue
+        totals[(r["category__name"], r["category__type"])] -= r["total"]
+    ordered = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return [
+        {"category": name or "Egyéb", "type": kind, "value": float(total)}
+        for (name, kind), total in ordered
+    ]
+
+
+def balance_summary(rows):
+    income = sum(
+        (r["total"] for r in rows if r["category__type"] == "income"), Decimal(0)
+    )
+    expense = sum(
+        (r["total"] for r in rows if r["category__type"] == "expense"), Decimal(0)
+    )
+    net_savings = income - expense
+    # Nettó egyenleg (kumulativ megtakaritas)
+    return {
+        "income": income,
+        "expense": expense,
+        "net_savings": net_savings,
+        "total_balance": net_savings,
+    }
+
+
+def monthly_balance(rows, months=6, today=None):
+    today = today or date.today()
+    start = (today - relativedelta(months=months - 1)).strftime("%Y-%m")
+
+    # csoportosítás hónap szerint
+    by_month = {}
+    for r in rows:
+        if not r["period"] or r["period"] < start:
+            continue
+        bucket = by_month.setdefault(r["period"], [Decimal(0), Decimal(0)])
+        if r["category__type"] == "income":
+            bucket[0] += r["total"]
+        elif r["category__type"] == "expense":
+            bucket[1] += r["total"]
+    return [
+        {
+            "month": period,
+            "income": income,
+            "expense": expense,
+            "net": income - expense,
+        }
+        for period, (income, expense) in sorted(by_month.items())
+    ]
+
+
+def category_expenses(rows, period=None):
+    """Top 5 expense categories, optionally for one YYYY-MM period."""
+    totals = defaultdict(Decimal)
+    for r in rows:
+        if r["category__type"] != "expense":
+            continue
+        if period and r["period"] != period:
+            continue
+        totals[r["category__name"]] += r["total"]
+    ordered = sorted(totals.items(), key=lambda item: item[1])
+    return [
+        {"category": name, "amount": amount} for name, amount in ordered[:5] if amount
+    ]
+
+
+def spending_patterns(rows):
+    by_weekday = defaultdict(Decimal)
+    for r in rows:
+        if r["category__type"] == "expense" and r["weekday"]:
+            by_weekday[r["weekday"]] += r["total"]
+    return {
+        "by_weekday": [
+            {"day": DAY_MAP.get(weekday, str(weekday)), "amount": amount}
+            for weekday, amount in sorted(by_weekday.items())
+        ]
+    }
+
+
+def category_coverage(rows):
+    total = sum(r["txn_count"] for r in rows)
+    categorized = sum(r["txn_count"] for r in rows if r["category_id"] is not None)
+    coverage = (categorized / total) * 100 if total > 0 else 0
+    return {
+        "total_transactions": total,
+        "categorized_transactions": categorized,
+        "coverage_percentage": round(coverage, 2),
+    }
+
+
+def avg_expense_per_category(rows):
+    sums = defaultdict(lambda: [Decimal(0), 0])
+    for r in rows:
+        if r["category__type"] == "expense":
+            bucket = sums[r["category__name"]]
+            bucket[0] += r["total"]
+            bucket[1] += r["txn_count"]
+    return [
+        {
+            "category": name or "Egyéb",
+            "average_expense": float(total / count) if count else 0.0,
+        }
+        for name, (total, count) in sorted(sums.items(), key=lambda i: i[0] or "")
+    ]
+
+
+def top_merchants(user_id: str, limit=5):
+    """
+    Top merchants by spending (needs per-row data, not in the rollup). Rows
+    are grouped on the integer merchant id; names are read for the top ones.
+    """
+    qs = (
+        Transaction.objects.filter(user_id=user_id, is_transfer=False, amount__lt=0)
+        .values("merchant_id")
+        .annotate(
+            total=Sum(
+                F("amount") * Value(-1),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            )
+        )
+        .order_by("-total")[:limit]
+    )
+    rows = list(qs)
+    names = dict(
+        Merchant.objects.filter(
+            id__in=[r["merchant_id"] for r in rows if r["merchant_id"]]
+        ).values_list("id", "name")
+    )
+    return [
+        {
+            "name": names.get(r["merchant_id"]) or "(no counterparty)",
+            "amount": float(r["total"] or 0),
+        }
+        for r in rows
+    ]
@@ -2,22 +2,114 @@ import csv
 import io
 from decimal import Decimal
 from datetime import datetime
+from itertools import chain, islice
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterable, Iterator
 from uuid import UUID
+from django.db import transaction
+from ingestion.imports.detect import DETECT_SAMPLE_BYTES, Profile, Sample, map_header
+from ingestion.imports.schema import (
+    RowSchema,
+    compile_amount_parser,
+    compile_date_parser,
+    infer_date_format,
+    infer_number_format,
+)
 from ingestion.models import Transaction
+from ingestion.transactions.merchants import MerchantResolver
+from ingestion.transactions.normalize import normalize_description
+from ingestion.transactions.utils import compute_fingerprint
 
 
-class BaseCsvAdapter:
+@dataclass
+class ImportProgress:
+    bytes_parsed: int = 0
+    rows_parsed: int = 0
+    rows_inserted: int = 0
+    rows_deduplicated: int = 0
+    rows_rejected: int = 0
+    rows_categorised: int = 0
+
+
+class BaseAdapter:
+    """Streams an import file into transaction dicts; see ingestion.imports.registry."""
+
+    # registry key (FileAdapter / FileSource values)
+    format = None
+    source = None
+    # records can be cut apart at newlines (see ingestion.imports.parallel)
+    splittable = False
+
     date_formats = ["%Y.%m.%d", "%Y-%m-%d", "%d.%m.%Y"]
+    batch_size = 1000
 
-    def __init__(self, raw_bytes: bytes, user_id: str, import_id: UUID):
-        self.raw_bytes = raw_bytes
+    def __init__(
+        self,
+        stream: BinaryIO | bytes,
+        user_id: str,
+        import_id: UUID,
+        profile: Profile | None = None,
+    ):
+        """
+        `stream` is a binary file handle positioned anywhere (it is rewound
+        before reading). Raw bytes are still accepted for convenience.
+        `profile` is the result of detection; without one the adapter probes
+        the stream itself.
+        """
+        if isinstance(stream, (bytes, bytearray)):
+            stream = io.BytesIO(stream)
+        self.stream = stream
         self.user_id = user_id
         self.import_id = import_id
+        self.profile = profile or self._probe_stream()
+        self.rows_rejected = 0
+
+    @classmethod
+    def probe(cls, sample: Sample) -> Profile | None:
+        """Score how likely `sample` is this adapter's format; None if not."""
+        raise NotImplementedError
+
+    def _probe_stream(self) -> Profile:
+        self.stream.seek(0)
+        sample = Sample(self.stream.read(DETECT_SAMPLE_BYTES))
+        return self.probe(sample) or self.default_profile(sample)
+
+    @classmethod
+    def default_profile(cls, sample: Sample) -> Profile:
+        return Profile(cls.format, cls.source, sample.encoding)
+
+    def iter_lines(self, encoding=None) -> Iterator[str]:
+        """
+        Incrementally decode the underlying byte stream line by line, so only
+        the current buffer is ever held in memory.
+        """
+        self.stream.seek(0)
+        text = io.TextIOWrapper(
+            self.stream,
+            encoding=encoding or self.profile.encoding,
+            errors="ignore",
+            newline="",
+        )
+        try:
+            yield from text
+        finally:
+            # leave the caller's file handle open (if the caller has not
+            # closed it already, abandoning the generator)
+            if not self.stream.closed:
+                text.detach()
 
-    def read_csv(self, delimiter=";", encoding="utf-8-sig"):
-        text = self.raw_bytes.decode(encoding, errors="ignore")
-        reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
-        return list(reader)
+    def iter_text_chunks(self, size=64 * 1024, encoding=None) -> Iterator[str]:
+        """Incrementally decode the byte stream in chunks of `size` characters."""
+        self.stream.seek(0)
+        text = io.TextIOWrapper(
+            self.stream, encoding=encoding or self.profile.encoding, errors="ignore"
+        )
+        try:
+            while chunk := text.read(size):
+                yield chunk
+        finally:
+            if not self.stream.closed:
+                text.detach()
 
     def try_parse_date(self, value):
         for fmt in self.date_formats:
@@ -27,9 +119,222 @@ class BaseCsvAdapter:
                 continue
         return None
 
-    def bulk_insert(self, transactions: list[dict]):
-        if not transactions:
-            return []
-        objs = [Transaction(**t) for t in transactions]
-        Transaction.objects.bulk_create(objs, ignore_conflicts=True)
-        return objs
+    def parse(self) -> Iterator[dict]:
+        raise NotImplementedError
+
+    def fingerprint(self, txn: dict) -> str:
+        return compute_fingerprint(
+            txn["user_id"],
+            txn.get("booking_date"),
+            txn["amount"],
+            txn.get("description_raw"),
+            txn.get("counterparty"),
+        )
+
+    def bulk_insert(
+        self,
+        transactions: Iterable[dict],
+        on_batch: Callable[[ImportProgress, list[Transaction]], None] | None = None,
+        categorise: Callable[[list[dict]], int] | None = None,
+        progress: ImportProgress | None = None,
+    ) -> int:
+        """
+        Insert parsed rows in fixed-size batches and return how many were new.
+
+        Rows whose fingerprint already exists for the user (or repeats within
+        the batch) are counted as deduplicated instead of inserted; rows the
+        parser rejected are reported from `rows_rejected`. New rows get their
+        merchant (transactions.merchants). `categorise`, if given, sets
+        `category_id` on the new rows of each batch before they are inserted
+        and returns how many it categorised.
+
+        Each batch commits together with `on_batch`, which is called with the
+        running totals and the batch's Transactions, so recorded progress
+        always matches the rows in the database. A resumed import passes the `progress` it had committed.
+        """
+        progress = progress or ImportProgress()
+        merchants = MerchantResolver()
+        rows = iter(transactions)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            by_fingerprint = {}
+            for t in batch:
+                t.setdefault("fingerprint", self.fingerprint(t))
+                t.setdefault(
+                    "description_norm",
+                    normalize_description(
+                        t.get("description_raw"), t.get("counterparty")
+                    ),
+                )
+                by_fingerprint.setdefault(t["fingerprint"], t)
+            existing = set(
+                Transaction.objects.filter(
+                    user_id=self.user_id, fingerprint__in=list(by_fingerprint)
+                ).values_list("fingerprint", flat=True)
+            )
+            new = [t for fp, t in by_fingerprint.items() if fp not in existing]
+            merchants(new)
+            if categorise is not None:
+                progress.rows_categorised += categorise(new)
+            progress.rows_parsed += len(batch)
+            progress.rows_inserted += len(new)
+            progress.rows_deduplicated += len(batch) - len(new)
+            progress.rows_rejected = self.rows_rejected
+            progress.bytes_parsed = self.bytes_read()
+            with transaction.atomic():
+                # the unique index still guards against a concurrent import
+                inserted = [Transaction(**t) for t in new]
+                Transaction.objects.bulk_create(inserted, ignore_conflicts=True)
+                if on_batch is not None:
+                    on_batch(progress, inserted)
+        # rows rejected after the last full batch
+        progress.rows_rejected = self.rows_rejected
+        self.progress = progress
+        return progress.rows_inserted
+
+    def bytes_read(self) -> int:
+        try:
+            return self.stream.tell()
+        except (OSError, ValueError):
+            return 0
+
+
+class BaseCsvAdapter(BaseAdapter):
+    """
+    CSV statements. parse() reads a sample of rows, infers a RowSchema from
+    it once (ingestion.imports.schema) and runs every row through the row
+    parser the adapter compiles for that schema. Rows the parser rejects
+    are counted in `rows_rejected`.
+    """
+
+    splittable = True
+    delimiter = ";"
+    # field -> candidate column names, for header_map
+    columns: dict[str, tuple[str, ...]] = {}
+    # field -> column index, for files without a header
+    positions: dict[str, int] = {}
+    date_field = "booking_date"
+    # debit/credit indicator column ("T"/"J") that carries the sign, if any
+    sign_field = None
+    # decimal separator when the sample does not settle it
+    decimal_separator = "."
+    schema_sample_rows = 200
+
+    @classmethod
+    def default_profile(cls, sample: Sample) -> Profile:
+        return Profile(cls.format, cls.source, sample.encoding, cls.delimiter)
+
+    @classmethod
+    def header_profile(cls, sample: Sample, score=1.0) -> Profile:
+        return Profile(
+            cls.format,
+            cls.source,
+            encoding=sample.encoding,
+            delimiter=cls.delimiter,
+            header_map=map_header(sample.header(cls.delimiter), cls.columns),
+            score=score,
+        )
+
+    def infer_schema(self, header: list[str] | None, sample: list[list[str]]):
+        """Settle column positions, date and number format from a sample."""
+        if header is not None:
+            position = {column: i for i, column in enumerate(header)}
+            columns = {
+                name: position[column]
+                for name, column in self.profile.header_map.items()
+                if column in position
+            }
+        else:
+            columns = dict(self.positions)
+
+        def values(name):
+            i = columns.get(name)
+            return [row[i] for row in sample if i is not None and len(row) > i]
+
+        date_format = infer_date_format(values(self.date_field), self.date_formats[0])
+        decimal_sep, thousands_sep = infer_number_format(
+            values("amount"), self.decimal_separator
+        )
+        sign = "signed"
+        if self.sign_field is not None:
+            indicators = {v.strip().upper() for v in values(self.sign_field)}
+            if indicators and indicators <= {"T", "J"}:
+                sign = "indicator"
+        return RowSchema(
+            columns=columns,
+            date_format=date_format,
+            decimal_separator=decimal_sep,
+            thousands_separator=thousands_sep,
+            sign=sign,
+            parse_date=compile_date_parser(date_format),
+            parse_amount=compile_amount_parser(decimal_sep, thousands_sep),
+        )
+
+    def compile_row_parser(self, schema: RowSchema) -> Callable[[list], dict]:
+        """
+        A function from a csv row (list) to a transaction dict, specialised
+        for `schema`; it raises for rows that cannot be parsed.
+        """
+        raise NotImplementedError
+
+    def date_parser(self, schema: RowSchema) -> Callable[[str], object]:
+        """
+        The schema's compiled date parser; values in another format than the
+        sample's fall back to trying every format in `date_formats`.
+        """
+        compiled, fallback = schema.parse_date, self.try_parse_date
+
+        def parse_date(value):
+            return compiled(value) or (fallback(value) if value else None)
+
+        return parse_date
+
+    @staticmethod
+    def getter(schema: RowSchema, name: str, default=""):
+        """Fast accessor for the column of field `name` (or a constant)."""
+        i = schema.columns.get(name)
+        if i is None:
+            return lambda row: default
+        return lambda row: row[i] if len(row) > i else default
+
+    def _read_sample(self, lines):
+        """(csv reader, header or None, sample rows); None for an empty file."""
+        reader = csv.reader(lines, delimiter=self.profile.delimiter or self.delimiter)
+        header = None
+        if self.profile.has_header:
+            header = next(reader, None)
+            if header is None:
+                return None
+        return reader, header, list(islice(reader, self.schema_sample_rows))
+
+    def read_schema(self) -> RowSchema | None:
+        """The schema parse() infers from the file's leading rows."""
+        lines = self.iter_lines()
+        try:
+            read = self._read_sample(lines)
+        finally:
+            lines.close()
+        return None if read is None else self.infer_schema(*read[1:])
+
+    def parse(self, schema: RowSchema | None = None) -> Iterator[dict]:
+        """
+        Parsed rows. `schema` skips inference: a range of a file parsed in a
+        worker (imports.parallel) uses the schema of the whole file.
+        """
+        read = self._read_sample(self.iter_lines())
+        if read is None:
+            return
+        reader, header, sample = read
+        self.schema = schema or self.infer_schema(header, sample)
+        parse_row = self.compile_row_parser(self.schema)
+
+        for row in chain(sample, reader):
+            if not row:
+                continue
+            try:
+                yield parse_row(row)
+            except (ValueError, IndexError, ArithmeticError):
+                # InvalidOperation is an ArithmeticError
+                self.rows_rejected += 1
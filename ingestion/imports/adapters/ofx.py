@@ -0,0 +1,144 @@
+import html
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from ingestion.imports.detect import Profile
+from ingestion.models import FileAdapter, FileSource
+from .base import BaseAdapter
+
+# opening tags with their text; tag names are matched case-insensitively.
+# SGML (OFX 1.x) leaves are not closed, XML (2.x) leaves are, and closing
+# tags are skipped.
+_LEAF = re.compile(r"<([A-Za-z0-9.]+)>([^<]*)")
+_CURDEF = re.compile(r"<CURDEF>\s*([A-Za-z]{3})", re.I)
+# a record starts at <STMTTRN>; SGML exports may leave it open, so the next
+# record or the end of the transaction list ends it as well as </STMTTRN>
+_BOUNDARY = re.compile(r"<(STMTTRN|/STMTTRN|/BANKTRANLIST)>", re.I)
+_CHARSET = re.compile(r"^CHARSET:\s*(\S+)", re.M)
+_XML_ENCODING = re.compile(r"<\?xml[^>]*encoding=[\"']([\w.-]+)", re.I)
+
+_CHARSETS = {"1250": "cp1250", "1252": "cp1252", "ISO-8859-1": "latin-1"}
+
+
+class OfxAdapter(BaseAdapter):
+    """
+    OFX 1.x (SGML) and 2.x (XML) statements, bank and credit card.
+
+    The file is decoded in chunks and every <STMTTRN> is picked out of the
+    chunk with a single regex pass; only the current chunk (and at most
+    max_record_chars of an unfinished record) is held, never a document
+    tree, so memory stays flat however large the export is.
+    """
+
+    format = FileAdapter.OFX
+    source = FileSource.OTHER
+    chunk_size = 64 * 1024
+    # a record is a few hundred characters; longer ones are rejected
+    max_record_chars = 64 * 1024
+
+    @classmethod
+    def probe(cls, sample):
+        head = sample.head.upper()
+        if not (head.startswith("OFXHEADER") or "<OFX>" in head):
+            return None
+        encoding = sample.encoding
+        match = _CHARSET.search(sample.head) or _XML_ENCODING.search(sample.head)
+        if match:
+            encoding = _CHARSETS.get(match.group(1).upper(), encoding)
+        return Profile(cls.format, cls.source, encoding=encoding)
+
+    def iter_records(self):
+        """
+        (currency, {TAG: value}) for every <STMTTRN> aggregate, in order;
+        the record is None if it was longer than max_record_chars. Each
+        record is cut out of the text buffer between its <STMTTRN> and the
+        next boundary tag (see _BOUNDARY).
+        """
+        currency = settings.INGEST_DEFAULT_CURRENCY
+        buffer = ""
+        start = None  # where the open record's leaves start in the buffer
+        oversized = False
+        for chunk in self.iter_text_chunks(self.chunk_size):
+            buffer += chunk
+            pos = 0
+            for m in _BOUNDARY.finditer(buffer):
+                if start is not None:
+                    record = (
+                        None if oversized else self._leaves(buffer, start, m.start())
+                    )
+                    yield currency, record
+                    start, oversized = None, False
+                else:
+                    # a statement's CURDEF precedes its transaction list
+                    c = _CURDEF.search(buffer, pos, m.start())
+                    if c:
+                        currency = c.group(1).upper()
+                if m.group(1).upper() == "STMTTRN":
+                    start = m.end()
+                pos = m.end()
+            if start is not None:
+                if len(buffer) - start > self.max_record_chars:
+                    # skip the rest of the record, keep what may be a cut-off tag
+                    oversized = True
+                    start = max(start, len(buffer) - 64)
+                buffer, start = buffer[start:], 0
+                continue
+            # no record is open; keep only what may be a cut-off tag
+            c = _CURDEF.search(buffer, pos)
+            if c:
+                currency = c.group(1).upper()
+            buffer = buffer[max(pos, len(buffer) - 64) :]
+        if start is not None:
+            # the file ends inside a record
+            yield currency, (
+                None if oversized else self._leaves(buffer, start, len(buffer))
+            )
+
+    @staticmethod
+    def _leaves(buffer, start, end) -> dict:
+        record = {}
+        for tag, text in _LEAF.findall(buffer, start, end):
+            value = text.strip()
+            if value:
+                record.setdefault(tag.upper(), value)
+        return record
+
+    def parse(self):
+        for currency, record in self.iter_records():
+            txn = None if record is None else self._to_transaction(record, currency)
+            if txn is not None:
+                yield txn
+            else:
+                self.rows_rejected += 1
+
+    def _to_transaction(self, record: dict, currency: str):
+        try:
+            amount = Decimal(record["TRNAMT"].replace(",", "."))
+        except (KeyError, InvalidOperation):
+            return None
+        name = html.unescape(record.get("NAME", ""))
+        memo = html.unescape(record.get("MEMO", ""))
+        return {
+            "user_id": self.user_id,
+            "import_file_id": self.import_id,
+            "booking_date": self._parse_ofx_date(record.get("DTPOSTED")),
+            "value_date": self._parse_ofx_date(record.get("DTUSER")),
+            "amount": amount,
+            "currency": record.get("CURSYM", currency).upper(),
+            "description_raw": memo or name,
+            "counterparty": name,
+            "reference": record.get("REFNUM")
+            or record.get("CHECKNUM")
+            or record.get("FITID"),
+        }
+
+    @staticmethod
+    def _parse_ofx_date(raw):
+        # YYYYMMDD[HHMMSS[.XXX]][[offset:TZ]]; the date part is enough
+        if not raw or len(raw) < 8:
+            return None
+        try:
+            return datetime.strptime(raw[:8], "%Y%m%d").date()
+        except ValueError:
+            return None
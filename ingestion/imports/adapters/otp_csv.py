@@ -1,97 +1,129 @@
-from decimal import Decimal
-import csv
-import io
-from datetime import datetime
+import re
+from ingestion.imports.detect import Profile
+from ingestion.models import FileAdapter, FileSource
 from .base import BaseCsvAdapter
 
+_ACCOUNT = re.compile(r"\d{10,20}")
+_AMOUNT = re.compile(r"-?\d+(?:[.,]\d+)?")
+_CURRENCY = re.compile(r"[a-z]{3}")
+_DATE = re.compile(r"\d{8}")
+
 
 class OtpCsvAdapter(BaseCsvAdapter):
-    def parse(self):
-        text = self.raw_bytes.decode("utf-8-sig", errors="ignore")
+    format = FileAdapter.CSV
+    source = FileSource.OTP
+    delimiter = ";"
+    columns = {
+        "booking_date": ("Könyvelés dátuma", "Könyvelés"),
+        "amount": ("Összeg",),
+        "currency": ("Devizanem",),
+        "description": ("Közlemény",),
+        "note": ("Megjegyzés",),
+        "counterparty": ("Ellenoldal neve",),
+    }
+    # V2 export layout
+    positions = {
+        "type": 1,
+        "amount": 2,
+        "currency": 3,
+        "booking_date": 4,
+        "value_date": 5,
+        "counterparty": 8,
+        "description": 9,
+    }
+    sign_field = "type"
+    decimal_separator = ","
+
+    @classmethod
+    def probe(cls, sample):
+        # V1: header row
+        header = sample.header(";")
+        header_line = " ".join(h.lower().strip() for h in header)
+        if any("könyvelés" in h.lower() for h in header) or "közlemény" in header_line:
+            return cls.header_profile(sample)
+
+        # V2: headerless, recognised by the shape of the first row
+        first_row = header
+        if len(first_row) >= 6:
+            acc, typ, amt, curr, d1, d2 = (v.strip() for v in first_row[:6])
+            if (
+                _ACCOUNT.fullmatch(acc.strip('"'))
+                and typ.lower() in {"t", "j"}
+                and _AMOUNT.fullmatch(amt)
+                and _CURRENCY.fullmatch(curr.lower())
+                and _DATE.fullmatch(d1)
+                and _DATE.fullmatch(d2)
+            ):
+                return Profile(
+                    cls.format,
+                    cls.source,
+                    encoding=sample.encoding,
+                    delimiter=";",
+                    has_header=False,
+                    score=0.9,
+                )
 
-        # Try header-based first
-        reader = csv.DictReader(io.StringIO(text), delimiter=";")
-        rows = list(reader)
-        if rows and any(k for k in rows[0].keys() if "könyvelés" in k.lower()):
-            return self._parse_with_headers(rows)
+        # soft fallback
+        head = sample.head.lower()
+        if "könyvelés dátuma" in head or "értéknap" in head:
+            return cls.header_profile(sample, score=0.3)
+        return None
 
-        # Fallback: headerless OTP (v2)
-        reader = csv.reader(io.StringIO(text), delimiter=";", quotechar='"')
-        return self._parse_headerless(reader)
+    def compile_row_parser(self, schema):
+        if self.profile.has_header:
+            return self._compile_with_headers(schema)
+        return self._compile_headerless(schema)
 
     # --- V1 (fejléces OTP) ---
-    def _parse_with_headers(self, rows):
-        txns = []
-        for row in rows:
-            try:
-                booking_date = self.try_parse_date(
-                    row.get("Könyvelés dátuma") or row.get("Könyvelés")
-                )
-                amount = Decimal(row.get("Összeg", "0").replace(",", "."))
-                currency = row.get("Devizanem", "HUF").strip().upper()
-                description = row.get("Közlemény", "").strip() or row.get(
-                    "Megjegyzés", ""
-                )
-                counterparty = row.get("Ellenoldal neve", "")
+    def _compile_with_headers(self, schema):
+        booking_date = self.getter(schema, "booking_date")
+        amount = self.getter(schema, "amount", "0")
+        currency = self.getter(schema, "currency", "HUF")
+        description = self.getter(schema, "description")
+        note = self.getter(schema, "note")
+        counterparty = self.getter(schema, "counterparty")
+        parse_date, parse_amount = self.date_parser(schema), schema.parse_amount
+        user_id, import_id = self.user_id, self.import_id
 
-                txns.append(
-                    {
-                        "user_id": self.user_id,
-                        "import_file_id": self.import_id,
-                        "booking_date": booking_date,
-                        "amount": amount,
-                        "currency": currency,
-                        "description_raw": description,
-                        "counterparty": counterparty,
-                    }
-                )
-            except Exception:
-                continue
-        return txns
+        def parse_row(row):
+            return {
+                "user_id": user_id,
+                "import_file_id": import_id,
+                "booking_date": parse_date(booking_date(row)),
+                "amount": parse_amount(amount(row)),
+                "currency": currency(row).strip().upper(),
+                "description_raw": description(row).strip() or note(row),
+                "counterparty": counterparty(row),
+            }
+
+        return parse_row
 
     # --- V2 (headerless OTP) ---
-    def _parse_headerless(self, reader):
-        txns = []
-        for row in reader:
-            if not row or len(row) < 10:
-                continue
-            try:
-                txn_type = (row[1] or "").strip().upper()  # <- handles 't'/'j'
-                amount = Decimal((row[2] or "0").replace(",", "."))
+    def _compile_headerless(self, schema):
+        parse_date, parse_amount = self.date_parser(schema), schema.parse_amount
+        signed = schema.sign == "indicator"
+        user_id, import_id = self.user_id, self.import_id
+
+        def parse_row(row):
+            if len(row) < 10:
+                raise IndexError("short OTP row")
+            amount = parse_amount(row[2] or "0")
+            if signed:
+                txn_type = row[1].strip().upper()  # <- handles 't'/'j'
                 if txn_type == "T":
                     amount = -abs(amount)
                 elif txn_type == "J":
                     amount = abs(amount)
+            return {
+                "user_id": user_id,
+                "import_file_id": import_id,
+                "booking_date": parse_date(row[4]),
+                "value_date": parse_date(row[5]),
+                "amount": amount,
+                "currency": (row[3] or "HUF").strip().upper(),
+                "description_raw": row[9].strip(),
+                "counterparty": row[8].strip(),
+                "reference": row[-2].strip() if len(row) > 13 else None,
+            }
 
-                currency = (row[3] or "HUF").strip().upper()
-
-                booking_date = self._parse_date_otp_v2(row[4])
-                value_date = self._parse_date_otp_v2(row[5])
-                counterparty = row[8].strip() if len(row) > 8 else None
-                description = row[9].strip() if len(row) > 9 else None
-                reference = row[-2].strip() if len(row) > 13 else None
-
-                txns.append(
-                    {
-                        "user_id": self.user_id,
-                        "import_file_id": self.import_id,
-                        "booking_date": booking_date,
-                        "value_date": value_date,
-                        "amount": amount,
-                        "currency": currency,
-                        "description_raw": description,
-                        "counterparty": counterparty,
-                        "reference": reference,
-                    }
-                )
-            except Exception:
-                continue
-        return txns
-
-    def _parse_date_otp_v2(self, raw):
-        if not raw:
-            return None
-        try:
-            return datetime.strptime(raw.strip(), "%Y%m%d").date()
-        except ValueError:
-            return None
+        return parse_row
@@ -0,0 +1,106 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from ingestion.imports.detect import Profile
+from ingestion.models import FileAdapter, FileSource
+from .base import BaseAdapter
+
+# non-transaction sections of a QIF export; !Account blocks (the account
+# list, or the account the next section belongs to) are skipped as well
+_SKIPPED_TYPES = {"!TYPE:CAT", "!TYPE:CLASS", "!TYPE:MEMORIZED", "!TYPE:SECURITY"}
+
+
+class QifAdapter(BaseAdapter):
+    """
+    Quicken Interchange Format: one field per line (D date, T/U amount,
+    P payee, M memo, N number), records end with "^". Read line by line.
+    QIF does not state a currency: rows get INGEST_DEFAULT_CURRENCY.
+    """
+
+    format = FileAdapter.QIF
+    source = FileSource.OTHER
+    date_formats = [
+        "%m/%d/%y",
+        "%m/%d/%Y",
+        "%d.%m.%Y",
+        "%Y-%m-%d",
+        "%Y.%m.%d",
+        "%d/%m/%Y",
+    ]
+
+    @classmethod
+    def probe(cls, sample):
+        head = sample.head.upper()
+        if head.startswith(("!TYPE:", "!OPTION:", "!ACCOUNT")):
+            return Profile(cls.format, cls.source, encoding=sample.encoding)
+        return None
+
+    def parse(self):
+        record = {}
+        skipping = False
+        for line in self.iter_lines():
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            if line.startswith("!"):
+                header = line.upper().replace(" ", "")
+                if header.startswith("!TYPE:"):
+                    skipping = header in _SKIPPED_TYPES
+                elif header.startswith("!ACCOUNT"):
+                    skipping = True
+                record = {}
+                continue
+            code, value = line[0], line[1:].strip()
+            if code == "^":
+                if not skipping:
+                    txn = self._to_transaction(record)
+                    if txn is not None:
+                        yield txn
+                    else:
+                        self.rows_rejected += 1
+                record = {}
+            elif code in "DTUPMNL" and not skipping:
+                # "T" wins over "U" (same amount, U may be unrounded)
+                record.setdefault(code, value)
+
+    def _to_transaction(self, record: dict):
+        amount = self._parse_amount(record.get("T") or record.get("U"))
+        if amount is None:
+            return None
+        payee = record.get("P", "")
+        return {
+            "user_id": self.user_id,
+            "import_file_id": self.import_id,
+            "booking_date": self._parse_qif_date(record.get("D")),
+            "amount": amount,
+            "currency": settings.INGEST_DEFAULT_CURRENCY,
+            "description_raw": record.get("M") or payee,
+            "counterparty": payee,
+            "reference": record.get("N"),
+        }
+
+    @staticmethod
+    def _parse_amount(raw):
+        if not raw:
+            return None
+        raw = raw.replace(" ", "")
+        if "," in raw and "." in raw:
+            raw = raw.replace(",", "")  # thousands separator
+        else:
+            raw = raw.replace(",", ".")
+        try:
+            return Decimal(raw)
+        except InvalidOperation:
+            return None
+
+    def _parse_qif_date(self, raw):
+        if not raw:
+            return None
+        # Quicken writes 1/ 5'24 for 2024-01-05
+        raw = raw.replace(" ", "").replace("'", "/")
+        for fmt in self.date_formats:
+            try:
+                return datetime.strptime(raw, fmt).date()
+            except ValueError:
+                continue
+        return None
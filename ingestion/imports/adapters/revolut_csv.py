@@ -1,33 +1,52 @@
-from decimal import Decimal
+from ingestion.models import FileAdapter, FileSource
 from .base import BaseCsvAdapter
 
 
 class RevolutCsvAdapter(BaseCsvAdapter):
-    def parse(self):
-        rows = self.read_csv(delimiter=",")
-        txns = []
+    format = FileAdapter.CSV
+    source = FileSource.REVOLUT
+    delimiter = ","
+    columns = {
+        "booking_date": ("Completed Date", "Date"),
+        "amount": ("Amount",),
+        "currency": ("Currency",),
+        "description": ("Description",),
+        "merchant": ("Merchant",),
+        "reference": ("Reference",),
+    }
 
-        for row in rows:
-            try:
-                booking_date = self.try_parse_date(
-                    row.get("Completed Date") or row.get("Date")
-                )
-                amount = Decimal(row.get("Amount", "0"))
-                currency = row.get("Currency", "EUR").strip().upper()
-                description = row.get("Description", "").strip()
-                counterparty = row.get("Merchant", "") or row.get("Reference", "")
+    @classmethod
+    def probe(cls, sample):
+        header_line = " ".join(h.lower().strip() for h in sample.header(","))
+        if all(
+            k in header_line
+            for k in ["completed date", "description", "amount", "currency"]
+        ):
+            return cls.header_profile(sample)
+        # soft fallback
+        if "completed date" in sample.head.lower():
+            return cls.header_profile(sample, score=0.3)
+        return None
 
-                txns.append(
-                    {
-                        "user_id": self.user_id,
-                        "import_file_id": self.import_id,
-                        "booking_date": booking_date,
-                        "amount": amount,
-                        "currency": currency,
-                        "description_raw": description,
-                        "counterparty": counterparty,
-                    }
-                )
-            except Exception:
-                continue
-        return txns
+    def compile_row_parser(self, schema):
+        booking_date = self.getter(schema, "booking_date")
+        amount = self.getter(schema, "amount", "0")
+        currency = self.getter(schema, "currency", "EUR")
+        description = self.getter(schema, "description")
+        merchant = self.getter(schema, "merchant")
+        reference = self.getter(schema, "reference")
+        parse_date, parse_amount = self.date_parser(schema), schema.parse_amount
+        user_id, import_id = self.user_id, self.import_id
+
+        def parse_row(row):
+            return {
+                "user_id": user_id,
+                "import_file_id": import_id,
+                "booking_date": parse_date(booking_date(row)),
+                "amount": parse_amount(amount(row)),
+                "currency": currency(row).strip().upper(),
+                "description_raw": description(row).strip(),
+                "counterparty": merchant(row) or reference(row),
+            }
+
+        return parse_row
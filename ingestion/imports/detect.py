@@ -1,81 +1,104 @@
+import codecs
 import csv
 import io
-import re
+from dataclasses import dataclass, field
+from functools import cached_property
+
+
+# Detection only needs the first lines; never decode the whole statement.
+DETECT_SAMPLE_BYTES = 64 * 1024
+
+# rows of the sample the probes get to look at
+SAMPLE_ROWS = 20
 
 
 class UnknownProfileError(Exception):
     pass
 
 
-def detect_profile(raw_bytes: bytes) -> str:
+@dataclass
+class Profile:
+    """
+    What detection found out about a file, handed to the adapter so it does
+    not have to work it out again.
+
+    `header_map` maps the adapter's field names to the file's column names
+    (empty for headerless files).
+    """
+
+    adapter: str  # FileAdapter
+    source: str  # FileSource
+    encoding: str = "utf-8-sig"
+    delimiter: str | None = None
+    has_header: bool = True
+    header_map: dict[str, str] = field(default_factory=dict)
+    score: float = 1.0
+
+
+def sniff_encoding(raw: bytes) -> str:
+    """
+    utf-8 if the sample decodes as such (a character cut off at the end of
+    the sample is fine), otherwise one of the Central European code pages
+    Hungarian bank exports use: cp1250 if bytes 0x80-0x9F occur (control
+    characters in latin2, letters and punctuation in cp1250), else latin2.
+    """
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(raw, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        pass
+    if any(0x80 <= b <= 0x9F for b in raw):
+        return "cp1250"
+    return "iso8859_2"
+
+
+class Sample:
+    """The leading bytes of a file, decoded once and shared by all probes."""
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.encoding = sniff_encoding(raw)
+        self.text = codecs.getincrementaldecoder(self.encoding)(errors="ignore").decode(
+            raw, final=False
+        )
+        self._rows = {}
+
+    @cached_property
+    def head(self) -> str:
+        """First 2 KB, stripped, for signature checks."""
+        return self.text[:2048].lstrip()
+
+    def rows(self, delimiter: str) -> list[list[str]]:
+        """The first SAMPLE_ROWS rows split on `delimiter` (cached)."""
+        if delimiter not in self._rows:
+            reader = csv.reader(io.StringIO(self.text), delimiter=delimiter)
+            rows = []
+            try:
+                for row in reader:
+                    rows.append(row)
+                    if len(rows) >= SAMPLE_ROWS:
+                        break
+            except csv.Error:
+                pass  # the sample may end inside a quoted field
+            self._rows[delimiter] = rows
+        return self._rows[delimiter]
+
+    def header(self, delimiter: str) -> list[str]:
+        rows = self.rows(delimiter)
+        return rows[0] if rows else []
+
+
+def map_header(header: list[str], columns: dict[str, tuple[str, ...]]) -> dict:
     """
-    Extended: supports OTP 'headerless' CSV (v2) even if fields are lowercase.
+    Match an adapter's `columns` (field -> candidate column names, in order
+    of preference) case-insensitively against a file's header.
     """
-    print("Detecting profile...")
-
-    text = raw_bytes.decode("utf-8-sig", errors="ignore")
-    first_2kb = text[:2048]
-
-    # OFX/QIF formátum kizárása
-    if first_2kb.lstrip().startswith("<OFX>") or first_2kb.lstrip().upper().startswith(
-        "!TYPE:"
-    ):
-        raise UnknownProfileError("Nem CSV formátumú fájl.")
-
-    # 1) Try header-based CSV (OTP v1 / Revolut)
-    sample = io.StringIO(text)
-    for delimiter in (";", ","):
-        sample.seek(0)
-        reader = csv.reader(sample, delimiter=delimiter)
-        try:
-            headers = next(reader)
-        except StopIteration:
-            continue
-        header_line = " ".join(h.lower().strip() for h in headers)
-
-        # Revolut
-        if all(
-            k in header_line
-            for k in ["completed date", "description", "amount", "currency"]
-        ):
-            return "Revolut"
-
-        # OTP (v1 with headers)
-        if any("könyvelés" in h for h in headers) or "közlemény" in header_line:
-            return "OTP"
-
-    # 2) Fallback: OTP v2 headerless — inspect the first parsed row
-    sample2 = io.StringIO(text)
-    reader2 = csv.reader(sample2, delimiter=";", quotechar='"')
-    first_row = next(reader2, None)
-
-    if first_row and len(first_row) >= 6:
-        acc = (first_row[0] or "").strip().strip('"')
-        typ = (first_row[1] or "").strip().lower()
-        amt = (first_row[2] or "").strip()
-        curr = (first_row[3] or "").strip().lower()
-        d1 = (first_row[4] or "").strip()
-        d2 = (first_row[5] or "").strip()
-
-        import re
-
-        if (
-            re.fullmatch(r"\d{10,20}", acc)
-            and typ in {"t", "j"}
-            and re.fullmatch(r"-?\d+(?:[.,]\d+)?", amt)
-            and re.fullmatch(r"[a-z]{3}", curr)
-            and re.fullmatch(r"\d{8}", d1)
-            and re.fullmatch(r"\d{8}", d2)
-        ):
-            return "OTP"
-
-    # 3) Soft fallbacks
-    if "completed date" in first_2kb.lower():
-        return "Revolut"
-    if "könyvelés dátuma" in first_2kb.lower() or "értéknap" in first_2kb.lower():
-        return "OTP"
-
-    print("Nem sikerült profil detektálás.")
-    raise UnknownProfileError(
-        "Ismeretlen vagy nem támogatott profil (csak OTP és Revolut CSV támogatott)."
-    )
+    by_name = {h.strip().lower(): h for h in header}
+    header_map = {}
+    for name, candidates in columns.items():
+        for candidate in candidates:
+            column = by_name.get(candidate.lower())
+            if column is not None:
+                header_map[name] = column
+                break
+    return header_map
@@ -0,0 +1,58 @@
+"""
+Import adapter registry.
+
+Every adapter class declares the `format`/`source` it handles and a
+`probe(sample)` classmethod that looks at the leading bytes of a file and
+returns a scored Profile, or None if the file is not its kind. Detection
+decodes the sample once, asks every registered adapter and keeps the best
+score; the winning Profile (encoding, delimiter, header map) is handed to
+the adapter so parsing starts without re-detecting anything.
+"""
+
+from .adapters.ofx import OfxAdapter
+from .adapters.otp_csv import OtpCsvAdapter
+from .adapters.qif import QifAdapter
+from .adapters.revolut_csv import RevolutCsvAdapter
+from .detect import Profile, Sample, UnknownProfileError
+
+ADAPTERS = []
+
+
+def register(adapter_class):
+    """Add an adapter class to the registry (usable as a class decorator)."""
+    ADAPTERS.append(adapter_class)
+    return adapter_class
+
+
+register(OtpCsvAdapter)
+register(RevolutCsvAdapter)
+register(OfxAdapter)
+register(QifAdapter)
+
+
+def get_adapter(adapter_hint: str, source_hint: str):
+    for adapter_class in ADAPTERS:
+        if adapter_class.format == adapter_hint and adapter_class.source == source_hint:
+            return adapter_class
+    raise ValueError(
+        f"Unsupported adapter/source combination: {adapter_hint}, {source_hint}"
+    )
+
+
+def detect_profile(raw_bytes: bytes) -> Profile:
+    """
+    Pick the adapter for a file. `raw_bytes` is expected to be the leading
+    DETECT_SAMPLE_BYTES of the file.
+    """
+    sample = Sample(raw_bytes)
+    best = None
+    for adapter_class in ADAPTERS:
+        profile = adapter_class.probe(sample)
+        if profile is not None and (best is None or profile.score > best.score):
+            best = profile
+    if best is None:
+        raise UnknownProfileError(
+            "Ismeretlen vagy nem támogatott profil "
+            f"(támogatott: {', '.join(a.__name__ for a in ADAPTERS)})."
+        )
+    return best
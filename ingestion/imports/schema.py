@@ -0,0 +1,115 @@
+"""
+Per-file schema inference for the CSV adapters.
+
+A statement uses one date format and one number format throughout, so they
+are settled once from a sample of rows and turned into specialised
+converters (a precompiled regex for dates, a fixed replace chain for
+amounts) instead of trying every format on every row.
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import Callable
+
+# strptime-style name -> (regex, order of the year/month/day groups)
+DATE_PATTERNS = {
+    "%Y.%m.%d": (r"(\d{4})\.\s?(\d{1,2})\.\s?(\d{1,2})\.?", "ymd"),
+    "%Y-%m-%d": (r"(\d{4})-(\d{1,2})-(\d{1,2})", "ymd"),
+    "%d.%m.%Y": (r"(\d{1,2})\.(\d{1,2})\.(\d{4})", "dmy"),
+    "%Y%m%d": (r"(\d{4})(\d{2})(\d{2})", "ymd"),
+    "%d/%m/%Y": (r"(\d{1,2})/(\d{1,2})/(\d{4})", "dmy"),
+}
+# dates may carry a time of day, which is not needed
+_TIME_SUFFIX = r"(?:[ T].*)?"
+
+_NUMBER = re.compile(r"[-+]?[\d\s.,']*\d")
+
+
+@dataclass
+class RowSchema:
+    columns: dict[str, int]  # field -> column index
+    date_format: str
+    decimal_separator: str
+    thousands_separator: str | None
+    # "signed" amounts, or "indicator": the sign comes from a debit/credit column
+    sign: str = "signed"
+    parse_date: Callable[[str], date | None] = field(repr=False, default=None)
+    parse_amount: Callable[[str], Decimal] = field(repr=False, default=None)
+
+    def __getstate__(self):
+        # the compiled converters are closures; workers compile their own
+        return {**self.__dict__, "parse_date": None, "parse_amount": None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.parse_date = compile_date_parser(self.date_format)
+        self.parse_amount = compile_amount_parser(
+            self.decimal_separator, self.thousands_separator
+        )
+
+
+def infer_date_format(values: list[str], default="%Y-%m-%d") -> str:
+    """The first format every non-empty sample value matches."""
+    values = [v.strip() for v in values if v and v.strip()]
+    for name, (pattern, _) in DATE_PATTERNS.items():
+        rx = re.compile(pattern + _TIME_SUFFIX)
+        if values and all(rx.fullmatch(v) for v in values):
+            return name
+    return default
+
+
+def compile_date_parser(date_format: str) -> Callable[[str], date | None]:
+    pattern, order = DATE_PATTERNS[date_format]
+    match = re.compile(pattern + _TIME_SUFFIX).match
+    y, m, d = (order.index(c) + 1 for c in "ymd")
+
+    def parse_date(value: str):
+        found = match(value.strip()) if value else None
+        if found is None:
+            return None
+        try:
+            return date(int(found[y]), int(found[m]), int(found[d]))
+        except ValueError:
+            return None
+
+    return parse_date
+
+
+def infer_number_format(values: list[str], default=".") -> tuple[str, str | None]:
+    """
+    (decimal separator, thousands separator) of the sample amounts. When
+    both "." and "," occur the later one is the decimal separator; a lone
+    "," is a decimal comma (Hungarian exports), a lone "." a decimal point.
+    Without any separator in the sample the adapter's `default` is kept.
+    """
+    decimal_sep, thousands_sep = None, None
+    for value in values:
+        value = (value or "").strip()
+        if not _NUMBER.fullmatch(value):
+            continue
+        dot, comma = value.rfind("."), value.rfind(",")
+        if dot >= 0 and comma >= 0:
+            return ("." if dot > comma else ","), ("," if dot > comma else ".")
+        if comma >= 0 or dot >= 0:
+            decimal_sep = decimal_sep or ("," if comma >= 0 else ".")
+        if " " in value or "'" in value:
+            thousands_sep = " " if " " in value else "'"
+    return decimal_sep or default, thousands_sep
+
+
+def compile_amount_parser(
+    decimal_sep: str, thousands_sep: str | None
+) -> Callable[[str], Decimal]:
+    """A converter that raises (InvalidOperation) for non-numeric input."""
+    if thousands_sep is None and decimal_sep == ".":
+        return lambda value: Decimal(value.strip())
+    if thousands_sep is None:
+        return lambda value: Decimal(value.strip().replace(",", "."))
+
+    def parse_amount(value: str):
+        value = value.strip().replace(thousands_sep, "").replace("\xa0", "")
+        return Decimal(value.replace(decimal_sep, ".") if decimal_sep != "." else value)
+
+    return parse_amount
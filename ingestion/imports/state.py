@@ -0,0 +1,98 @@
+"""
+FileImport state machine.
+
+Every transition is one conditional UPDATE (compare-and-set on the status
+and, while processing, on the claim), so the import row is only locked for
+that statement and repeating a step that already happened is a no-op:
+
+    uploaded -> queued -> processing -> parsed
+                              |  \\
+                              |   -> failed
+                              +-> processing (reclaimed: no heartbeat for
+                                  IMPORT_STALE_AFTER seconds, the worker died)
+
+A claim is identified by `attempts`: a worker that was reclaimed from finds
+its heartbeats and final transition rejected and stops (ImportNotClaimed).
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ingestion.models import FileImport, FileStatus
+
+TRANSITIONS = {
+    FileStatus.QUEUED: (FileStatus.UPLOADED,),
+    FileStatus.PROCESSING: (FileStatus.UPLOADED, FileStatus.QUEUED),
+    FileStatus.PARSED: (FileStatus.PROCESSING,),
+    FileStatus.FAILED: (FileStatus.UPLOADED, FileStatus.QUEUED, FileStatus.PROCESSING),
+}
+
+
+class ImportNotClaimed(Exception):
+    """The import is no longer processed under this claim."""
+
+
+def transition(import_id, to: FileStatus, **fields) -> bool:
+    """Move an import to `to` if its current status allows it."""
+    return bool(
+        FileImport.objects.filter(id=import_id, status__in=TRANSITIONS[to]).update(
+            status=to, **fields
+        )
+    )
+
+
+def claim(import_id) -> FileImport | None:
+    """
+    Start (or resume) processing: the import is claimed if it is waiting, or
+    processing under a claim whose worker stopped sending heartbeats. Returns
+    the claimed row, None if the import is not claimable.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.IMPORT_STALE_AFTER)
+    claimed = (
+        FileImport.objects.filter(id=import_id)
+        .filter(
+            Q(status__in=TRANSITIONS[FileStatus.PROCESSING])
+            | Q(status=FileStatus.PROCESSING)
+            & (Q(heartbeat_at__lt=stale) | Q(heartbeat_at__isnull=True))
+        )
+        .update(
+            status=FileStatus.PROCESSING,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+            error_message=None,
+        )
+    )
+    return FileImport.objects.get(id=import_id) if claimed else None
+
+
+def processing(import_id) -> bool:
+    """
+    Whether the import is processing. After a refused claim: under a claim
+    that is still alive, whose worker may yet have died.
+    """
+    return FileImport.objects.filter(
+        id=import_id, status=FileStatus.PROCESSING
+    ).exists()
+
+
+def claimed(fi: FileImport):
+    """Queryset of `fi` as long as it is processed under the caller's claim."""
+    return FileImport.objects.filter(
+        id=fi.id, status=FileStatus.PROCESSING, attempts=fi.attempts
+    )
+
+
+def heartbeat(fi: FileImport, **fields):
+    """Record progress (any FileImport fields) and keep the claim alive."""
+    if not claimed(fi).update(heartbeat_at=timezone.now(), **fields):
+        raise ImportNotClaimed(fi.id)
+
+
+def finish(fi: FileImport, to: FileStatus, **fields):
+    """Final transition (PARSED or FAILED) of a claimed import."""
+    if not claimed(fi).update(status=to, **fields):
+        raise ImportNotClaimed(fi.id)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from ingestion.models import Transaction
+from ingestion.transactions.normalize import normalize_description
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill Transaction.description_norm for rows imported before it was "
+        "populated at ingest (or recompute it for all rows with --all)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only this user id")
+        parser.add_argument(
+            "--all", action="store_true", help="Recompute rows that already have it"
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, user=None, all=False, batch_size=2000, **options):
+        qs = Transaction.objects.order_by("id").only(
+            "id", "description_raw", "counterparty", "description_norm"
+        )
+        if user:
+            qs = qs.filter(user_id=user)
+        if not all:
+            qs = qs.filter(description_norm="")
+
+        # keyset batches: rows updated in a batch may drop out of the filter
+        updated, last_id = 0, None
+        while True:
+            page = qs if last_id is None else qs.filter(id__gt=last_id)
+            batch = list(page[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            changed = []
+            for txn in batch:
+                norm = normalize_description(txn.description_raw, txn.counterparty)
+                if norm != txn.description_norm:
+                    txn.description_norm = norm
+                    changed.append(txn)
+            Transaction.objects.bulk_update(changed, ["description_norm"])
+            updated += len(changed)
+        self.stdout.write(f"Updated description_norm of {updated} transactions")
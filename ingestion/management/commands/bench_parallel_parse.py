@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from ingestion.imports.adapters.otp_csv import OtpCsvAdapter
+from ingestion.imports.adapters.revolut_csv import RevolutCsvAdapter
+from ingestion.imports.parallel import parse_parallel
+from ingestion.management.commands.bench_parsers import otp_rows, revolut_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark sequential versus process-pool parsing of a large generated "
+        "statement and report the speed-up by worker count. Parsing only, "
+        "nothing is written to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=500_000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            nargs="+",
+            help="worker counts to try (default: 1, 2, 4, ... up to the core count)",
+        )
+
+    def handle(self, *args, rows, workers, **options):
+        cores = os.cpu_count() or 1
+        if not workers:
+            workers = [1]
+            while workers[-1] * 2 <= cores:
+                workers.append(workers[-1] * 2)
+            if workers[-1] != cores:
+                workers.append(cores)
+        self.stdout.write(f"rows: {rows}, cores: {cores}")
+
+        for name, adapter_class, generate in [
+            ("revolut csv", RevolutCsvAdapter, revolut_rows),
+            ("otp csv", OtpCsvAdapter, otp_rows),
+        ]:
+            with tempfile.NamedTemporaryFile() as f:
+                for chunk in generate(rows):
+                    f.write(chunk.encode("utf-8"))
+                f.flush()
+                self.stdout.write(f"{name} ({f.tell() / 2**20:.1f} MB)")
+
+                start = time.perf_counter()
+                expected = sum(
+                    1 for _ in adapter_class(f, "bench", uuid.uuid4()).parse()
+                )
+                sequential = time.perf_counter() - start
+                self.stdout.write(
+                    f"  sequential   {expected / sequential:>10,.0f} rows/s"
+                )
+
+                for n in workers:
+                    adapter = adapter_class(f, "bench", uuid.uuid4())
+                    start = time.perf_counter()
+                    parsed = sum(1 for _ in parse_parallel(adapter, f.name, n))
+                    elapsed = time.perf_counter() - start
+                    assert parsed == expected, (parsed, expected)
+                    self.stdout.write(
+                        f"  {n:>2} workers   {parsed / elapsed:>10,.0f} rows/s  "
+                        f"speed-up {sequential / elapsed:.2f}x"
+                    )
@@ -0,0 +1,135 @@
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import deque
+
+from django.core.management.base import BaseCommand
+
+from ingestion.imports.detect import DETECT_SAMPLE_BYTES
+from ingestion.imports.registry import detect_profile, get_adapter
+
+OFX_SGML_HEADER = (
+    "OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\nSECURITY:NONE\nENCODING:USASCII\n"
+    "CHARSET:1252\nCOMPRESSION:NONE\nOLDFILEUID:NONE\nNEWFILEUID:NONE\n\n"
+    "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>EUR<BANKTRANLIST>\n"
+)
+OFX_XML_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n<?OFX OFXHEADER="200" VERSION="220"?>\n'
+    "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>EUR</CURDEF><BANKTRANLIST>\n"
+)
+OFX_FOOTER = "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n"
+
+
+def revolut_rows(n):
+    yield (
+        "Type,Product,Started Date,Completed Date,Description,Amount,Fee,"
+        "Currency,State,Balance\n"
+    )
+    for i in range(n):
+        yield (
+            f"CARD_PAYMENT,Current,2024-01-01 10:00:00,2024-01-{i % 28 + 1:02d},"
+            f"Lidl {i},-{i % 500 + 1}.50,0.00,EUR,COMPLETED,100.00\n"
+        )
+
+
+def otp_rows(n):
+    for i in range(n):
+        yield (
+            f'"11773016123456780000";"T";"-{i % 900 + 1},00";"HUF";'
+            f'"202401{i % 28 + 1:02d}";"202401{i % 28 + 1:02d}";"";"";'
+            f'"SPAR {i}";"Vásárlás {i}";"";"";"REF{i}";""\n'
+        )
+
+
+def ofx_sgml_records(n):
+    yield OFX_SGML_HEADER
+    for i in range(n):
+        yield (
+            f"<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>202401{i % 28 + 1:02d}120000"
+            f"<TRNAMT>-{i % 500 + 1}.50<FITID>{i}<NAME>Lidl {i}"
+            f"<MEMO>Card payment {i}</STMTTRN>\n"
+        )
+    yield OFX_FOOTER
+
+
+def ofx_xml_records(n):
+    yield OFX_XML_HEADER
+    for i in range(n):
+        yield (
+            f"<STMTTRN><TRNTYPE>DEBIT</TRNTYPE>"
+            f"<DTPOSTED>202401{i % 28 + 1:02d}120000</DTPOSTED>"
+            f"<TRNAMT>-{i % 500 + 1}.50</TRNAMT><FITID>{i}</FITID>"
+            f"<NAME>Lidl {i}</NAME><MEMO>Card payment {i}</MEMO></STMTTRN>\n"
+        )
+    yield OFX_FOOTER
+
+
+def qif_records(n):
+    yield "!Type:Bank\n"
+    for i in range(n):
+        yield (
+            f"D01/{i % 28 + 1:02d}/2024\nT-{i % 500 + 1}.50\nPLidl {i}\n"
+            f"MCard payment {i}\n^\n"
+        )
+
+
+FORMATS = {
+    "revolut csv": revolut_rows,
+    "otp csv": otp_rows,
+    "ofx sgml": ofx_sgml_records,
+    "ofx xml": ofx_xml_records,
+    "qif": qif_records,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the import adapters on generated files: parse throughput "
+        "(records/s) and peak Python memory. Parsing only, nothing is written "
+        "to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, records, repeat, **options):
+        self.stdout.write(f"records: {records}")
+        for name, generate in FORMATS.items():
+            with tempfile.TemporaryFile() as f:
+                for chunk in generate(records):
+                    f.write(chunk.encode("utf-8"))
+                size = f.tell()
+                f.seek(0)
+                profile = detect_profile(f.read(DETECT_SAMPLE_BYTES))
+                adapter_class = get_adapter(profile.adapter, profile.source)
+
+                def parse():
+                    adapter = adapter_class(f, "bench", uuid.uuid4(), profile)
+                    return sum(1 for _ in adapter.parse())
+
+                parsed = parse()
+                best = self.measure(parse, repeat)
+
+                tracemalloc.start()
+                try:
+                    adapter = adapter_class(f, "bench", uuid.uuid4(), profile)
+                    deque(adapter.parse(), maxlen=0)
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+
+            self.stdout.write(
+                f"{name:12} {size / 2**20:7.1f} MB  {parsed:>8} parsed  "
+                f"{parsed / best:>10,.0f} records/s  peak {peak / 2**20:5.2f} MB"
+            )
+
+    @staticmethod
+    def measure(fn, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
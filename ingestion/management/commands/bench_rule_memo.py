@@ -0,0 +1,111 @@
+import random
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ingestion.rules.engine import CompiledRuleSet
+from ingestion.rules.factory import seed_default_rules
+from ingestion.rules.memo import RuleMemo
+from ingestion.rules.utils import enabled_rules
+from ingestion.transactions.normalize import normalize_description
+
+SHOPS = [
+    "LIDL",
+    "SPAR",
+    "TESCO",
+    "ALDI",
+    "OMV",
+    "MOL",
+    "Wolt",
+    "Bolt",
+    "Netflix.com",
+    "Spotify",
+    "dm-drogerie",
+    "Rossmann",
+    "BKK automata",
+    "Burger King",
+    "Fornetti",
+]
+
+
+def statement_rows(n, merchants, seed=0):
+    """
+    (text, amount) pairs like a year of card statements: `merchants` distinct
+    counterparties with a skewed (Zipf-like) frequency and varying amounts.
+    """
+    rng = random.Random(seed)
+    texts = [
+        normalize_description(
+            f"Vásárlás {rng.choice(SHOPS)} {i}",
+            f"{rng.choice(SHOPS)} {i:04d} BUDAPEST",
+        )
+        for i in range(merchants)
+    ]
+    weights = [1 / (rank + 1) for rank in range(merchants)]
+    return [
+        (text, Decimal(-rng.randint(100, 60_000)))
+        for text in rng.choices(texts, weights, k=n)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark rule matching on generated statement data: CompiledRuleSet "
+        "per row versus the memoised matcher, with its hit rate. Runs inside a "
+        "rolled back transaction, nothing is persisted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--merchants", type=int, default=300)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, rows, merchants, repeat, **options):
+        with transaction.atomic():
+            user_id = f"bench-{uuid.uuid4()}"
+            seed_default_rules(user_id)
+            rules = enabled_rules(user_id)
+            transaction.set_rollback(True)
+
+        data = statement_rows(rows, merchants)
+        items = [(text, amount, None) for text, amount in data]
+        ruleset = CompiledRuleSet(rules)
+
+        def plain():
+            match = ruleset.match
+            return [match(text, amount) for text, amount in data]
+
+        memo = None
+
+        def memoised():
+            nonlocal memo
+            # a fresh memo each round: the cold cost is part of the result
+            memo = RuleMemo(rules, shared=False)
+            return memo.match_many(items)
+
+        if plain() != memoised():
+            raise AssertionError("memoised matching differs from CompiledRuleSet")
+        slow = self.measure(plain, repeat)
+        fast = self.measure(memoised, repeat)
+        hit_rate = memo.hits / (memo.hits + memo.misses)
+        self.stdout.write(
+            f"rows: {rows}  distinct texts: {merchants}  rules: {len(rules)}  "
+            f"range bounds: {len(memo.bounds)}"
+        )
+        self.stdout.write(
+            f"CompiledRuleSet {rows / slow:>10,.0f} rows/s\n"
+            f"memoised        {rows / fast:>10,.0f} rows/s  "
+            f"hit rate {hit_rate:.1%}  speed-up {slow / fast:.1f}x"
+        )
+
+    @staticmethod
+    def measure(fn, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
@@ -0,0 +1,100 @@
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from ingestion.models import Category, FileImport, Transaction
+from ingestion.renderers import ORJSONRenderer
+from ingestion.serializers import (
+    TRANSACTION_LIST_VALUES,
+    TransactionSerializer,
+    transaction_values_to_dict,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the transaction list: ModelSerializer + JSONRenderer versus "
+        "the values() fast path + ORJSONRenderer. Runs inside a rolled back "
+        "transaction, nothing is persisted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, rows, repeat, **options):
+        with transaction.atomic():
+            user_id = f"bench-{uuid.uuid4()}"
+            self.seed(user_id, rows)
+            qs = Transaction.objects.filter(user_id=user_id).order_by(
+                "-booking_date", "-id"
+            )
+
+            def serializer_path():
+                # what TransactionViewSet.list did before: no select_related
+                data = TransactionSerializer(qs.all(), many=True).data
+                return JSONRenderer().render(data)
+
+            def joined_serializer_path():
+                data = TransactionSerializer(
+                    qs.select_related("category"), many=True
+                ).data
+                return JSONRenderer().render(data)
+
+            def values_path():
+                data = [
+                    transaction_values_to_dict(r)
+                    for r in qs.values(*TRANSACTION_LIST_VALUES)
+                ]
+                return ORJSONRenderer().render(data)
+
+            slow = self.measure(serializer_path, repeat)
+            joined = self.measure(joined_serializer_path, repeat)
+            fast = self.measure(values_path, repeat)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"rows: {rows}")
+        self.stdout.write(f"serializer + JSONRenderer: {rows / slow:,.0f} rows/s")
+        self.stdout.write(f"serializer + select_related: {rows / joined:,.0f} rows/s")
+        self.stdout.write(f"values() + ORJSONRenderer: {rows / fast:,.0f} rows/s")
+        self.stdout.write(self.style.SUCCESS(f"speed-up: {slow / fast:.1f}x"))
+
+    @staticmethod
+    def measure(fn, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    @staticmethod
+    def seed(user_id, rows):
+        fi = FileImport.objects.create(
+            user_id=user_id, original_name="bench.csv", storage_path=user_id
+        )
+        categories = [
+            Category.objects.create(user_id=user_id, name=f"cat {i}", type="expense")
+            for i in range(20)
+        ]
+        start = date(2020, 1, 1)
+        Transaction.objects.bulk_create(
+            (
+                Transaction(
+                    user_id=user_id,
+                    import_file=fi,
+                    booking_date=start + timedelta(days=i % 1500),
+                    amount=Decimal(-(i % 5000)) / 7,
+                    description_raw=f"CARD PAYMENT {i} LIDL BUDAPEST",
+                    counterparty="Lidl Magyarorszag",
+                    category=categories[i % 20] if i % 3 else None,
+                )
+                for i in range(rows)
+            ),
+            batch_size=2000,
+        )
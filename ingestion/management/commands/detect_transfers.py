@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from ingestion.models import Transaction
+from ingestion.transactions.transfers import detect_transfers
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark transfers between own accounts in transactions imported before "
+        "transfer detection ran at ingest."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only this user id")
+        parser.add_argument(
+            "--window", type=int, help="Days apart (default TRANSFER_WINDOW_DAYS)"
+        )
+
+    def handle(self, *args, user=None, window=None, **options):
+        if user:
+            user_ids = [user]
+        else:
+            user_ids = (
+                Transaction.objects.values_list("user_id", flat=True)
+                .distinct()
+                .order_by("user_id")
+            )
+        marked = 0
+        for user_id in user_ids:
+            marked += detect_transfers(user_id, window_days=window)
+        self.stdout.write(f"Marked {marked} transactions as transfers")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from ingestion.dashboard.rollup import rebuild_for_user
+from ingestion.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Recompute MonthlyRollup rows from the transactions table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild this user id")
+
+    def handle(self, *args, user=None, **options):
+        if user:
+            user_ids = [user]
+        else:
+            user_ids = Transaction.objects.values_list("user_id", flat=True).distinct()
+        for user_id in user_ids:
+            rebuild_for_user(user_id)
+            self.stdout.write(f"Rebuilt rollups for {user_id}")
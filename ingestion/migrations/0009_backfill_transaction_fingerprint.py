@@ -0,0 +1,52 @@
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def fingerprint(txn):
+    amount = Decimal(txn.amount).quantize(Decimal("0.01"))
+    key = f"{txn.user_id}|{txn.booking_date}|{amount}|{(txn.description_raw or '').strip()}|{(txn.counterparty or '').strip()}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """
+    Fill the new column and drop rows that the old full-scan deduplication
+    would have removed, so the unique index can be created afterwards.
+    """
+    Transaction = apps.get_model("ingestion", "Transaction")
+
+    seen = set()
+    duplicates = []
+    batch = []
+    qs = Transaction.objects.order_by("user_id", "created_at", "id").only(
+        "id", "user_id", "booking_date", "amount", "description_raw", "counterparty"
+    )
+    for txn in qs.iterator(chunk_size=2000):
+        fp = fingerprint(txn)
+        if (txn.user_id, fp) in seen:
+            duplicates.append(txn.id)
+            continue
+        seen.add((txn.user_id, fp))
+        txn.fingerprint = fp
+        batch.append(txn)
+        if len(batch) >= 2000:
+            Transaction.objects.bulk_update(batch, ["fingerprint"])
+            batch = []
+
+    if batch:
+        Transaction.objects.bulk_update(batch, ["fingerprint"])
+    for i in range(0, len(duplicates), 2000):
+        Transaction.objects.filter(id__in=duplicates[i : i + 2000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0008_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0009_backfill_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('user_id', 'fingerprint'), name='uniq_txn_user_fingerprint'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0010_transaction_uniq_txn_user_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user_id', '-booking_date', '-id'], name='transaction_user_id_8d0eaa_idx'),
+        ),
+    ]
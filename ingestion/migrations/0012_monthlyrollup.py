@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0011_transaction_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=64)),
+                ('period', models.CharField(blank=True, max_length=7)),
+                ('weekday', models.PositiveSmallIntegerField(default=0)),
+                ('sign', models.SmallIntegerField()),
+                ('is_transfer', models.BooleanField(default=False)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('txn_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='ingestion.category')),
+            ],
+            options={
+                'db_table': 'monthly_rollups',
+                'indexes': [models.Index(fields=['user_id', 'period'], name='monthly_rol_user_id_949e6a_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('user_id', 'period', 'weekday', 'category', 'sign', 'is_transfer'), name='uniq_rollup_bucket'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('user_id', 'period', 'weekday', 'sign', 'is_transfer'), name='uniq_rollup_bucket_uncategorized')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def build_rollups(apps, schema_editor):
+    Transaction = apps.get_model("ingestion", "Transaction")
+    MonthlyRollup = apps.get_model("ingestion", "MonthlyRollup")
+
+    buckets = defaultdict(lambda: [Decimal(0), 0])
+    rows = Transaction.objects.values_list(
+        "user_id", "booking_date", "category_id", "amount", "is_transfer"
+    )
+    for user_id, booking_date, category_id, amount, is_transfer in rows.iterator(
+        chunk_size=5000
+    ):
+        if booking_date is None:
+            period, weekday = "", 0
+        else:
+            period = booking_date.strftime("%Y-%m")
+            weekday = booking_date.isoweekday() % 7 + 1
+        sign = (amount > 0) - (amount < 0)
+        bucket = buckets[(user_id, period, weekday, category_id, sign, is_transfer)]
+        bucket[0] += amount
+        bucket[1] += 1
+
+    MonthlyRollup.objects.bulk_create(
+        (
+            MonthlyRollup(
+                user_id=user_id,
+                period=period,
+                weekday=weekday,
+                category_id=category_id,
+                sign=sign,
+                is_transfer=is_transfer,
+                total=total,
+                txn_count=count,
+            )
+            for (user_id, period, weekday, category_id, sign, is_transfer), (
+                total,
+                count,
+            ) in buckets.items()
+        ),
+        batch_size=1000,
+    )
+
+
+def drop_rollups(apps, schema_editor):
+    apps.get_model("ingestion", "MonthlyRollup").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0012_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_rollups, drop_rollups),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0013_backfill_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='error_message',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='input_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        # reports that already exist were rendered synchronously
+        migrations.AddField(
+            model_name='report',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('rendering', 'Rendering'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('rendering', 'Rendering'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
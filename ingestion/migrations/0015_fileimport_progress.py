@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0014_report_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileimport',
+            name='bytes_parsed',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fileimport',
+            name='rows_categorised',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fileimport',
+            name='rows_deduplicated',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fileimport',
+            name='rows_inserted',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fileimport',
+            name='rows_parsed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0015_fileimport_progress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fileimport',
+            name='storage_path',
+            field=models.TextField(),
+        ),
+        migrations.AddIndex(
+            model_name='fileimport',
+            index=models.Index(fields=['user_id', 'checksum_sha256'], name='ingestion_f_user_id_c59752_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0016_fileimport_content_addressed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileimport',
+            name='rows_rejected',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
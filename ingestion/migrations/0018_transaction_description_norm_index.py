@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0017_fileimport_rows_rejected'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user_id', 'description_norm'], name='transaction_user_id_54a22d_idx'),
+        ),
+    ]
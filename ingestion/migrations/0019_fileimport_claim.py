@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0018_transaction_description_norm_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileimport',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fileimport',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
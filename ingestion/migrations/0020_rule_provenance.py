@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0019_fileimport_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rule',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='rule_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='rule_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user_id', 'rule_id'], name='transaction_user_id_df4d43_idx'),
+        ),
+    ]
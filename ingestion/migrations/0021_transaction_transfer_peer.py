@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0020_rule_provenance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='transfer_peer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ingestion.transaction'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0021_transaction_transfer_peer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Merchant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=128, unique=True)),
+                ('name', models.CharField(max_length=128)),
+            ],
+            options={
+                'db_table': 'merchants',
+            },
+        ),
+        migrations.AlterField(
+            model_name='rule',
+            name='match_type',
+            field=models.CharField(choices=[('contains', 'Contains'), ('regex', 'Regex'), ('equals', 'Equals'), ('amount_range', 'Amount Range'), ('merchant', 'Merchant')], max_length=32),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='merchant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ingestion.merchant'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user_id', 'merchant'], name='transaction_user_id_a2ab61_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:09
+
+import ingestion.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0022_merchants'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transaction_user_id_8d0eaa_idx',
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=ingestion.models.NullsLastIndex(models.F('user_id'), models.OrderBy(models.F('booking_date'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='transactions_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,124 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# frozen copy of ingestion.transactions.merchants as of this migration: the
+# keys it stores must not change with later versions of the app code
+MAX_KEY_TOKENS = 2
+
+_WORD = re.compile(r"[a-z0-9&]+")
+_SPACES = re.compile(r"\s+")
+
+LEGAL_FORMS = {"kft", "zrt", "nyrt", "bt", "kkt", "ev", "ltd", "gmbh", "inc", "llc"}
+PLACES = {
+    "hu",
+    "hun",
+    "hungary",
+    "magyarorszag",
+    "budapest",
+    "debrecen",
+    "szeged",
+    "miskolc",
+    "pecs",
+    "gyor",
+}
+PAYMENT_WORDS = {"pos", "vasarlas", "kartyas", "atutalas", "terheles", "jovairas"}
+NOISE = LEGAL_FORMS | PLACES | PAYMENT_WORDS
+
+CHAINS = {
+    "aldi": "Aldi",
+    "auchan": "Auchan",
+    "dm": "dm",
+    "ikea": "IKEA",
+    "lidl": "Lidl",
+    "mol": "MOL",
+    "netflix": "Netflix",
+    "omv": "OMV",
+    "penny": "Penny",
+    "rossmann": "Rossmann",
+    "shell": "Shell",
+    "spar": "Spar",
+    "spotify": "Spotify",
+    "tesco": "Tesco",
+    "wolt": "Wolt",
+}
+
+
+def fold(text):
+    decomposed = unicodedata.normalize("NFKD", (text or "").casefold())
+    text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _SPACES.sub(" ", text).strip()
+
+
+def merchant_key(text):
+    words = [
+        w
+        for w in _WORD.findall(fold(text))
+        if w not in NOISE and not w.isdigit() and len(w) > 1
+    ]
+    if not words:
+        return ""
+    if words[0] in CHAINS:
+        return words[0]
+    return " ".join(words[:MAX_KEY_TOKENS])
+
+
+def merchant_name(key):
+    return CHAINS.get(key) or key.title()
+
+
+def row_merchant_key(counterparty, description):
+    return merchant_key(counterparty) or merchant_key(description)
+
+
+BATCH_SIZE = 2000
+
+
+def save_batch(Merchant, Transaction, ids, batch):
+    keys = [row_merchant_key(t.counterparty, t.description_raw) for t in batch]
+    missing = {k for k in keys if k and k not in ids}
+    if missing:
+        Merchant.objects.bulk_create(
+            [Merchant(key=k, name=merchant_name(k)) for k in missing],
+            ignore_conflicts=True,
+        )
+        ids.update(Merchant.objects.filter(key__in=missing).values_list("key", "id"))
+    changed = []
+    for txn, key in zip(batch, keys):
+        if key in ids:
+            txn.merchant_id = ids[key]
+            changed.append(txn)
+    Transaction.objects.bulk_update(changed, ["merchant"])
+
+
+def backfill_merchants(apps, schema_editor):
+    """Set the merchant of the rows imported before it was set at ingest."""
+    Merchant = apps.get_model("ingestion", "Merchant")
+    Transaction = apps.get_model("ingestion", "Transaction")
+
+    ids = {}
+    batch = []
+    qs = (
+        Transaction.objects.filter(merchant__isnull=True)
+        .order_by("id")
+        .only("id", "description_raw", "counterparty")
+    )
+    for txn in qs.iterator(chunk_size=BATCH_SIZE):
+        batch.append(txn)
+        if len(batch) >= BATCH_SIZE:
+            save_batch(Merchant, Transaction, ids, batch)
+            batch = []
+    if batch:
+        save_batch(Merchant, Transaction, ids, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0023_transaction_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_merchants, migrations.RunPython.noop),
+    ]
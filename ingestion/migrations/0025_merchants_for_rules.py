@@ -0,0 +1,94 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# frozen copy of ingestion.transactions.merchants as of this migration: the
+# keys it stores must not change with later versions of the app code
+MAX_KEY_TOKENS = 2
+
+_WORD = re.compile(r"[a-z0-9&]+")
+_SPACES = re.compile(r"\s+")
+
+LEGAL_FORMS = {"kft", "zrt", "nyrt", "bt", "kkt", "ev", "ltd", "gmbh", "inc", "llc"}
+PLACES = {
+    "hu",
+    "hun",
+    "hungary",
+    "magyarorszag",
+    "budapest",
+    "debrecen",
+    "szeged",
+    "miskolc",
+    "pecs",
+    "gyor",
+}
+PAYMENT_WORDS = {"pos", "vasarlas", "kartyas", "atutalas", "terheles", "jovairas"}
+NOISE = LEGAL_FORMS | PLACES | PAYMENT_WORDS
+
+CHAINS = {
+    "aldi": "Aldi",
+    "auchan": "Auchan",
+    "dm": "dm",
+    "ikea": "IKEA",
+    "lidl": "Lidl",
+    "mol": "MOL",
+    "netflix": "Netflix",
+    "omv": "OMV",
+    "penny": "Penny",
+    "rossmann": "Rossmann",
+    "shell": "Shell",
+    "spar": "Spar",
+    "spotify": "Spotify",
+    "tesco": "Tesco",
+    "wolt": "Wolt",
+}
+
+
+def fold(text):
+    decomposed = unicodedata.normalize("NFKD", (text or "").casefold())
+    text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _SPACES.sub(" ", text).strip()
+
+
+def merchant_key(text):
+    words = [
+        w
+        for w in _WORD.findall(fold(text))
+        if w not in NOISE and not w.isdigit() and len(w) > 1
+    ]
+    if not words:
+        return ""
+    if words[0] in CHAINS:
+        return words[0]
+    return " ".join(words[:MAX_KEY_TOKENS])
+
+
+def merchant_name(key):
+    return CHAINS.get(key) or key.title()
+
+
+def create_rule_merchants(apps, schema_editor):
+    """Create the merchants of the MERCHANT rules saved before rules did it."""
+    Merchant = apps.get_model("ingestion", "Merchant")
+    Rule = apps.get_model("ingestion", "Rule")
+
+    values = Rule.objects.filter(match_type="merchant").values_list(
+        "match_value", flat=True
+    )
+    keys = {merchant_key(v) for v in values} - {""}
+    Merchant.objects.bulk_create(
+        [Merchant(key=k, name=merchant_name(k)) for k in keys],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0024_backfill_merchants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rule_merchants, migrations.RunPython.noop),
+    ]
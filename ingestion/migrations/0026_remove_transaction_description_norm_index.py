@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:31
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0025_merchants_for_rules'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transaction_user_id_54a22d_idx',
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F, OrderBy
 import uuid
 
 
@@ -28,7 +29,9 @@ class FileImport(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user_id = models.CharField(max_length=64)  # Supabase user UUID string
     original_name = models.TextField()
-    storage_path = models.TextField(unique=True)  # MEDIA_ROOT-on belüli relatív út
+    # MEDIA_ROOT-on belüli relatív út, content-addressed
+    # (imports/<sha256><ext>): imports of identical files share it
+    storage_path = models.TextField()
     mime_type = models.TextField(null=True, blank=True)
     size_bytes = models.BigIntegerField(null=True, blank=True)
     checksum_sha256 = models.CharField(max_length=64, null=True, blank=True)
@@ -44,9 +47,50 @@ class FileImport(models.Model):
     )
     error_message = models.TextField(null=True, blank=True)
 
+    # progress, updated by parse_import_task after every batch
+    bytes_parsed = models.BigIntegerField(default=0)
+    rows_parsed = models.PositiveIntegerField(default=0)
+    rows_inserted = models.PositiveIntegerField(default=0)
+    rows_deduplicated = models.PositiveIntegerField(default=0)
+    # rows the adapter could not parse (bad amount, too few columns, ...)
+    rows_rejected = models.PositiveIntegerField(default=0)
+    rows_categorised = models.PositiveIntegerField(default=0)
+
+    # claim of the processing worker, see ingestion.imports.state
+    attempts = models.PositiveIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # re-upload short-circuit and pre-flight checksum lookups
+            models.Index(fields=["user_id", "checksum_sha256"]),
+        ]
+
+
+class NullsLastIndex(models.Index):
+    """
+    An index with NULLS LAST columns. SQLite cannot declare NULLS LAST in an
+    index, but its DESC already sorts NULLs last, so there they are created
+    as plain DESC columns.
+    """
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.vendor != "sqlite":
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        expressions = [
+            (
+                OrderBy(e.expression, descending=e.descending)
+                if isinstance(e, OrderBy) and e.nulls_last
+                else e
+            )
+            for e in self.expressions
+        ]
+        index = models.Index(*expressions, name=self.name)
+        return index.create_sql(model, schema_editor, using, **kwargs)
+
 
 class Transaction(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -59,13 +103,32 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=14, decimal_places=2)
     currency = models.CharField(max_length=8, default="HUF")
     description_raw = models.TextField(blank=True)
+    # see ingestion.transactions.normalize; filled at ingest
     description_norm = models.TextField(blank=True)
     counterparty = models.TextField(blank=True)
     reference = models.TextField(blank=True, null=True)
     category = models.ForeignKey(
         "ingestion.Category", null=True, blank=True, on_delete=models.SET_NULL
     )
+    # provenance: the rule (and its version) that set `category`; a plain id,
+    # not a foreign key, so it outlives the rule (ingestion.rules.recategorise)
+    rule_id = models.UUIDField(null=True, blank=True)
+    rule_version = models.PositiveIntegerField(null=True, blank=True)
     is_transfer = models.BooleanField(default=False)
+    # the other half of a detected transfer (ingestion.transactions.transfers)
+    transfer_peer = models.ForeignKey(
+        "self", null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    # canonical counterparty (ingestion.transactions.merchants)
+    merchant = models.ForeignKey(
+        "ingestion.Merchant",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    # sha256 of the identifying fields, see transactions.utils.compute_fingerprint
+    fingerprint = models.CharField(max_length=64, null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -75,6 +138,23 @@ class Transaction(models.Model):
         indexes = [
             models.Index(fields=["user_id"]),
             models.Index(fields=["booking_date"]),
+            # keyset pagination of the transaction list: the exact ordering
+            # of TransactionCursorPagination (a plain DESC index is NULLS
+            # FIRST on Postgres and cannot serve it)
+            NullsLastIndex(
+                F("user_id"),
+                F("booking_date").desc(nulls_last=True),
+                F("id").desc(),
+                name="transactions_keyset_idx",
+            ),
+            models.Index(fields=["user_id", "rule_id"]),
+            # merchant analytics
+            models.Index(fields=["user_id", "merchant"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_id", "fingerprint"], name="uniq_txn_user_fingerprint"
+            ),
         ]
 
 
@@ -83,6 +163,7 @@ class RuleMatchType(models.TextChoices):
     REGEX = "regex"
     EQUALS = "equals"
     AMOUNT_RANGE = "amount_range"
+    MERCHANT = "merchant"
 
 
 class Rule(models.Model):
@@ -97,6 +178,8 @@ class Rule(models.Model):
 
     action_set_category = models.CharField(max_length=64, null=True, blank=True)
     action_mark_transfer = models.BooleanField(default=False)
+    # bumped on every edit; transactions record the version that matched them
+    version = models.PositiveIntegerField(default=1)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -106,6 +189,19 @@ class Rule(models.Model):
         ordering = ["priority"]
 
 
+class Merchant(models.Model):
+    """A canonical merchant; `key` is transactions.merchants.merchant_key."""
+
+    key = models.CharField(max_length=128, unique=True)
+    name = models.CharField(max_length=128)
+
+    class Meta:
+        db_table = "merchants"
+
+    def __str__(self):
+        return self.name
+
+
 class Category(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user_id = models.CharField(max_length=64)
@@ -124,11 +220,63 @@ class Category(models.Model):
         return self.name
 
 
+class MonthlyRollup(models.Model):
+    """
+    Per-user monthly aggregate of transactions, maintained incrementally by
+    ingestion.dashboard.rollup. Dashboard endpoints read these rows instead
+    of scanning the transactions table.
+    """
+
+    user_id = models.CharField(max_length=64)
+    period = models.CharField(max_length=7, blank=True)  # "YYYY-MM", "" = no date
+    # ExtractWeekDay numbering (1=Sunday ... 7=Saturday), 0 = no date
+    weekday = models.PositiveSmallIntegerField(default=0)
+    category = models.ForeignKey(
+        "ingestion.Category", null=True, blank=True, on_delete=models.CASCADE
+    )
+    sign = models.SmallIntegerField()  # -1 expense, 1 income, 0 zero amount
+    is_transfer = models.BooleanField(default=False)
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    txn_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "monthly_rollups"
+        indexes = [
+            models.Index(fields=["user_id", "period"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "user_id",
+                    "period",
+                    "weekday",
+                    "category",
+                    "sign",
+                    "is_transfer",
+                ],
+                condition=models.Q(category__isnull=False),
+                name="uniq_rollup_bucket",
+            ),
+            models.UniqueConstraint(
+                fields=["user_id", "period", "weekday", "sign", "is_transfer"],
+                condition=models.Q(category__isnull=True),
+                name="uniq_rollup_bucket_uncategorized",
+            ),
+        ]
+
+
 # backend/reports/models.py
 import uuid
 from django.db import models
 
 
+class ReportStatus(models.TextChoices):
+    PENDING = "pending"
+    RENDERING = "rendering"
+    READY = "ready"
+    FAILED = "failed"
+
+
 class Report(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user_id = models.CharField(max_length=64)
@@ -137,7 +285,14 @@ class Report(models.Model):
 
     storage_path = models.TextField(unique=True)  # relative to MEDIA_ROOT
     original_name = models.CharField(max_length=128)
-    size_bytes = models.BigIntegerField()
+    size_bytes = models.BigIntegerField(default=0)
+
+    status = models.CharField(
+        max_length=16, choices=ReportStatus.choices, default=ReportStatus.PENDING
+    )
+    error_message = models.TextField(null=True, blank=True)
+    # hash of the month's transactions and the template the PDF was made from
+    input_fingerprint = models.CharField(max_length=64, null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)  # generation timestamp
 
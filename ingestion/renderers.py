@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+import orjson
+from rest_framework.renderers import BaseRenderer
+
+
+def _default(obj):
+    # mirror rest_framework.utils.encoders.JSONEncoder for what orjson lacks
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    if hasattr(obj, "__iter__"):
+        return list(obj)
+    return str(obj)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Drop-in JSON renderer backed by orjson. UUIDs, dates and datetimes are
+    serialised natively, so read paths can hand over raw values() rows.
+    """
+
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    text/event-stream (server-sent events). Views stream pre-rendered events
+    themselves; this renderer lets content negotiation accept the media type
+    and renders a single payload (e.g. an error) as one event.
+    """
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    @staticmethod
+    def event(data, event=None) -> bytes:
+        prefix = f"event: {event}\n".encode() if event else b""
+        return prefix + b"data: " + orjson.dumps(data, default=_default) + b"\n\n"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return self.event(data)
@@ -0,0 +1,132 @@
+import hashlib
+import os
+from datetime import datetime
+from decimal import Decimal
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db.models import Sum
+from django.template import Context, Template
+
+from ingestion.models import Report, ReportStatus, Transaction
+
+logger = get_task_logger(__name__)
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "monthly_report.html")
+
+
+def month_transactions(user_id: str, year: int, month: int):
+    return Transaction.objects.filter(
+        user_id=user_id,
+        booking_date__year=year,
+        booking_date__month=month,
+    )
+
+
+def input_fingerprint(user_id: str, year: int, month: int) -> str:
+    """
+    Hash of everything the PDF is rendered from: the month's transactions
+    (including their category names/types) and the template.
+    """
+    h = hashlib.sha256()
+    with open(TEMPLATE_PATH, "rb") as f:
+        h.update(f.read())
+    rows = (
+        month_transactions(user_id, year, month)
+        .order_by("id")
+        .values_list("id", "amount", "category_id", "category__name", "category__type")
+    )
+    for row in rows.iterator(chunk_size=2000):
+        h.update("|".join(map(str, row)).encode())
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def report_relative_path(user_id: str, year: int, month: int) -> str:
+    return os.path.join("reports", str(user_id), f"report_{year}_{month:02d}.pdf")
+
+
+def build_context(user_id: str, year: int, month: int) -> dict:
+    txns = month_transactions(user_id, year, month)
+
+    # --- Aggregates ---
+    total_income = txns.filter(amount__gt=0).aggregate(Sum("amount"))[
+        "amount__sum"
+    ] or Decimal(0)
+    total_expense = txns.filter(amount__lt=0).aggregate(Sum("amount"))[
+        "amount__sum"
+    ] or Decimal(0)
+    net_balance = total_income + total_expense  # expense is negative
+
+    # --- Category summary ---
+    category_totals = (
+        txns.filter(category__isnull=False)
+        .values("category__name", "category__type")
+        .annotate(total=Sum("amount"))
+        .order_by("total")
+    )
+
+    return {
+        "year": year,
+        "month": month,
+        "total_income": total_income,
+        "total_expense": total_expense,
+        "net_balance": net_balance,
+        "categories": category_totals,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+    }
+
+
+def render_pdf(context: dict) -> bytes:
+    # WeasyPrint (and its native libraries) is only needed by the worker
+    from weasyprint import HTML
+
+    with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        template_string = f.read()
+    html_string = Template(template_string).render(Context(context))
+    return HTML(string=html_string, base_url=os.path.dirname(TEMPLATE_PATH)).write_pdf()
+
+
+@shared_task
+def render_report_task(report_id: str):
+    """Render a pending Report to PDF under MEDIA_ROOT and mark it ready."""
+    updated = Report.objects.filter(id=report_id, status=ReportStatus.PENDING).update(
+        status=ReportStatus.RENDERING, error_message=None
+    )
+    if not updated:
+        logger.info(f"Report {report_id} is not pending, skipping")
+        return
+
+    report = Report.objects.get(id=report_id)
+    # a newer request re-queues the report (status back to PENDING) while we
+    # render; only finish it if that has not happened
+    rendering = Report.objects.filter(id=report_id, status=ReportStatus.RENDERING)
+    try:
+        # the PDF is only kept if its input did not change while it was
+        # rendered: build_context's queries could otherwise mix old and new
+        # rows under a fingerprint that describes neither
+        fingerprint = input_fingerprint(report.user_id, report.year, report.month)
+        context = build_context(report.user_id, report.year, report.month)
+        pdf = render_pdf(context)
+        current = input_fingerprint(report.user_id, report.year, report.month)
+        if current != fingerprint:
+            if rendering.update(status=ReportStatus.PENDING, input_fingerprint=current):
+                render_report_task.delay(report_id)
+            logger.info(f"Report {report.id} input changed while rendering, re-queued")
+            return
+
+        file_path = os.path.join(settings.MEDIA_ROOT, report.storage_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(pdf)
+
+        rendering.update(
+            status=ReportStatus.READY,
+            size_bytes=len(pdf),
+            input_fingerprint=fingerprint,
+        )
+        logger.info(f"Rendered report {report.id} ({len(pdf)} bytes)")
+    except Exception as e:
+        logger.exception(f"render_report_task failed for {report_id}")
+        rendering.update(status=ReportStatus.FAILED, error_message=str(e))
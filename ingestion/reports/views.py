@@ -1,10 +1,7 @@
 # backend/reports/views.py
 import os
-from io import BytesIO
 from datetime import datetime
-from decimal import Decimal
 from django.conf import settings
-from django.db.models import Sum
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -14,19 +11,41 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 
-from ingestion.models import Transaction, Report
+from django.db import transaction
+
+from ingestion.models import Report, ReportStatus
 from ingestion.utils import get_access_token, get_user_id
-from weasyprint import HTML
-from django.template.loader import render_to_string
-from django.template import Template, Context
+from ingestion.reports.tasks import (
+    input_fingerprint,
+    month_transactions,
+    render_report_task,
+    report_relative_path,
+)
+
+
+def _file_url(report):
+    return f"http://127.0.0.1:8000{settings.MEDIA_URL}{report.storage_path}"
+
+
+def _job(report):
+    data = {"id": str(report.id), "status": report.status}
+    if report.status == ReportStatus.READY:
+        data["file_url"] = _file_url(report)
+    if report.status == ReportStatus.FAILED:
+        data["error_message"] = report.error_message
+    return data
 
 
 @api_view(["GET"])
 def monthly_report(request):
     """
-    Generate a PDF report for a given year and month.
-    The PDF is saved to MEDIA_ROOT/reports/<user_id>/report_YYYY_MM.pdf
-    and a Report entry is stored in the database.
+    Request the PDF report for a given year and month.
+
+    If the month's transactions (and the template) are unchanged since the
+    stored Report was rendered, its file is returned right away (200).
+    Otherwise rendering is queued (202) and the returned job can be polled
+    at /api/reports/<id>/status. The PDF is saved to
+    MEDIA_ROOT/reports/<user_id>/report_YYYY_MM.pdf.
     """
     user_id = get_user_id(request)
     access_token = get_access_token(request)
@@ -42,80 +61,61 @@ def monthly_report(request):
             {"detail": "Invalid or missing 'year'/'month' parameters."}, status=400
         )
 
-    txns = Transaction.objects.filter(
-        user_id=user_id,
-        booking_date__year=year,
-        booking_date__month=month,
-    ).select_related("category")
-
-    if not txns.exists():
+    if not month_transactions(user_id, year, month).exists():
         return Response({"detail": "No transactions found for this month."}, status=404)
 
-    # --- Aggregates ---
-    total_income = txns.filter(amount__gt=0).aggregate(Sum("amount"))[
-        "amount__sum"
-    ] or Decimal(0)
-    total_expense = txns.filter(amount__lt=0).aggregate(Sum("amount"))[
-        "amount__sum"
-    ] or Decimal(0)
-    net_balance = total_income + total_expense  # expense is negative
-
-    # --- Category summary ---
-    category_totals = (
-        txns.filter(category__isnull=False)
-        .values("category__name", "category__type")
-        .annotate(total=Sum("amount"))
-        .order_by("total")
-    )
-
-    context = {
-        "year": year,
-        "month": month,
-        "total_income": total_income,
-        "total_expense": total_expense,
-        "net_balance": net_balance,
-        "categories": category_totals,
-        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
-    }
-
-    template_path = os.path.join(os.path.dirname(__file__), "monthly_report.html")
-    try:
-        with open(template_path, "r", encoding="utf-8") as f:
-            template_string = f.read()
-    except FileNotFoundError:
-        return Response({"detail": "Template not found."}, status=500)
-
-    html_string = Template(template_string).render(Context(context))
-    pdf = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-
-    # save file
-    reports_dir = os.path.join(settings.MEDIA_ROOT, "reports", str(user_id))
-    os.makedirs(reports_dir, exist_ok=True)
-    filename = f"report_{year}_{month:02d}.pdf"
-    file_path = os.path.join(reports_dir, filename)
-    with open(file_path, "wb") as f:
-        if isinstance(pdf, bytes):
-            f.write(pdf)
-
-    relative_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
-    report_obj, _ = Report.objects.update_or_create(
-        user_id=user_id,
-        year=year,
-        month=month,
-        defaults={
-            "storage_path": relative_path,
-            "original_name": filename,
-            "size_bytes": len(pdf ) if isinstance(pdf, bytes) else 0,
-        },
-    )
-
-    return Response(
-        {
-            "detail": "Report generated successfully.",
-            "file_url": f"http://127.0.0.1:8000{settings.MEDIA_URL}{report_obj.storage_path}",
-        },
-        status=status.HTTP_201_CREATED,
-    )
+    fingerprint = input_fingerprint(user_id, year, month)
+    with transaction.atomic():
+        report = (
+            Report.objects.select_for_update()
+            .filter(user_id=user_id, year=year, month=month)
+            .first()
+        )
+        if report is not None and report.input_fingerprint == fingerprint:
+            if report.status == ReportStatus.READY and os.path.exists(
+                os.path.join(settings.MEDIA_ROOT, report.storage_path)
+            ):
+                return Response(
+                    {"detail": "Report is up to date.", **_job(report)},
+                    status=status.HTTP_200_OK,
+                )
+            if report.status in (ReportStatus.PENDING, ReportStatus.RENDERING):
+                return Response(_job(report), status=status.HTTP_202_ACCEPTED)
+
+        if report is None:
+            relative_path = report_relative_path(user_id, year, month)
+            report = Report(
+                user_id=user_id,
+                year=year,
+                month=month,
+                storage_path=relative_path,
+                original_name=os.path.basename(relative_path),
+            )
+        report.status = ReportStatus.PENDING
+        report.error_message = None
+        report.input_fingerprint = fingerprint
+        report.save()
+        transaction.on_commit(lambda: render_report_task.delay(str(report.id)))
+
+    return Response(_job(report), status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(["GET"])
+def report_status(request, report_id):
+    """
+    Status of a report job: pending, rendering, ready (with file_url) or
+    failed (with error_message).
+    """
+    user_id = get_user_id(request)
+    access_token = get_access_token(request)
+
+    if not user_id or not access_token:
+        return Response({"detail": "Authentication credentials were not provided."}, status=401)
+
+    report = Report.objects.filter(id=report_id, user_id=user_id).first()
+    if report is None:
+        return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(_job(report), status=status.HTTP_200_OK)
 
 
 @api_view(["GET"])
@@ -129,14 +129,16 @@ def report_history(request):
     if not user_id or not access_token:
         return Response({"detail": "Authentication credentials were not provided."}, status=401)
     
-    reports = Report.objects.filter(user_id=user_id).order_by("-created_at")
+    reports = Report.objects.filter(
+        user_id=user_id, status=ReportStatus.READY
+    ).order_by("-created_at")
 
     data = [
         {
             "id": str(r.id),
             "year": r.year,
             "month": r.month,
-            "file_url": f"http://127.0.0.1:8000{settings.MEDIA_URL}{r.storage_path}",
+            "file_url": _file_url(r),
             "created_at": r.created_at.isoformat(),
             "size_kb": round(r.size_bytes / 1024, 1),
             "month_label": datetime(r.year, r.month, 1).strftime("%B %Y"),
@@ -0,0 +1,155 @@
+"""
+Memoised rule matching.
+
+A user's rows repeat the same few hundred merchant texts, and the first
+matching rule of a row depends only on
+
+  - its normalised text,
+  - its merchant, if the ruleset has MERCHANT rules,
+  - where its amount falls among the AMOUNT_RANGE bounds, if it has range
+    rules: (bisect_left, bisect_right) over the sorted bounds tells apart
+    amounts below, on and above every bound, so inclusive ranges keep
+    their exact semantics.
+
+RuleMemo maps that key to the index of the first matching rule. A memo
+belongs to one ruleset version (a hash of the rules in priority order), so
+creating, editing, reordering, disabling or deleting a rule starts a new
+memo instead of invalidating entries. Categories are looked up after the
+match, so category changes need no invalidation.
+
+Memos hold at most RULES_MEMO_SIZE keys (LRU) and a process keeps the
+RULES_MEMO_RULESETS most recently used. With RULES_MEMO_SHARED the keys a
+batch misses are read from Django's cache and the ones computed are
+written back, one round trip each, so workers share their results.
+"""
+
+import hashlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ingestion.models import RuleMatchType
+from .engine import NO_MATCH, CompiledRuleSet
+
+SHARED_TIMEOUT = 24 * 60 * 60
+
+_memos = OrderedDict()  # ruleset version -> RuleMemo
+
+
+def ruleset_version(rules) -> str:
+    """Hash of everything about `rules` (in order) a match depends on."""
+    digest = hashlib.sha1()
+    for rule in rules:
+        digest.update(
+            repr(
+                (
+                    str(rule.id),
+                    rule.version,
+                    rule.match_type,
+                    rule.match_value,
+                    rule.action_set_category,
+                )
+            ).encode()
+        )
+    return digest.hexdigest()
+
+
+def amount_bounds(rules) -> list[Decimal]:
+    """Sorted distinct bounds of the ranges CompiledRuleSet can parse."""
+    bounds = set()
+    for rule in rules:
+        if rule.match_type != RuleMatchType.AMOUNT_RANGE:
+            continue
+        try:
+            lo, hi = (Decimal(v) for v in (rule.match_value or "").split(","))
+        except (ValueError, InvalidOperation):
+            continue
+        if not (lo.is_nan() or hi.is_nan()):
+            bounds.update((lo, hi))
+    return sorted(bounds)
+
+
+class RuleMemo:
+    """First-match results of one ruleset version, see the module docstring."""
+
+    def __init__(self, rules, version=None, size=None, shared=None):
+        self.ruleset = CompiledRuleSet(rules)
+        self.rules = self.ruleset.rules
+        self.version = version or ruleset_version(self.rules)
+        self.size = settings.RULES_MEMO_SIZE if size is None else size
+        self.shared = settings.RULES_MEMO_SHARED if shared is None else shared
+        self.bounds = amount_bounds(self.rules)
+        self.by_merchant = any(
+            r.match_type == RuleMatchType.MERCHANT for r in self.rules
+        )
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def key(self, text: str, amount, merchant_id=None) -> tuple:
+        bucket = None
+        if self.bounds:
+            bucket = (
+                bisect_left(self.bounds, amount),
+                bisect_right(self.bounds, amount),
+            )
+        return text, merchant_id if self.by_merchant else None, bucket
+
+    def _cache_key(self, key) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return f"rules:memo:{self.version}:{digest}"
+
+    def _store(self, key, idx):
+        self.entries[key] = idx
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def _fetch_shared(self, keys):
+        missing = {self._cache_key(k): k for k in keys if k not in self.entries}
+        if missing:
+            for cache_key, idx in cache.get_many(list(missing)).items():
+                self._store(missing[cache_key], idx)
+
+    def match_many(self, items) -> list:
+        """The first matching Rule (or None) of (text, amount, merchant_id)s."""
+        keys = [self.key(*item) for item in items]
+        if self.shared:
+            self._fetch_shared(set(keys))
+        entries, rules = self.entries, self.rules
+        fresh = {}
+        matched = []
+        for key, (text, amount, merchant_id) in zip(keys, items):
+            idx = entries.get(key)
+            if idx is None:
+                self.misses += 1
+                idx = self.ruleset.match_index(text, amount, merchant_id)
+                self._store(key, idx)
+                fresh[key] = idx
+            else:
+                self.hits += 1
+                entries.move_to_end(key)
+            matched.append(None if idx == NO_MATCH else rules[idx])
+        if self.shared and fresh:
+            cache.set_many(
+                {self._cache_key(k): idx for k, idx in fresh.items()},
+                timeout=SHARED_TIMEOUT,
+            )
+        return matched
+
+    def match(self, text: str, amount, merchant_id=None):
+        return self.match_many([(text, amount, merchant_id)])[0]
+
+
+def memo_for(rules) -> RuleMemo:
+    """The process's memo of `rules` (enabled rules in priority order)."""
+    version = ruleset_version(rules)
+    memo = _memos.get(version)
+    if memo is None:
+        memo = _memos[version] = RuleMemo(rules, version=version)
+        if len(_memos) > settings.RULES_MEMO_RULESETS:
+            _memos.popitem(last=False)
+    else:
+        _memos.move_to_end(version)
+    return memo
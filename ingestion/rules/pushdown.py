@@ -0,0 +1,189 @@
+"""
+Set-based rule application.
+
+Instead of loading every uncategorised row into Python, each rule becomes
+an UPDATE ... WHERE over the rows still uncategorised, run in priority
+order, which is the first-match semantics of CompiledRuleSet:
+
+  - CONTAINS: description_norm LIKE %value%
+  - EQUALS: description_norm = value
+  - AMOUNT_RANGE: amount BETWEEN lo AND hi
+  - MERCHANT: merchant.key = key
+
+Values are folded exactly as CompiledRuleSet folds them. REGEX rules (and
+ranges with infinite bounds) have no portable SQL form; a run of them is
+evaluated in Python over the rows remaining at that point. A rule whose
+category is missing still claims the rows it matches, as in the Python
+engine, so they are excluded from the rules after it.
+"""
+
+import re
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from ingestion.dashboard.cache import bump_data_version
+from ingestion.dashboard.rollup import _SIGN, RollupDelta, bucket_of
+from ingestion.models import Category, RuleMatchType, Transaction
+from ingestion.transactions.merchants import merchant_key
+from ingestion.transactions.normalize import fold, normalize_description, strip_accents
+
+# ids per UPDATE ... WHERE id IN (...) of the Python-evaluated rules
+ID_CHUNK = 500
+
+
+def rule_condition(rule) -> Q | None:
+    """SQL condition of a rule; None if it has to be evaluated in Python."""
+    value = rule.match_value or ""
+    if rule.match_type == RuleMatchType.CONTAINS:
+        return Q(description_norm__contains=fold(value))
+    if rule.match_type == RuleMatchType.EQUALS:
+        return Q(description_norm=fold(value))
+    if rule.match_type == RuleMatchType.AMOUNT_RANGE:
+        try:
+            lo, hi = (Decimal(v) for v in value.split(","))
+            if lo.is_nan() or hi.is_nan():
+                raise InvalidOperation
+        except (ValueError, InvalidOperation):
+            # never matches, like in CompiledRuleSet
+            return Q(pk__in=[])
+        if not (lo.is_finite() and hi.is_finite()):
+            return None
+        return Q(amount__gte=lo, amount__lte=hi)
+    if rule.match_type == RuleMatchType.MERCHANT:
+        key = merchant_key(value)
+        return Q(merchant__key=key) if key else Q(pk__in=[])
+    return None
+
+
+def fill_description_norm(qs):
+    """Compute description_norm for rows of `qs` that do not have it yet."""
+    missing = list(
+        qs.filter(description_norm="").only("id", "description_raw", "counterparty")
+    )
+    changed = []
+    for txn in missing:
+        txn.description_norm = normalize_description(
+            txn.description_raw, txn.counterparty
+        )
+        if txn.description_norm:
+            changed.append(txn)
+    Transaction.objects.bulk_update(changed, ["description_norm"], batch_size=1000)
+
+
+def python_matches(rules, qs) -> dict:
+    """
+    {transaction id: index into `rules`} for the rows of `qs` a rule of
+    `rules` (a run of consecutive rules without SQL form) matches first.
+    """
+    compiled = []
+    for idx, rule in enumerate(rules):
+        if rule.match_type == RuleMatchType.REGEX:
+            try:
+                rx = re.compile(strip_accents(rule.match_value or ""), re.I)
+            except re.error:
+                continue
+            compiled.append((idx, lambda text, amount, rx=rx: rx.search(text)))
+        else:
+            lo, hi = (Decimal(v) for v in rule.match_value.split(","))
+            compiled.append(
+                (idx, lambda text, amount, lo=lo, hi=hi: lo <= amount <= hi)
+            )
+    if not compiled:
+        return {}
+    matches = {}
+    for txn_id, text, amount in qs.values_list("id", "description_norm", "amount"):
+        for idx, test in compiled:
+            if test(text, amount):
+                matches[txn_id] = idx
+                break
+    return matches
+
+
+class PushdownRun:
+    """One rule application; counts and the rollup delta of every UPDATE."""
+
+    def __init__(self, categories: dict, by_import: Counter = None):
+        self.categories = categories
+        self.by_import = by_import
+        self.delta = RollupDelta()
+        self.assigned = Counter()  # category id -> rows
+
+    def categorise(self, matched, rule):
+        """Set the rule's category on `matched`; returns whether it has one."""
+        category = self.categories.get(str(rule.action_set_category))
+        if category is None:
+            return False
+        groups = (
+            matched.annotate(sign=_SIGN)
+            .values("booking_date", "is_transfer", "sign", "import_file_id")
+            .annotate(sum_amount=Sum("amount"), n=Count("id"))
+            .order_by()
+        )
+        for r in groups:
+            period, weekday = bucket_of(r["booking_date"])
+            total = r["sum_amount"] or 0
+            for category_id, factor in ((None, -1), (category.id, 1)):
+                key = (period, weekday, category_id, r["sign"], r["is_transfer"])
+                self.delta.add(key, factor * total, factor * r["n"])
+            if self.by_import is not None:
+                self.by_import[r["import_file_id"]] += r["n"]
+        updated = matched.update(
+            category_id=category.id, rule_id=rule.id, rule_version=rule.version
+        )
+        if updated:
+            self.assigned[category.id] += updated
+        return True
+
+
+def apply_rules_pushdown(
+    user_id: str, rules, categories: dict, qs, by_import: Counter = None
+) -> int:
+    """
+    Apply `rules` (in priority order) to the uncategorised rows of `qs` with
+    one UPDATE per rule. Returns the number of rows categorised.
+    """
+    run = PushdownRun(categories, by_import)
+    with transaction.atomic():
+        fill_description_norm(qs)
+        # narrowed by every rule that claims rows without categorising them
+        remaining = qs.filter(category__isnull=True)
+
+        pending = []  # consecutive rules evaluated in Python
+        for rule in list(rules) + [None]:
+            condition = rule_condition(rule) if rule is not None else None
+            if rule is not None and condition is None:
+                pending.append(rule)
+                continue
+
+            if pending:
+                by_rule = {}
+                for txn_id, idx in python_matches(pending, remaining).items():
+                    by_rule.setdefault(idx, []).append(txn_id)
+                claimed_ids = []
+                for idx, ids in by_rule.items():
+                    for i in range(0, len(ids), ID_CHUNK):
+                        chunk = remaining.filter(pk__in=ids[i : i + ID_CHUNK])
+                        if not run.categorise(chunk, pending[idx]):
+                            claimed_ids += ids
+                            break
+                if claimed_ids:
+                    remaining = remaining.exclude(pk__in=claimed_ids)
+                pending = []
+
+            if rule is None:
+                break
+            if not run.categorise(remaining.filter(condition), rule):
+                remaining = remaining.exclude(condition)
+
+        updated = sum(run.assigned.values())
+        if updated:
+            run.delta.apply(user_id)
+            bump_data_version(user_id)
+        for category_id, n in run.assigned.items():
+            Category.objects.filter(id=category_id).update(
+                reference_count=F("reference_count") + n
+            )
+    return updated
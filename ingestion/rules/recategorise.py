@@ -0,0 +1,95 @@
+"""
+Targeted recategorisation after a rule changes.
+
+Transactions record the rule (and rule version) that categorised them.
+When a rule is edited, disabled or deleted, only its own transactions
+whose recorded version is no longer current are re-evaluated, plus the
+uncategorised rows its (new) pattern could match. Rows categorised by
+hand, by another rule or before provenance was recorded are left alone.
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from ingestion.dashboard.cache import bump_data_version
+from ingestion.dashboard.rollup import RollupDelta
+from ingestion.models import Category, Rule, Transaction
+from .pushdown import fill_description_norm, rule_condition
+from .utils import apply_rules_for_user
+
+BATCH_SIZE = 1000
+
+
+def stale_transactions(user_id: str, rule_id):
+    """The user's rows categorised by `rule_id` in a version that no longer applies."""
+    qs = Transaction.objects.filter(user_id=user_id, rule_id=rule_id)
+    rule = Rule.objects.filter(id=rule_id, enabled=True).first()
+    if rule is not None:
+        qs = qs.exclude(rule_version=rule.version)
+    return qs, rule
+
+
+def uncategorise(txns: list[Transaction]):
+    """Drop the rule's categories from `txns`, with rollup and reference counts."""
+    delta = RollupDelta()
+    released = Counter()
+    for txn in txns:
+        delta.move_txn(txn, txn.category_id, None)
+        released[txn.category_id] += 1
+        txn.category_id = txn.rule_id = txn.rule_version = None
+    Transaction.objects.bulk_update(txns, ["category", "rule_id", "rule_version"])
+    delta.apply(txns[0].user_id)
+    for category_id, n in released.items():
+        Category.objects.filter(id=category_id).update(
+            reference_count=F("reference_count") - n
+        )
+
+
+def _id_batches(qs, batch_size):
+    """Ids of `qs` in keyset batches, re-evaluating the query for every batch."""
+    last_id = None
+    while True:
+        page = qs if last_id is None else qs.filter(id__gt=last_id)
+        ids = list(page.order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def recategorise_for_rule(user_id: str, rule_id, batch_size=BATCH_SIZE) -> int:
+    """
+    Re-evaluate every rule on the rows `rule_id` touched and on the
+    uncategorised rows it can match now. Every batch commits on its own.
+    Returns the number of rows categorised afresh.
+    """
+    stale, rule = stale_transactions(user_id, rule_id)
+    categorised = 0
+    for ids in _id_batches(stale, batch_size):
+        with transaction.atomic():
+            txns = list(
+                Transaction.objects.select_for_update().filter(
+                    id__in=ids, rule_id=rule_id
+                )
+            )
+            if txns:
+                uncategorise(txns)
+                categorised += apply_rules_for_user(
+                    user_id, transaction_ids=ids, pushdown=False
+                )
+                bump_data_version(user_id)
+
+    if rule is not None:
+        candidates = Transaction.objects.filter(user_id=user_id, category__isnull=True)
+        fill_description_norm(candidates)
+        condition = rule_condition(rule)
+        if condition is not None:
+            candidates = candidates.filter(condition)
+        for ids in _id_batches(candidates, batch_size):
+            # rows no rule matches stay uncategorised, so page past them
+            categorised += apply_rules_for_user(
+                user_id, transaction_ids=ids, pushdown=False
+            )
+    return categorised
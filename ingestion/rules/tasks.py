@@ -1,9 +1,84 @@
+import logging
+from collections import Counter
+
 from celery import shared_task
+from django.db.models import F
+from ingestion.coalesce import DEBOUNCE_SECONDS, UserLocked, start_pending, user_lock
+from ingestion.models import FileImport
+from ingestion.transactions.transfers import detect_transfers
+from .recategorise import recategorise_for_rule
 from .utils import apply_rules_for_user
 
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=None)
+def apply_rules_task(self, user_id: str, import_id=None, transaction_ids=None):
+    """
+    Without `import_id`/`transaction_ids` this is a full-user pass over all
+    uncategorized transactions; otherwise only the given rows are evaluated.
+
+    Runs are serialized per user. Full passes are what coalesced triggers
+    (ingestion.coalesce.dispatch) queue: a run marks the pending trigger as
+    started before reading, so every trigger up to that point is covered.
+    """
+    try:
+        with user_lock(self, user_id):
+            if import_id is None and transaction_ids is None:
+                start_pending(self, user_id)
+            by_import = Counter()
+            count = apply_rules_for_user(
+                user_id,
+                import_id=import_id,
+                transaction_ids=transaction_ids,
+                by_import=by_import,
+            )
+    except UserLocked:
+        # another run for this user is in progress; try again after it
+        raise self.retry(countdown=DEBOUNCE_SECONDS)
+
+    for file_import_id, n in by_import.items():
+        FileImport.objects.filter(id=file_import_id).update(
+            rows_categorised=F("rows_categorised") + n
+        )
+    scope = f"import={import_id}" if import_id else "all uncategorized"
+    if transaction_ids is not None:
+        scope = f"{len(transaction_ids)} transactions"
+    logger.info(
+        f"Applied rules for user={user_id} ({scope}), categorized {count} transactions."
+    )
+    return count
+
+
+@shared_task(bind=True, max_retries=None)
+def recategorise_rule_task(self, user_id: str, rule_id: str):
+    """Re-evaluate the transactions a created, edited or deleted rule affects."""
+    try:
+        # serialized with the user's other rule runs
+        with user_lock(apply_rules_task, user_id):
+            count = recategorise_for_rule(user_id, rule_id)
+    except UserLocked:
+        raise self.retry(countdown=DEBOUNCE_SECONDS)
+    logger.info(
+        f"Recategorised for rule={rule_id} user={user_id}: {count} transactions."
+    )
+    return count
+
 
-@shared_task
-def apply_rules_task(user_id: str):
-    count = apply_rules_for_user(user_id)
-    print(f"Applied rules for user={user_id}, categorized {count} transactions.")
+@shared_task(bind=True, max_retries=None)
+def detect_transfers_task(self, user_id: str, import_id=None):
+    """
+    Mark transfers between the user's accounts: the rows of `import_id`
+    against the rest, or every row without it (see transactions.transfers).
+    """
+    try:
+        # is_transfer and category move the same rollup buckets
+        with user_lock(apply_rules_task, user_id):
+            count = detect_transfers(user_id, import_id=import_id)
+    except UserLocked:
+        raise self.retry(countdown=DEBOUNCE_SECONDS)
+    scope = f"import={import_id}" if import_id else "all transactions"
+    logger.info(
+        f"Detected transfers for user={user_id} ({scope}): marked {count} rows."
+    )
     return count
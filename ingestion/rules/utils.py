@@ -1,103 +1,188 @@
-import re
-from ingestion.models import Rule, RuleMatchType, Transaction, Category
-from django.db.models import Q
+from collections import Counter
 
+from django.conf import settings
 
-def apply_rules_for_user(user_id: str) -> int:
+from ingestion.models import Rule, Transaction, Category
+from django.db import transaction
+from django.db.models import F, Q
+from ingestion.dashboard.cache import bump_data_version
+from ingestion.dashboard.rollup import RollupDelta
+from ingestion.transactions.normalize import normalize_description
+from .memo import memo_for
+from .pushdown import apply_rules_pushdown
+
+
+def enabled_rules(user_id: str) -> list[Rule]:
+    """The user's and the default enabled rules, in order of priority."""
+    return list(
+        Rule.objects.filter(
+            Q(user_id=user_id) | Q(user_id="default"), enabled=True
+        ).order_by("priority")
+    )
+
+
+def category_map(user_id: str) -> dict[str, Category]:
+    """Categories a rule of the user may point to, by str(UUID)."""
+    return {
+        str(cat.id): cat
+        for cat in Category.objects.filter(Q(user_id=user_id) | Q(user_id="default"))
+    }
+
+
+def rule_text(txn) -> str:
+    """
+    The normalised text rules are matched against: description_norm, or
+    computed for rows (or parsed dicts) that do not have it yet.
+    """
+    if isinstance(txn, dict):
+        return txn.get("description_norm") or normalize_description(
+            txn.get("description_raw"), txn.get("counterparty")
+        )
+    return txn.description_norm or normalize_description(
+        txn.description_raw, txn.counterparty
+    )
+
+
+class ImportCategoriser:
+    """
+    Categorises parsed rows before they are inserted (the fused ingestion
+    pipeline), with the same first-match semantics as apply_rules_for_user.
+    Rules and categories are loaded once per import; matches go through the
+    ruleset's memo (ingestion.rules.memo).
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        rules = enabled_rules(user_id)
+        self.ruleset = memo_for(rules) if rules else None
+        self.categories = category_map(user_id) if rules else {}
+        self.assigned = Counter()  # category id -> rows
+
+    def __call__(self, rows: list[dict]) -> int:
+        """Set `category_id` on the rows a rule matches; returns how many."""
+        if self.ruleset is None:
+            return 0
+        categories = self.categories
+        matched = self.ruleset.match_many(
+            [(rule_text(r), r["amount"], r.get("merchant_id")) for r in rows]
+        )
+        count = 0
+        for row, rule in zip(rows, matched):
+            if rule is None:
+                continue
+            category = categories.get(str(rule.action_set_category))
+            if category:
+                row["category_id"] = category.id
+                row["rule_id"], row["rule_version"] = rule.id, rule.version
+                self.assigned[category.id] += 1
+                count += 1
+        return count
+
+    def save_reference_counts(self):
+        """Add the categories assigned since the last call to their counts."""
+        for category_id, n in self.assigned.items():
+            Category.objects.filter(id=category_id).update(
+                reference_count=F("reference_count") + n
+            )
+        self.assigned.clear()
+
+
+def apply_rules_for_user(
+    user_id: str,
+    import_id=None,
+    transaction_ids=None,
+    by_import: Counter = None,
+    pushdown: bool | None = None,
+) -> int:
     """
     Apply all enabled rules for a user to their uncategorized transactions.
 
+    By default every uncategorized transaction of the user is evaluated
+    (full pass, used by reapply-rules). Passing `import_id` or
+    `transaction_ids` restricts the run to those rows, e.g. to the rows a
+    fresh import just inserted.
+
     Each rule can match by:
       - CONTAINS: substring match (case-insensitive)
       - REGEX: regular expression
       - EQUALS: exact string match
       - AMOUNT_RANGE: numeric range match, e.g. "-10000,0"
+      - MERCHANT: the transaction's canonical merchant, e.g. "Lidl"
+
+    The rules are compiled once into a CompiledRuleSet; the first matching
+    rule by priority wins. Results are memoised per normalised text (see
+    ingestion.rules.memo), so repeated merchant texts are matched once.
+    Reference counts are incremented in the database (F expressions), so
+    concurrent categorisation does not lose updates.
+    `by_import`, if given, is filled with the categorised rows per import.
+
+    With `pushdown` (by default: from RULES_PUSHDOWN_MIN_ROWS uncategorised
+    rows on) the rules run as set-based UPDATEs instead, see
+    ingestion.rules.pushdown; the result is the same.
 
     Returns:
         int: number of transactions updated
     """
     # Fetch enabled rules in order of priority
-    rules = list(
-        Rule.objects.filter(
-            Q(user_id=user_id) | Q(user_id="default"), enabled=True
-        ).order_by("priority")
-    )
-
-    # Fetch uncategorized transactions
-    txns = list(Transaction.objects.filter(user_id=user_id, category__isnull=True))
+    rules = enabled_rules(user_id)
+
+    # Fetch uncategorized transactions (optionally scoped)
+    qs = Transaction.objects.filter(user_id=user_id, category__isnull=True)
+    if import_id is not None:
+        qs = qs.filter(import_file_id=import_id)
+    if transaction_ids is not None:
+        qs = qs.filter(id__in=transaction_ids)
+    if not rules:
+        return 0
+    if pushdown is None:
+        pushdown = qs.count() >= settings.RULES_PUSHDOWN_MIN_ROWS
+    if pushdown:
+        return apply_rules_pushdown(
+            user_id, rules, category_map(user_id), qs, by_import=by_import
+        )
+    txns = list(qs)
     if not txns or not rules:
         return 0
 
     updated_count = 0
 
     # Preload category mapping (UUID -> Category)
-    category_map = {
-        str(cat.id): cat
-        for cat in Category.objects.filter(Q(user_id=user_id) | Q(user_id="default"))
-    }
+    categories = category_map(user_id)
 
-    # Track which categories need updating
-    updated_categories = set()
-
-    for txn in txns:
-        text = f"{txn.description_raw or ''} {txn.counterparty or ''}".lower()
-
-        for rule in rules:
-            # --- match by text patterns ---
-            if (
-                rule.match_type == RuleMatchType.CONTAINS
-                and rule.match_value.lower() in text
-            ):
-                category = category_map.get(str(rule.action_set_category))
-                if category:
-                    txn.category = category
-                    updated_count += 1
-                    category.reference_count += 1
-                    updated_categories.add(category)
-                break
-
-            elif rule.match_type == RuleMatchType.REGEX and re.search(
-                rule.match_value, text, re.I
-            ):
-                category = category_map.get(str(rule.action_set_category))
-                if category:
-                    txn.category = category
-                    updated_count += 1
-                    category.reference_count += 1
-                    updated_categories.add(category)
-                break
-
-            elif (
-                rule.match_type == RuleMatchType.EQUALS
-                and text.strip() == rule.match_value.lower()
-            ):
-                category = category_map.get(str(rule.action_set_category))
-                if category:
-                    txn.category = category
-                    updated_count += 1
-                    category.reference_count += 1
-                    updated_categories.add(category)
-                break
-
-            # --- match by numeric range ---
-            elif rule.match_type == RuleMatchType.AMOUNT_RANGE:
-                try:
-                    lo, hi = map(float, rule.match_value.split(","))
-                    if lo <= float(txn.amount) <= hi:
-                        category = category_map.get(str(rule.action_set_category))
-                        if category:
-                            txn.category = category
-                            updated_count += 1
-                            category.reference_count += 1
-                            updated_categories.add(category)
-                        break
-                except Exception:
-                    continue
-
-    if updated_count:
-        Transaction.objects.bulk_update(txns, ["category"])
-
-    if updated_categories:
-        Category.objects.bulk_update(updated_categories, ["reference_count"])
+    # Track which rows and categories need updating
+    changed = []
+    assigned = Counter()
+    delta = RollupDelta()
+
+    matched = memo_for(rules).match_many(
+        [(rule_text(t), t.amount, t.merchant_id) for t in txns]
+    )
+    for txn, rule in zip(txns, matched):
+        if rule is None:
+            continue
+
+        category = categories.get(str(rule.action_set_category))
+        if category:
+            txn.category = category
+            txn.rule_id, txn.rule_version = rule.id, rule.version
+            delta.move_txn(txn, None, category.id)
+            changed.append(txn)
+            updated_count += 1
+            assigned[category.id] += 1
+            if by_import is not None:
+                by_import[txn.import_file_id] += 1
+
+    with transaction.atomic():
+        if updated_count:
+            Transaction.objects.bulk_update(
+                changed, ["category", "rule_id", "rule_version"], batch_size=1000
+            )
+            delta.apply(user_id)
+            bump_data_version(user_id)
+
+        for category_id, n in assigned.items():
+            Category.objects.filter(id=category_id).update(
+                reference_count=F("reference_count") + n
+            )
 
     return updated_count
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from .models import FileImport
 from ingestion.models import Category, Transaction, Rule
 
+
 class FileImportSerializer(serializers.ModelSerializer):
     class Meta:
         model = FileImport
@@ -13,11 +14,39 @@ class FileImportSerializer(serializers.ModelSerializer):
             "checksum_sha256",
             "size_bytes",
             "storage_path",
+            "bytes_parsed",
+            "rows_parsed",
+            "rows_inserted",
+            "rows_deduplicated",
+            "rows_rejected",
+            "rows_categorised",
             "created_at",
             "updated_at",
         )
 
 
+IMPORT_STATUS_FIELDS = (
+    "id",
+    "status",
+    "error_message",
+    "size_bytes",
+    "bytes_parsed",
+    "rows_parsed",
+    "rows_inserted",
+    "rows_deduplicated",
+    "rows_rejected",
+    "rows_categorised",
+    "updated_at",
+)
+
+
+class FileImportStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FileImport
+        fields = IMPORT_STATUS_FIELDS
+        read_only_fields = IMPORT_STATUS_FIELDS
+
+
 class ImportUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
 
@@ -45,6 +74,47 @@ class TransactionSerializer(serializers.ModelSerializer):
         ]
 
 
+# Columns read by the list fast path, category joined in the same query.
+TRANSACTION_LIST_VALUES = (
+    "id",
+    "booking_date",
+    "amount",
+    "currency",
+    "description_raw",
+    "counterparty",
+    "category_id",
+    "category__name",
+    "category__type",
+    "category__reference_count",
+)
+
+
+def transaction_values_to_dict(row: dict) -> dict:
+    """
+    Same output as TransactionSerializer, built from a values() row without
+    instantiating models. id/booking_date are left for the renderer.
+    """
+    category_id = row["category_id"]
+    return {
+        "id": row["id"],
+        "booking_date": row["booking_date"],
+        "amount": str(row["amount"]),
+        "currency": row["currency"],
+        "description_raw": row["description_raw"],
+        "counterparty": row["counterparty"],
+        "category": (
+            {
+                "id": category_id,
+                "name": row["category__name"],
+                "type": row["category__type"],
+                "reference_count": row["category__reference_count"],
+            }
+            if category_id is not None
+            else None
+        ),
+    }
+
+
 class RuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rule
@@ -58,7 +128,8 @@ class RuleSerializer(serializers.ModelSerializer):
             "match_value",
             "action_set_category",
             "action_mark_transfer",
+            "version",
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ("id", "created_at", "updated_at", "user_id")
+        read_only_fields = ("id", "version", "created_at", "updated_at", "user_id")
@@ -1,69 +1,164 @@
+from dataclasses import asdict, fields
+from itertools import islice
+
 from celery import shared_task
 from django.db import transaction
-from .models import FileImport, FileStatus, FileAdapter, FileSource
-import time
-from ingestion.imports.detect import detect_profile, UnknownProfileError
-from ingestion.imports.factory import get_adapter
+from django.db.models import Count, F
+from .models import Category, FileStatus, Transaction
+from ingestion.imports import state
+from ingestion.imports.adapters.base import ImportProgress
+from ingestion.imports.detect import DETECT_SAMPLE_BYTES, UnknownProfileError
+from ingestion.imports.parallel import parse_parallel
+from ingestion.imports.registry import detect_profile, get_adapter
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from pathlib import Path
-from ingestion.transactions.tasks import deduplicate_transactions
-from ingestion.rules.tasks import apply_rules_task
-
+from ingestion.rules.tasks import apply_rules_task, detect_transfers_task
+from ingestion.rules.utils import ImportCategoriser
+from ingestion.reports.tasks import render_report_task  # registers the task
+from ingestion.dashboard import rollup
+from ingestion.dashboard.cache import bump_data_version
 
 logger = get_task_logger(__name__)
 
 
-@shared_task
-def parse_import_task(import_id: str):
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=None)
+def parse_import_task(self, import_id: str):
+    """
+    Parse, categorise and insert an import in committed batches.
+
+    The task is acknowledged only when it finishes, so a worker that dies
+    mid-import gets its task redelivered. The redelivery comes right away,
+    while the dead claim's heartbeat is still fresh; it retries until the
+    heartbeat is stale (or the import finished, if the worker was alive),
+    then reclaims the import and resumes after the last committed batch
+    (see ingestion.imports.state).
+    """
     logger.info(f"Starting parse_import_task for import_id={import_id}")
-    try:
-        with transaction.atomic():
-            fi = FileImport.objects.select_for_update().get(id=import_id)
-            fi.status = FileStatus.PROCESSING
-            fi.save(update_fields=["status"])
-            logger.info(f"Set status=PROCESSING for {fi.id}")
+    fi = state.claim(import_id)
+    if fi is None:
+        if state.processing(import_id):
+            logger.info(f"Import {import_id} is claimed, checking again later")
+            raise self.retry(countdown=settings.IMPORT_STALE_AFTER)
+        logger.info(f"Import {import_id} is not claimable, skipping")
+        return
+    logger.info(f"Claimed {fi.id} (attempt {fi.attempts})")
 
-            file_path = Path(settings.MEDIA_ROOT) / fi.storage_path
-            with open(file_path, "rb") as f:
-                raw_bytes = f.read()
-            logger.info(f"Read {len(raw_bytes)} bytes from {fi.storage_path}")
+    try:
+        file_path = Path(settings.MEDIA_ROOT) / fi.storage_path
+        with open(file_path, "rb") as f:
+            sample = f.read(DETECT_SAMPLE_BYTES)
+            logger.info(f"Read {len(sample)} byte sample from {fi.storage_path}")
 
             try:
-                profile = detect_profile(raw_bytes)
+                profile = detect_profile(sample)
                 logger.info(f"Detected profile: {profile}")
             except UnknownProfileError as e:
-                fi.status = FileStatus.FAILED
-                fi.error_message = str(e)
-                fi.save(update_fields=["status", "error_message"])
+                state.finish(fi, FileStatus.FAILED, error_message=str(e))
                 logger.error(f"Unknown profile: {e}")
                 return
 
-            fi.adapter_hint = FileAdapter.CSV
-            fi.source_hint = FileSource.OTP if profile == "OTP" else FileSource.REVOLUT
-            fi.save(update_fields=["adapter_hint", "source_hint"])
+            state.heartbeat(
+                fi, adapter_hint=profile.adapter, source_hint=profile.source
+            )
+
+            # the profile carries encoding, delimiter and header map
+            adapter_class = get_adapter(profile.adapter, profile.source)
+            adapter = adapter_class(f, fi.user_id, fi.id, profile=profile)
 
-            adapter_class = get_adapter(fi.adapter_hint, fi.source_hint)
-            adapter = adapter_class(raw_bytes, fi.user_id, fi.id)
+            # fused: rows are categorised per batch and inserted with their
+            # category; staged: apply_rules_task categorises them afterwards
+            fused = settings.INGEST_PIPELINE == "fused"
+            categoriser = ImportCategoriser(fi.user_id) if fused else None
 
-            transactions = adapter.parse()
-            logger.info(f"Parsed {len(transactions)} transactions.")
+            def report_progress(progress, inserted):
+                # runs in the batch's transaction: rows, counters, rollups
+                # and reference counts commit together
+                state.heartbeat(fi, **asdict(progress))
+                rollup.add_transactions(
+                    fi.user_id,
+                    # not the rows a concurrent import inserted first
+                    Transaction.objects.filter(id__in=[t.id for t in inserted]),
+                )
+                if categoriser is not None:
+                    categoriser.save_reference_counts()
 
-            adapter.bulk_insert(transactions)
-            logger.info(f"Inserted transactions into database.")
+            # parse() is a generator: rows are inserted batch by batch,
+            # duplicates are dropped by the (user_id, fingerprint) index
+            workers = settings.INGEST_PARALLEL_WORKERS
+            if (
+                adapter.splittable
+                and workers > 1
+                and (fi.size_bytes or 0) >= settings.INGEST_PARALLEL_MIN_BYTES
+            ):
+                logger.info(f"Parsing {fi.id} with {workers} processes")
+                rows = parse_parallel(adapter, file_path, workers)
+            else:
+                rows = adapter.parse()
 
-            deduplicate_transactions.delay(fi.user_id)
-            logger.info(f"Triggered deduplication task for user {fi.user_id}")
+            # parsing is deterministic: a resumed import skips the rows of
+            # the batches an earlier attempt committed
+            progress = ImportProgress(
+                **{
+                    field.name: getattr(fi, field.name)
+                    for field in fields(ImportProgress)
+                }
+            )
+            if progress.rows_parsed:
+                logger.info(f"Resuming {fi.id} after {progress.rows_parsed} rows")
+                rows = islice(rows, progress.rows_parsed, None)
+            adapter.bulk_insert(
+                rows,
+                on_batch=report_progress,
+                categorise=categoriser,
+                progress=progress,
+            )
+            logger.info(
+                f"Parsed {progress.rows_parsed} rows, inserted "
+                f"{progress.rows_inserted}, rejected {adapter.rows_rejected}."
+            )
 
-            apply_rules_task.delay(fi.user_id)
-            logger.info(f"Triggered apply_rules_task for user {fi.user_id}")
+        state.finish(fi, FileStatus.PARSED, rows_rejected=adapter.rows_rejected)
+        bump_data_version(fi.user_id)
 
-            fi.status = FileStatus.PARSED
-            fi.save(update_fields=["status"])
-            logger.info(f"Task completed successfully for {fi.id}")
+        if not fused:
+            # scoped to this import's rows; only full reapply passes coalesce
+            apply_rules_task.delay(fi.user_id, import_id=str(fi.id))
+            logger.info(f"Triggered apply_rules_task for import {fi.id}")
+        # pair the new rows with the user's other statements
+        detect_transfers_task.delay(fi.user_id, str(fi.id))
+        logger.info(f"Task completed successfully for {fi.id}")
+
+    except state.ImportNotClaimed:
+        logger.warning(f"Import {fi.id} was reclaimed by another worker, stopping")
 
     except Exception as e:
         logger.exception(f"parse_import_task failed for {import_id}")
-        FileImport.objects.filter(id=import_id).update(
-            status=FileStatus.FAILED, error_message=str(e)
+        with transaction.atomic():
+            try:
+                state.finish(fi, FileStatus.FAILED, error_message=str(e))
+            except state.ImportNotClaimed:
+                return
+            # the import is all or nothing: drop the batches committed so far
+            discard_rows(fi)
+
+
+def discard_rows(fi):
+    """
+    Delete the rows a failed import committed, with what each batch counted
+    for them: rollups and category reference counts.
+    """
+    rows = Transaction.objects.filter(import_file_id=fi.id)
+    categorised = (
+        rows.filter(category__isnull=False)
+        .values("category_id")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    for r in categorised:
+        Category.objects.filter(id=r["category_id"]).update(
+            reference_count=F("reference_count") - r["n"]
         )
+    rollup.remove_transactions(fi.user_id, rows)
+    rows.delete()
+    bump_data_version(fi.user_id)
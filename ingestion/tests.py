@@ -1,3 +1,1688 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from importlib import import_module
+from pathlib import Path
+from unittest import mock
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from ingestion.imports.adapters.ofx import OfxAdapter
+from ingestion.imports.adapters.otp_csv import OtpCsvAdapter
+from ingestion.imports.adapters.qif import QifAdapter
+from ingestion.imports.adapters.revolut_csv import RevolutCsvAdapter
+from ingestion import coalesce
+from ingestion.imports import state
+from ingestion.imports.detect import UnknownProfileError, sniff_encoding
+from ingestion.imports.parallel import parse_parallel, split_records
+from ingestion.imports.registry import detect_profile, get_adapter
+from ingestion.imports.schema import infer_number_format
+from ingestion.dashboard import rollup
+from ingestion.models import (
+    Category,
+    FileImport,
+    FileStatus,
+    Merchant,
+    MonthlyRollup,
+    Report,
+    ReportStatus,
+    Rule,
+    RuleMatchType,
+    Transaction,
+)
+from ingestion.reports.tasks import render_report_task
+from ingestion.reports.views import monthly_report, report_status
+from ingestion.rules.engine import CompiledRuleSet
+from ingestion.rules.factory import seed_default_rules
+from ingestion.rules.memo import RuleMemo, memo_for
+from ingestion.rules.recategorise import recategorise_for_rule
+from ingestion.rules.tasks import apply_rules_task
+from ingestion.rules.utils import ImportCategoriser, apply_rules_for_user
+from ingestion.serializers import TransactionSerializer
+from ingestion.tasks import parse_import_task
+from ingestion.transactions.merchants import ensure_merchant, row_merchant_key
+from ingestion.transactions.normalize import normalize_description
+from ingestion.transactions.transfers import detect_transfers
+from ingestion.utils import EVENTS_TOKEN_MAX_AGE
+from ingestion.views import (
+    ImportViewSet,
+    RuleViewSet,
+    TransactionViewSet,
+    cashflow_view,
+    category_coverage,
+    dashboard_bundle,
+    top_merchants_view,
+)
+
+USER_ID = "test-user"
+
+REVOLUT_HEADER = (
+    "Type,Product,Started Date,Completed Date,Description,Amount,Fee,"
+    "Currency,State,Balance\n"
+)
+
+
+def revolut_row(i: int) -> str:
+    return (
+        f"CARD_PAYMENT,Current,2024-01-01 10:00:00,2024-01-{i % 28 + 1:02d},"
+        f"Lidl {i},-{i % 500 + 1}.50,0.00,EUR,COMPLETED,100.00\n"
+    )
+
+
+def otp_headerless_row(i: int) -> str:
+    return (
+        f'"11773016123456780000";"T";"-{i % 900 + 1},00";"HUF";'
+        f'"202401{i % 28 + 1:02d}";"202401{i % 28 + 1:02d}";"";"";'
+        f'"SPAR {i}";"Vásárlás {i}";"";"";"REF{i}";""\n'
+    )
+
+
+AUTH_HEADERS = {"HTTP_X_USER_ID": USER_ID, "HTTP_AUTHORIZATION": "Bearer test"}
+
+
+def make_import(**kwargs) -> FileImport:
+    defaults = {
+        "user_id": USER_ID,
+        "original_name": "statement.csv",
+        "storage_path": f"imports/{uuid.uuid4()}.csv",
+    }
+    defaults.update(kwargs)
+    return FileImport.objects.create(**defaults)
+
+
+class CsvAdapterParseTests(TestCase):
+    def test_otp_headerless(self):
+        raw = "".join(otp_headerless_row(i) for i in range(3)).encode("utf-8")
+        rows = list(OtpCsvAdapter(raw, USER_ID, uuid.uuid4()).parse())
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["amount"], Decimal("-1.00"))
+        self.assertEqual(rows[0]["booking_date"], date(2024, 1, 1))
+        self.assertEqual(rows[0]["counterparty"], "SPAR 0")
+        self.assertEqual(rows[0]["description_raw"], "Vásárlás 0")
+
+    def test_otp_with_headers(self):
+        raw = (
+            "Könyvelés dátuma;Összeg;Devizanem;Közlemény;Ellenoldal neve\n"
+            "2024.02.03;-1500,50;huf;Kávé;Starbucks\n"
+        ).encode("utf-8-sig")
+        rows = list(OtpCsvAdapter(raw, USER_ID, uuid.uuid4()).parse())
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["amount"], Decimal("-1500.50"))
+        self.assertEqual(rows[0]["currency"], "HUF")
+        self.assertEqual(rows[0]["booking_date"], date(2024, 2, 3))
+
+    def test_revolut(self):
+        raw = (REVOLUT_HEADER + revolut_row(1)).encode("utf-8")
+        rows = list(RevolutCsvAdapter(raw, USER_ID, uuid.uuid4()).parse())
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["amount"], Decimal("-2.50"))
+        self.assertEqual(rows[0]["description_raw"], "Lidl 1")
+
+    def test_schema_inferred_once_per_file(self):
+        raw = (
+            "Könyvelés dátuma;Összeg;Devizanem;Közlemény;Ellenoldal neve\n"
+            "03.02.2024 10:15;-1 500,50;huf;Kávé;Starbucks\n"
+            "04.02.2024 08:00;12 000;huf;Fizetés;Cég\n"
+        ).encode("utf-8")
+        adapter = OtpCsvAdapter(raw, USER_ID, uuid.uuid4())
+        rows = list(adapter.parse())
+        self.assertEqual(
+            (
+                adapter.schema.date_format,
+                adapter.schema.decimal_separator,
+                adapter.schema.thousands_separator,
+            ),
+            ("%d.%m.%Y", ",", " "),
+        )
+        self.assertEqual(
+            [(r["booking_date"], r["amount"]) for r in rows],
+            [
+                (date(2024, 2, 3), Decimal("-1500.50")),
+                (date(2024, 2, 4), Decimal("12000")),
+            ],
+        )
+
+    def test_number_format_inference(self):
+        cases = [
+            (["-1500,50", "12"], ","),
+            (["1,234.56", "-7.00"], "."),
+            (["1.234,56"], ","),
+            (["12", "100"], "."),
+        ]
+        for values, decimal_sep in cases:
+            self.assertEqual(infer_number_format(values)[0], decimal_sep, values)
+        self.assertEqual(infer_number_format(["1.234,56"]), (",", "."))
+
+    def test_rejected_rows_are_counted(self):
+        raw = (
+            REVOLUT_HEADER
+            + revolut_row(1)
+            + "CARD_PAYMENT,Current,,2024-01-02,Lidl,n/a,0.00,EUR,COMPLETED,1\n"
+            + revolut_row(2)
+        ).encode("utf-8")
+        adapter = RevolutCsvAdapter(raw, USER_ID, uuid.uuid4())
+        rows = list(adapter.parse())
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(adapter.rows_rejected, 1)
+
+        short = otp_headerless_row(0) + '"11773016123456780000";"T";"-1,00"\n'
+        adapter = OtpCsvAdapter(short.encode(), USER_ID, uuid.uuid4())
+        self.assertEqual(len(list(adapter.parse())), 1)
+        self.assertEqual(adapter.rows_rejected, 1)
+
+
+class ProfileDetectionTests(TestCase):
+    OTP_HEADER = "Könyvelés dátuma;Összeg;Devizanem;Közlemény;Ellenoldal neve\n"
+
+    def test_detects_each_adapter_from_sample(self):
+        cases = [
+            ((REVOLUT_HEADER + revolut_row(1)).encode(), "revolut", ",", True),
+            ((self.OTP_HEADER + "2024.02.03;-1;huf;x;y\n").encode(), "otp", ";", True),
+            (
+                "".join(otp_headerless_row(i) for i in range(3)).encode(),
+                "otp",
+                ";",
+                False,
+            ),
+        ]
+        for raw, source, delimiter, has_header in cases:
+            profile = detect_profile(raw)
+            self.assertEqual(
+                (
+                    profile.adapter,
+                    profile.source,
+                    profile.delimiter,
+                    profile.has_header,
+                ),
+                ("csv", source, delimiter, has_header),
+            )
+            self.assertEqual(
+                get_adapter(profile.adapter, profile.source).source, source
+            )
+        self.assertEqual(
+            detect_profile(cases[0][0]).header_map["booking_date"], "Completed Date"
+        )
+        with self.assertRaises(UnknownProfileError):
+            detect_profile(b"just some text\nnot a statement\n")
+
+    def test_central_european_charsets(self):
+        row = "2024.02.03;-1500,50;HUF;Kávé – ősz;Főnix\n"
+        for encoding, expected in [("cp1250", "cp1250"), ("iso8859_2", "iso8859_2")]:
+            text = self.OTP_HEADER + (
+                row if encoding == "cp1250" else row.replace("–", "-")
+            )
+            raw = text.encode(encoding)
+            self.assertEqual(sniff_encoding(raw), expected)
+            profile = detect_profile(raw)
+            rows = list(OtpCsvAdapter(raw, USER_ID, uuid.uuid4(), profile).parse())
+            self.assertEqual(rows[0]["counterparty"], "Főnix")
+            self.assertTrue(rows[0]["description_raw"].startswith("Kávé"))
+        # a multi-byte character cut off by the sample boundary is still utf-8
+        self.assertEqual(sniff_encoding("ősz".encode()[:-1]), "utf-8-sig")
+
+
+class OfxQifAdapterTests(TestCase):
+    IMPORT_ID = uuid.uuid4()
+    OFX_SGML = (
+        "OFXHEADER:100\nDATA:OFXSGML\nCHARSET:1252\n\n"
+        "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>EUR<BANKTRANLIST>\n"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240105120000[+1:CET]"
+        "<TRNAMT>-12.50<FITID>1<NAME>Lidl &amp; Co<MEMO>Card payment</STMTTRN>\n"
+        "<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240106<TRNAMT>100<FITID>2"
+        "<NAME>Salary</STMTTRN>\n"
+        "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n"
+    )
+    OFX_XML = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<?OFX OFXHEADER="200"?>\n'
+        "<OFX><CREDITCARDMSGSRSV1><CCSTMTTRNRS><CCSTMTRS><CURDEF>HUF</CURDEF>"
+        "<BANKTRANLIST><STMTTRN><TRNTYPE>DEBIT</TRNTYPE>"
+        "<DTPOSTED>20240107</DTPOSTED><TRNAMT>-1500</TRNAMT><FITID>9</FITID>"
+        "<NAME>Spar</NAME></STMTTRN></BANKTRANLIST></CCSTMTRS>"
+        "</CCSTMTTRNRS></CREDITCARDMSGSRSV1></OFX>"
+    )
+    QIF = (
+        "!Type:Bank\nD1/ 5'24\nT-1,234.50\nPLidl\nMWeekly shop\n^\n"
+        "D01/06/2024\nT100.00\nPSalary\n^\n"
+    )
+
+    def parse(self, text, **kwargs):
+        raw = text.encode("utf-8")
+        profile = detect_profile(raw)
+        adapter_class = get_adapter(profile.adapter, profile.source)
+        adapter = adapter_class(raw, USER_ID, self.IMPORT_ID, profile)
+        for name, value in kwargs.items():
+            setattr(adapter, name, value)
+        return adapter_class, list(adapter.parse())
+
+    def test_ofx_sgml_and_xml(self):
+        adapter_class, rows = self.parse(self.OFX_SGML)
+        self.assertIs(adapter_class, OfxAdapter)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["booking_date"], date(2024, 1, 5))
+        self.assertEqual(rows[0]["amount"], Decimal("-12.50"))
+        self.assertEqual(rows[0]["currency"], "EUR")
+        self.assertEqual(rows[0]["counterparty"], "Lidl & Co")
+        self.assertEqual(rows[0]["description_raw"], "Card payment")
+        self.assertEqual(rows[1]["description_raw"], "Salary")
+
+        _, rows = self.parse(self.OFX_XML)
+        self.assertEqual(
+            [(r["amount"], r["currency"], r["counterparty"]) for r in rows],
+            [(Decimal("-1500"), "HUF", "Spar")],
+        )
+
+    def test_ofx_records_split_across_chunks(self):
+        _, whole = self.parse(self.OFX_SGML)
+        for chunk_size in (7, 16, 61):
+            _, rows = self.parse(self.OFX_SGML, chunk_size=chunk_size)
+            self.assertEqual(rows, whole)
+
+    def test_ofx_unclosed_and_lower_case_records(self):
+        _, whole = self.parse(self.OFX_SGML)
+        unclosed = self.OFX_SGML.replace("</STMTTRN>", "")
+        lower = re.sub(r"<(/?)([A-Z.]+)>", lambda m: m.group(0).lower(), unclosed)
+        for text in (unclosed, lower):
+            for chunk_size in (7, 61, 64 * 1024):
+                _, rows = self.parse(text, chunk_size=chunk_size)
+                self.assertEqual(rows, whole)
+
+    def test_ofx_record_size_is_capped(self):
+        raw = self.OFX_SGML.replace("Card payment", "x" * 5000).encode("utf-8")
+        adapter = OfxAdapter(raw, USER_ID, self.IMPORT_ID, detect_profile(raw))
+        adapter.chunk_size, adapter.max_record_chars = 512, 1024
+        rows = list(adapter.parse())
+        self.assertEqual([r["counterparty"] for r in rows], ["Salary"])
+        self.assertEqual(adapter.rows_rejected, 1)
+
+    def test_qif(self):
+        adapter_class, rows = self.parse(self.QIF)
+        self.assertIs(adapter_class, QifAdapter)
+        self.assertEqual(
+            [(r["booking_date"], r["amount"], r["counterparty"]) for r in rows],
+            [
+                (date(2024, 1, 5), Decimal("-1234.50"), "Lidl"),
+                (date(2024, 1, 6), Decimal("100.00"), "Salary"),
+            ],
+        )
+        self.assertEqual(rows[0]["description_raw"], "Weekly shop")
+
+    @override_settings(INGEST_DEFAULT_CURRENCY="EUR")
+    def test_qif_account_blocks(self):
+        account = "!Account\nNChecking\nTBank\n^\n"
+        text = "!Option:AutoSwitch\n" + account + "!Clear:AutoSwitch\n"
+        raw = (text + account + self.QIF).encode("utf-8")
+        adapter = QifAdapter(raw, USER_ID, self.IMPORT_ID, detect_profile(raw))
+        rows = list(adapter.parse())
+        self.assertEqual([r["counterparty"] for r in rows], ["Lidl", "Salary"])
+        self.assertEqual({r["currency"] for r in rows}, {"EUR"})
+        # the account records are not transactions, not rejected ones
+        self.assertEqual(adapter.rows_rejected, 0)
+
+
+class ParallelParseTests(TestCase):
+    IMPORT_ID = uuid.uuid4()
+
+    def assertParallelMatchesSequential(self, adapter_class, raw: bytes):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(raw)
+            f.flush()
+            sequential = list(adapter_class(f, USER_ID, self.IMPORT_ID).parse())
+            adapter = adapter_class(f, USER_ID, self.IMPORT_ID)
+            header, ranges = split_records(f, 700, adapter.profile.has_header)
+            self.assertGreater(len(ranges), 3)
+            for start, end in ranges:
+                f.seek(start)
+                # every range starts at a record boundary
+                self.assertFalse(f.read(end - start).count(b'"') & 1)
+            parallel = list(parse_parallel(adapter, f.name, 2, chunk_bytes=700))
+        self.assertEqual(parallel, sequential)
+        return parallel
+
+    def test_revolut_with_quoted_newlines(self):
+        rows = [revolut_row(i) for i in range(60)]
+        for i in range(0, 60, 7):
+            rows[i] = rows[i].replace(f"Lidl {i},", f'"Lidl {i}\nBudapest, ""HU""",')
+        rows = self.assertParallelMatchesSequential(
+            RevolutCsvAdapter, (REVOLUT_HEADER + "".join(rows)).encode()
+        )
+        self.assertEqual(len(rows), 60)
+        self.assertEqual(rows[7]["description_raw"], 'Lidl 7\nBudapest, "HU"')
+
+    def test_otp_headerless(self):
+        raw = "".join(otp_headerless_row(i) for i in range(40)).encode()
+        rows = self.assertParallelMatchesSequential(OtpCsvAdapter, raw)
+        self.assertEqual(len(rows), 40)
+
+    def test_ranges_use_the_schema_of_the_whole_file(self):
+        # "-2,000" alone reads as a decimal comma; the leading rows settle
+        # that "," is the thousands separator of this file
+        rows = [
+            revolut_row(i).replace(f"-{i % 500 + 1}.50", '"-1,234.50"')
+            for i in range(10)
+        ]
+        rows += [
+            revolut_row(i).replace(f"-{i % 500 + 1}.50", '"-2,000"')
+            for i in range(10, 60)
+        ]
+        rows = self.assertParallelMatchesSequential(
+            RevolutCsvAdapter, (REVOLUT_HEADER + "".join(rows)).encode()
+        )
+        self.assertEqual(rows[-1]["amount"], Decimal("-2000"))
+
+
+class StreamingIngestTests(TestCase):
+    def _ingest_peak(self, n_rows: int) -> tuple[int, int]:
+        """Stream a generated statement into the DB; return (file size, peak)."""
+        fi = make_import()
+        with tempfile.TemporaryFile() as f:
+            f.write(REVOLUT_HEADER.encode("utf-8"))
+            for i in range(n_rows):
+                f.write(revolut_row(i).encode("utf-8"))
+            size = f.tell()
+
+            adapter = RevolutCsvAdapter(f, USER_ID, fi.id)
+            tracemalloc.start()
+            try:
+                inserted = adapter.bulk_insert(adapter.parse())
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        self.assertEqual(adapter.progress.rows_parsed, n_rows)
+        return size, peak
+
+    def test_peak_memory_does_not_grow_with_file_size(self):
+        small_size, small_peak = self._ingest_peak(2_000)
+        large_size, large_peak = self._ingest_peak(16_000)
+
+        self.assertGreater(large_size, 7 * small_size)
+        # bounded by one insert batch, not by the statement
+        self.assertLess(large_peak, small_peak * 1.5)
+        # the larger file repeats the first 2000 rows, which are deduplicated
+        self.assertEqual(Transaction.objects.count(), 16_000)
+
+
+class FingerprintDedupTests(TestCase):
+    def test_reimport_is_dropped_by_unique_index(self):
+        raw = (REVOLUT_HEADER + revolut_row(1) + revolut_row(2)).encode("utf-8")
+        first, second = make_import(), make_import()
+
+        RevolutCsvAdapter(raw, USER_ID, first.id).bulk_insert(
+            RevolutCsvAdapter(raw, USER_ID, first.id).parse()
+        )
+        adapter = RevolutCsvAdapter(raw, USER_ID, second.id)
+        adapter.bulk_insert(adapter.parse())
+
+        self.assertEqual(Transaction.objects.filter(user_id=USER_ID).count(), 2)
+        self.assertFalse(second.transactions.exists())
+        self.assertEqual(Transaction.objects.exclude(fingerprint=None).count(), 2)
+
+    def test_same_rows_for_other_user_are_kept(self):
+        raw = (REVOLUT_HEADER + revolut_row(1)).encode("utf-8")
+        for user_id in (USER_ID, "other-user"):
+            fi = make_import(user_id=user_id)
+            adapter = RevolutCsvAdapter(raw, user_id, fi.id)
+            adapter.bulk_insert(adapter.parse())
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+def naive_first_match(rules, text, amount):
+    """The original rule x transaction loop, kept as the reference."""
+    for rule in rules:
+        if rule.match_type == RuleMatchType.CONTAINS:
+            if rule.match_value.lower() in text:
+                return rule
+        elif rule.match_type == RuleMatchType.REGEX:
+            if re.search(rule.match_value, text, re.I):
+                return rule
+        elif rule.match_type == RuleMatchType.EQUALS:
+            if text.strip() == rule.match_value.lower():
+                return rule
+        elif rule.match_type == RuleMatchType.AMOUNT_RANGE:
+            try:
+                lo, hi = map(float, rule.match_value.split(","))
+            except Exception:
+                continue
+            if lo <= float(amount) <= hi:
+                return rule
+    return None
+
+
+class CompiledRuleSetTests(TestCase):
+    def test_matches_reference_loop(self):
+        words = ["lidl", "spar", "netflix", "bolt", "food", "kft", "budapest", "x"]
+        rules = [
+            Rule(name="a", match_type="contains", match_value="bolt food"),
+            Rule(name="b", match_type="regex", match_value=r"net(flix|fl)"),
+            Rule(name="c", match_type="amount_range", match_value="-5000,-1000"),
+            Rule(name="d", match_type="contains", match_value="food"),
+            Rule(name="e", match_type="equals", match_value="SPAR KFT"),
+            Rule(name="f", match_type="amount_range", match_value="broken"),
+            Rule(name="g", match_type="contains", match_value="Lidl"),
+            Rule(name="h", match_type="regex", match_value=r"^bud"),
+            Rule(name="i", match_type="contains", match_value="ol"),
+        ]
+        ruleset = CompiledRuleSet(rules)
+        rng = random.Random(42)
+        for _ in range(2000):
+            text = " ".join(rng.choices(words, k=rng.randint(1, 4)))
+            amount = Decimal(rng.randint(-8000, 3000))
+            self.assertIs(
+                ruleset.match(text, amount),
+                naive_first_match(rules, text, amount),
+                (text, amount),
+            )
+
+    def test_overlapping_contains_patterns_pick_priority(self):
+        rules = [
+            Rule(name="late", match_type="contains", match_value="sparkasse"),
+            Rule(name="early", match_type="contains", match_value="kasse"),
+        ]
+        ruleset = CompiledRuleSet(rules)
+        self.assertEqual(ruleset.match("sparkasse 12", Decimal(0)).name, "late")
+        self.assertEqual(ruleset.match("kassa kasse", Decimal(0)).name, "early")
+        self.assertIsNone(ruleset.match("spar", Decimal(0)))
+
+    def test_apply_rules_with_seeded_defaults(self):
+        seed_default_rules(USER_ID)
+        fi = make_import()
+        for desc, amount in [("LIDL 0123 BUDAPEST", -3500), ("ismeretlen", -10)]:
+            Transaction.objects.create(
+                user_id=USER_ID,
+                import_file=fi,
+                amount=Decimal(amount),
+                description_raw=desc,
+            )
+
+        self.assertEqual(apply_rules_for_user(USER_ID), 1)
+        lidl = Transaction.objects.get(description_raw="LIDL 0123 BUDAPEST")
+        self.assertEqual(lidl.category.name, "Bevásárlás")
+        self.assertEqual(lidl.category.reference_count, 1)
+
+    def test_rules_match_normalised_text(self):
+        self.assertEqual(
+            normalize_description("VÁSÁRLÁS 4321 **** **** 1234  Fizetés", "ŐRS Kft"),
+            "vasarlas fizetes ors kft",
+        )
+        self.assertEqual(
+            normalize_description("Ref 12345678901 LIDL 0123", None), "ref lidl 0123"
+        )
+        rules = [
+            Rule(name="a", match_type="contains", match_value="Fizetés"),
+            Rule(name="b", match_type="regex", match_value=r"^őrs\b"),
+            Rule(name="c", match_type="equals", match_value="Spar  KFT"),
+        ]
+        ruleset = CompiledRuleSet(rules)
+        for text, name in [
+            ("MUNKABÉR FIZETES", "a"),
+            ("Örs vezér tere", "b"),
+            ("spar kft", "c"),
+        ]:
+            self.assertEqual(
+                ruleset.match(normalize_description(text, None), Decimal(0)).name,
+                name,
+            )
+
+    def test_backfill_description_norm(self):
+        fi = make_import()
+        txn = Transaction.objects.create(
+            user_id=USER_ID,
+            import_file=fi,
+            amount=-10,
+            description_raw="Kávézó  BUDAPEST",
+            counterparty="Café Ünnep",
+        )
+        call_command("backfill_description_norm", stdout=io.StringIO())
+        txn.refresh_from_db()
+        self.assertEqual(txn.description_norm, "kavezo budapest cafe unnep")
+
+    def test_apply_rules_scoped_to_import(self):
+        seed_default_rules(USER_ID)
+        old, new = make_import(), make_import()
+        for fi in (old, new):
+            Transaction.objects.create(
+                user_id=USER_ID, import_file=fi, amount=-10, description_raw="SPAR"
+            )
+        miss = Transaction.objects.create(
+            user_id=USER_ID, import_file=new, amount=-10, description_raw="???"
+        )
+        stamp = miss.updated_at
+
+        self.assertEqual(apply_rules_for_user(USER_ID, import_id=new.id), 1)
+        self.assertFalse(old.transactions.filter(category__isnull=False).exists())
+        # rows that did not match are not written back
+        miss.refresh_from_db()
+        self.assertEqual(miss.updated_at, stamp)
+
+        # explicit full-user pass picks up the rest
+        self.assertEqual(apply_rules_for_user(USER_ID), 1)
+
+
+class RuleMemoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def rules(self):
+        return [
+            Rule(name="a", match_type="contains", match_value="bolt"),
+            Rule(name="b", match_type="amount_range", match_value="-5000,-1000"),
+            Rule(name="c", match_type="regex", match_value=r"net(flix|fl)"),
+            Rule(name="d", match_type="amount_range", match_value="-1000,0"),
+            Rule(name="e", match_type="amount_range", match_value="-Infinity,-8000"),
+            Rule(name="f", match_type="equals", match_value="spar"),
+        ]
+
+    def test_matches_compiled_ruleset(self):
+        rules = self.rules()
+        ruleset = CompiledRuleSet(rules)
+        memo = RuleMemo(rules, size=50, shared=False)
+        rng = random.Random(7)
+        texts = ["bolt food", "netflix", "spar", "lidl", "x"]
+        # the range bounds themselves, and amounts around them
+        amounts = [-8001, -8000, -5000, -4999, -1000, -999, 0, 1, -6000]
+        items = [
+            (rng.choice(texts), Decimal(rng.choice(amounts)), None) for _ in range(2000)
+        ]
+        expected = [ruleset.match(text, amount) for text, amount, _ in items]
+        self.assertEqual(memo.match_many(items), expected)
+        self.assertEqual(memo.match_many(items), expected)
+        self.assertLessEqual(len(memo.entries), 50)
+        self.assertGreater(memo.hits, memo.misses)
+
+    def test_new_ruleset_version_and_shared_results(self):
+        rules = self.rules()
+        memo = memo_for(rules)
+        self.assertIs(memo_for(list(rules)), memo)
+        # an edited rule is a new version, with a memo of its own
+        rules[0].match_value = "lidl"
+        self.assertIsNot(memo_for(rules), memo)
+
+        first = RuleMemo(rules, shared=True)
+        first.match_many([("lidl", Decimal(-10), None), ("spar", Decimal(5), None)])
+        second = RuleMemo(rules, shared=True)
+        matched = second.match_many(
+            [("lidl", Decimal(-10), None), ("spar", Decimal(5), None)]
+        )
+        self.assertEqual([r.name for r in matched], ["a", "f"])
+        self.assertEqual((second.hits, second.misses), (2, 0))
+
+
+class RuleRecategorisationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.food = Category.objects.create(user_id=USER_ID, name="Food")
+        self.shop = Category.objects.create(user_id=USER_ID, name="Shop")
+        self.rule = Rule.objects.create(
+            user_id=USER_ID,
+            name="groceries",
+            priority=1,
+            match_type="contains",
+            match_value="lidl",
+            action_set_category=str(self.food.id),
+        )
+        Rule.objects.create(
+            user_id=USER_ID,
+            name="fallback",
+            priority=2,
+            match_type="contains",
+            match_value="kft",
+            action_set_category=str(self.shop.id),
+        )
+        fi = make_import()
+        for desc in ["LIDL 1", "LIDL 2 kft", "ALDI 3", "LIDL hand"]:
+            Transaction.objects.create(
+                user_id=USER_ID,
+                import_file=fi,
+                booking_date=date(2024, 1, 5),
+                amount=-100,
+                description_raw=desc,
+            )
+        apply_rules_for_user(USER_ID)
+        # categorised by hand: not the rule's any more
+        Transaction.objects.filter(description_raw="LIDL hand").update(
+            category=self.shop, rule_id=None, rule_version=None
+        )
+        rollup.rebuild_for_user(USER_ID)
+
+    def categories(self):
+        return dict(
+            Transaction.objects.values_list("description_raw", "category__name")
+        )
+
+    def rollups(self):
+        return sorted(
+            MonthlyRollup.objects.filter(user_id=USER_ID).values_list(
+                "category_id", "total", "txn_count"
+            ),
+            key=str,
+        )
+
+    def test_records_rule_and_version(self):
+        txn = Transaction.objects.get(description_raw="LIDL 1")
+        self.assertEqual((txn.rule_id, txn.rule_version), (self.rule.id, 1))
+
+    def test_edit_recategorises_only_affected_rows(self):
+        self.rule.match_value = "aldi"
+        self.rule.version += 1
+        self.rule.save()
+        untouched = Transaction.objects.get(description_raw="LIDL hand").updated_at
+
+        self.assertEqual(recategorise_for_rule(USER_ID, self.rule.id), 2)
+        self.assertEqual(
+            self.categories(),
+            {
+                "LIDL 1": None,
+                "LIDL 2 kft": "Shop",
+                "ALDI 3": "Food",
+                "LIDL hand": "Shop",
+            },
+        )
+        self.assertEqual(
+            Transaction.objects.get(description_raw="LIDL hand").updated_at, untouched
+        )
+        self.food.refresh_from_db()
+        self.shop.refresh_from_db()
+        # food: 3 rule matches - 2 released + ALDI; shop: + "LIDL 2 kft"
+        self.assertEqual((self.food.reference_count, self.shop.reference_count), (2, 1))
+        incremental = self.rollups()
+        rollup.rebuild_for_user(USER_ID)
+        self.assertEqual(incremental, self.rollups())
+
+    def test_views_bump_version_and_queue_recategorisation(self):
+        factory = APIRequestFactory()
+        view = RuleViewSet.as_view({"patch": "partial_update", "delete": "destroy"})
+        with mock.patch("ingestion.views.recategorise_rule_task") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = view(
+                    factory.patch(
+                        "/", {"enabled": False}, format="json", **AUTH_HEADERS
+                    ),
+                    pk=self.rule.pk,
+                )
+            self.assertEqual(response.data["version"], 2)
+            task.delay.assert_called_once_with(USER_ID, str(self.rule.id))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                view(factory.delete("/", **AUTH_HEADERS), pk=self.rule.pk)
+            self.assertEqual(task.delay.call_count, 2)
+
+        # the deleted rule's rows are found by their recorded id
+        recategorise_for_rule(USER_ID, self.rule.id)
+        self.assertEqual(self.categories()["LIDL 1"], None)
+        self.assertEqual(self.categories()["LIDL 2 kft"], "Shop")
+
+
+class RulePushdownTests(TestCase):
+    WORDS = ["lidl", "spar", "Kávé", "bolt", "netflix", "fizetés", "kft", "x%y", "a_b"]
+
+    def random_rules(self, rng, categories):
+        rules = []
+        for priority in range(12):
+            kind = rng.choice(["contains", "equals", "amount_range", "regex"])
+            if kind == "contains":
+                value = rng.choice(self.WORDS + [""]).upper()
+            elif kind == "equals":
+                value = " ".join(rng.choices(self.WORDS, k=2))
+            elif kind == "amount_range":
+                lo = rng.randint(-5000, 1000)
+                value = rng.choice(
+                    [f"{lo},{lo + rng.randint(0, 3000)}", "-Infinity,-4000", "broken"]
+                )
+            else:
+                value = rng.choice([r"^k[aá]v", r"net(flix)?", r"\d{3}", "(broken"])
+            rules.append(
+                Rule(
+                    user_id="default",
+                    name=f"r{priority}",
+                    priority=priority,
+                    match_type=kind,
+                    match_value=value,
+                    # some rules point to a category that does not exist
+                    action_set_category=str(
+                        rng.choice(categories) if rng.random() < 0.85 else uuid.uuid4()
+                    ),
+                )
+            )
+        Rule.objects.bulk_create(rules)
+
+    def run_mode(self, user_id, pushdown, rng_seed):
+        rng = random.Random(rng_seed)
+        fi = make_import(user_id=user_id)
+        Transaction.objects.bulk_create(
+            Transaction(
+                user_id=user_id,
+                import_file=fi,
+                booking_date=date(2024, rng.randint(1, 3), rng.randint(1, 28)),
+                amount=Decimal(rng.randint(-600000, 200000)) / 100,
+                description_raw=" ".join(rng.choices(self.WORDS, k=rng.randint(1, 3))),
+                counterparty=rng.choice(["", "Spar", f"{rng.randint(100, 999)}"]),
+                # rows imported before description_norm was filled
+                description_norm="",
+            )
+            for _ in range(300)
+        )
+        before = dict(Category.objects.values_list("id", "reference_count"))
+        by_import = Counter()
+        count = apply_rules_for_user(user_id, pushdown=pushdown, by_import=by_import)
+        after = dict(Category.objects.values_list("id", "reference_count"))
+        return (
+            count,
+            sorted(
+                Transaction.objects.filter(user_id=user_id).values_list(
+                    "description_raw", "counterparty", "amount", "category_id"
+                )
+            ),
+            {k: after[k] - before[k] for k in after if after[k] != before[k]},
+            sorted(
+                MonthlyRollup.objects.filter(user_id=user_id).values_list(
+                    "period", "weekday", "category_id", "sign", "total", "txn_count"
+                )
+            ),
+            sorted(by_import.values()),
+        )
+
+    def test_pushdown_matches_python_engine(self):
+        categories = [
+            Category.objects.create(user_id="default", name=f"c{i}").id
+            for i in range(4)
+        ]
+        for seed in range(5):
+            Rule.objects.all().delete()
+            self.random_rules(random.Random(seed), categories)
+            python = self.run_mode(f"py-{seed}", False, seed)
+            sql = self.run_mode(f"sql-{seed}", True, seed)
+            self.assertGreater(python[0], 0)
+            self.assertEqual(python, sql, seed)
+
+
+class TransactionPaginationTests(TestCase):
+    def setUp(self):
+        fi = make_import()
+        Transaction.objects.bulk_create(
+            Transaction(
+                user_id=USER_ID,
+                import_file=fi,
+                # many rows share a day, a few have no date at all
+                booking_date=date(2024, 1, i % 7 + 1) if i % 25 else None,
+                amount=-i,
+                description_raw=f"row {i}",
+            )
+            for i in range(230)
+        )
+        self.list_view = TransactionViewSet.as_view({"get": "list"})
+
+    def fetch_all(self, params):
+        ids, url, pages = [], "/api/transactions", 0
+        factory = APIRequestFactory()
+        while url:
+            response = self.list_view(factory.get(url, params, **AUTH_HEADERS))
+            self.assertEqual(response.status_code, 200)
+            ids += [row["id"] for row in response.data["results"]]
+            url, params, pages = response.data["next"], {}, pages + 1
+        return ids, pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        ids, pages = self.fetch_all({"page_size": 40})
+        self.assertEqual(pages, 6)
+        self.assertEqual(len(ids), 230)
+        self.assertEqual(len(set(ids)), 230)
+
+        rows = Transaction.objects.in_bulk(ids)
+        keys = [rows[i] for i in ids]
+        dated = [t for t in keys if t.booking_date]
+        self.assertEqual(keys[: len(dated)], dated)  # nulls last
+        for a, b in zip(dated, dated[1:]):
+            self.assertGreaterEqual((a.booking_date, a.id), (b.booking_date, b.id))
+
+    def test_cursor_inside_undated_rows(self):
+        ids, _ = self.fetch_all({"page_size": 40})
+        # 220 dated rows: later cursors point into the undated tail
+        with CaptureQueriesContext(connection) as queries:
+            small_pages, pages = self.fetch_all({"page_size": 7})
+        self.assertEqual(small_pages, ids)
+        self.assertEqual(pages, 33)
+        # one query per page, also where the dated rows run out
+        self.assertEqual(
+            len([q for q in queries if 'FROM "transactions"' in q["sql"]]), pages
+        )
+
+    def test_filters_are_respected(self):
+        ids, _ = self.fetch_all({"page_size": 10, "date_from": "2024-01-06"})
+        expected = Transaction.objects.filter(booking_date__gte=date(2024, 1, 6))
+        self.assertEqual(len(ids), expected.count())
+
+    def test_search_by_normalised_text(self):
+        Transaction.objects.filter(description_raw="row 7").update(
+            description_norm=normalize_description("Kávé RÓW 7", None)
+        )
+        ids, _ = self.fetch_all({"q": "KAVÉ"})
+        self.assertEqual(
+            [str(t.id) for t in Transaction.objects.filter(description_raw="row 7")],
+            [str(i) for i in ids],
+        )
+
+    def test_invalid_cursor(self):
+        request = APIRequestFactory().get(
+            "/api/transactions", {"cursor": "nonsense"}, **AUTH_HEADERS
+        )
+        self.assertEqual(self.list_view(request).status_code, 404)
+
+    def test_fast_path_matches_serializer_output(self):
+        cat = Category.objects.create(user_id=USER_ID, name="Bolt", type="expense")
+        Transaction.objects.filter(description_raw="row 3").update(category=cat)
+
+        response = self.list_view(
+            APIRequestFactory().get("/api/transactions", **AUTH_HEADERS)
+        )
+        body = json.loads(response.render().content)
+        qs = Transaction.objects.filter(user_id=USER_ID).select_related("category")
+        expected = {
+            row["id"]: row
+            for row in json.loads(
+                JSONRenderer().render(TransactionSerializer(qs, many=True).data)
+            )
+        }
+        self.assertEqual(len(body["results"]), 100)
+        for row in body["results"]:
+            self.assertEqual(row, expected[row["id"]])
+
+
+class MonthlyRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def snapshot(self):
+        return sorted(
+            MonthlyRollup.objects.filter(user_id=USER_ID).values_list(
+                "period",
+                "weekday",
+                "category_id",
+                "sign",
+                "is_transfer",
+                "total",
+                "txn_count",
+            ),
+            key=str,
+        )
+
+    def assertRollupConsistent(self):
+        incremental = self.snapshot()
+        rollup.rebuild_for_user(USER_ID)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_incremental_updates_match_rebuild(self):
+        seed_default_rules(USER_ID)
+        fi = make_import()
+        raw = (REVOLUT_HEADER + "".join(revolut_row(i) for i in range(60))).encode()
+        adapter = RevolutCsvAdapter(raw, USER_ID, fi.id)
+        adapter.bulk_insert(adapter.parse())
+        Transaction.objects.create(
+            user_id=USER_ID, import_file=fi, amount=12, description_raw="undated"
+        )
+        rollup.add_transactions(USER_ID, fi.transactions.all())
+        self.assertRollupConsistent()
+
+        apply_rules_for_user(USER_ID, import_id=fi.id)
+        self.assertRollupConsistent()
+
+        view = TransactionViewSet.as_view(
+            {"patch": "set_category", "delete": "destroy"}
+        )
+        txn = fi.transactions.exclude(booking_date=None).first()
+        other = Category.objects.filter(user_id=USER_ID).last()
+        factory = APIRequestFactory()
+        response = view(
+            factory.patch("/", {"category_id": str(other.id)}, **AUTH_HEADERS),
+            pk=txn.pk,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertRollupConsistent()
+
+        response = view(factory.delete("/", **AUTH_HEADERS), pk=txn.pk)
+        self.assertEqual(response.status_code, 204)
+        self.assertRollupConsistent()
+
+        rollup.move_category(other.id, None)
+        other.delete()
+        self.assertRollupConsistent()
+
+    def test_dashboard_reads_rollups(self):
+        fi = make_import()
+        for day, amount in [(1, -100), (2, -50), (3, 400)]:
+            Transaction.objects.create(
+                user_id=USER_ID,
+                import_file=fi,
+                booking_date=date(2024, 3, day),
+                amount=amount,
+            )
+        rollup.add_transactions(USER_ID, fi.transactions.all())
+        factory = APIRequestFactory()
+
+        response = cashflow_view(factory.get("/", **AUTH_HEADERS))
+        self.assertEqual(
+            response.data,
+            [{"year": 2024, "month": 3, "income": 400.0, "expense": 150.0}],
+        )
+        response = category_coverage(factory.get("/", **AUTH_HEADERS))
+        self.assertEqual(response.data["total_transactions"], 3)
+        self.assertEqual(response.data["categorized_transactions"], 0)
+
+    def test_bundle_matches_single_endpoints(self):
+        fi = make_import()
+        for day, amount, cp in [(1, -100, "Lidl"), (2, -50, "Spar"), (3, 400, "")]:
+            Transaction.objects.create(
+                user_id=USER_ID,
+                import_file=fi,
+                booking_date=date(2024, 3, day),
+                amount=amount,
+                counterparty=cp,
+            )
+        rollup.add_transactions(USER_ID, fi.transactions.all())
+        factory = APIRequestFactory()
+
+        response = dashboard_bundle(factory.get("/", **AUTH_HEADERS))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 9)
+        singles = {
+            "cashflow": cashflow_view,
+            "category-coverage": category_coverage,
+            "top-merchants": top_merchants_view,
+        }
+        for name, view in singles.items():
+            self.assertEqual(
+                response.data[name], view(factory.get("/", **AUTH_HEADERS)).data
+            )
+
+        response = dashboard_bundle(
+            factory.get("/", {"widgets": "cashflow,bogus"}, **AUTH_HEADERS)
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TransferDetectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.checking, self.savings = make_import(), make_import()
+
+    def add(self, fi, day, amount, description="", currency="HUF"):
+        return Transaction.objects.create(
+            user_id=USER_ID,
+            import_file=fi,
+            booking_date=date(2024, 3, day),
+            amount=amount,
+            currency=currency,
+            description_raw=description,
+        )
+
+    def rollup_rows(self):
+        fields = ("period", "weekday", "sign", "is_transfer", "total", "txn_count")
+        return sorted(MonthlyRollup.objects.values_list(*fields))
+
+    def marked(self):
+        return set(
+            Transaction.objects.filter(is_transfer=True).values_list(
+                "description_raw", flat=True
+            )
+        )
+
+    def test_pairs_opposite_amounts_across_imports(self):
+        self.add(self.checking, 1, -500, "out")
+        self.add(self.savings, 3, 500, "in")
+        self.add(self.checking, 2, 500, "same import")
+        self.add(self.savings, 20, 500, "too late")
+        self.add(self.checking, 1, -70, "other currency", currency="EUR")
+        self.add(self.savings, 1, 70, "other currency in")
+        self.add(self.checking, 5, -80, "groceries")
+        rollup.add_transactions(USER_ID, Transaction.objects.all())
+
+        with override_settings(TRANSFER_WINDOW_DAYS=3):
+            self.assertEqual(detect_transfers(USER_ID), 2)
+        self.assertEqual(self.marked(), {"out", "in"})
+        out = Transaction.objects.get(description_raw="out")
+        self.assertEqual(out.transfer_peer.description_raw, "in")
+
+        response = cashflow_view(APIRequestFactory().get("/", **AUTH_HEADERS))
+        self.assertEqual(
+            response.data,
+            [{"year": 2024, "month": 3, "income": 1070.0, "expense": 150.0}],
+        )
+        incremental = self.rollup_rows()
+        rollup.rebuild_for_user(USER_ID)
+        self.assertEqual(incremental, self.rollup_rows())
+
+    def test_incremental_and_rule_marked(self):
+        Rule.objects.create(
+            user_id=USER_ID,
+            name="Savings",
+            match_type=RuleMatchType.CONTAINS,
+            match_value="megtakaritas",
+            action_mark_transfer=True,
+        )
+        old = make_import()
+        self.add(old, 1, -300, "old out")
+        self.add(self.checking, 2, 300, "old in")
+        self.add(self.checking, 4, -200, "Megtakarítás")
+        self.add(self.savings, 2, 300, "new in")
+        self.add(self.savings, 4, -200, "Megtakarítás savings")
+
+        with override_settings(TRANSFER_WINDOW_DAYS=3):
+            detect_transfers(USER_ID, import_id=self.savings.id)
+        # old rows only pair with the new import; rules only mark new rows
+        self.assertEqual(self.marked(), {"Megtakarítás savings", "new in", "old out"})
+        self.assertIsNone(
+            Transaction.objects.get(
+                description_raw="Megtakarítás savings"
+            ).transfer_peer
+        )
+
+    def test_deleting_one_side_releases_the_peer(self):
+        self.add(self.checking, 1, -500, "out")
+        self.add(self.savings, 1, 500, "in")
+        rollup.add_transactions(USER_ID, Transaction.objects.all())
+        detect_transfers(USER_ID)
+
+        view = ImportViewSet.as_view({"delete": "destroy"})
+        response = view(
+            APIRequestFactory().delete("/", **AUTH_HEADERS), pk=self.savings.pk
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.marked(), set())
+        self.assertIsNone(Transaction.objects.get().transfer_peer_id)
+        response = cashflow_view(APIRequestFactory().get("/", **AUTH_HEADERS))
+        self.assertEqual(response.data[0]["expense"], 500.0)
+
+
+class MerchantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_variants_share_a_merchant(self):
+        self.assertEqual(row_merchant_key("LIDL 0123 BUDAPEST", ""), "lidl")
+        self.assertEqual(row_merchant_key("Lidl Magyarország Bt.", ""), "lidl")
+        self.assertEqual(row_merchant_key("", "POS vásárlás SPAR 12"), "spar")
+        self.assertEqual(row_merchant_key("Burger King Kft", "x"), "burger king")
+        self.assertEqual(row_merchant_key("", ""), "")
+
+        raw = (REVOLUT_HEADER + "".join(revolut_row(i) for i in range(30))).encode()
+        adapter = RevolutCsvAdapter(raw, USER_ID, make_import().id)
+        adapter.bulk_insert(adapter.parse())
+        Transaction.objects.create(
+            user_id=USER_ID,
+            import_file=make_import(),
+            booking_date=date(2024, 3, 1),
+            amount=-10000,
+            counterparty="Aldi",
+        )
+        # rows from before merchants were set at ingest: the data migration
+        backfill = import_module("ingestion.migrations.0024_backfill_merchants")
+        backfill.backfill_merchants(django_apps, None)
+
+        self.assertEqual(Merchant.objects.count(), 2)
+        lidl = Merchant.objects.get(key="lidl")
+        self.assertEqual(lidl.name, "Lidl")
+        self.assertEqual(Transaction.objects.filter(merchant=lidl).count(), 30)
+
+        response = top_merchants_view(APIRequestFactory().get("/", **AUTH_HEADERS))
+        lidl_total = -Transaction.objects.filter(merchant=lidl).aggregate(
+            total=Sum("amount")
+        )["total"]
+        self.assertEqual(
+            response.data,
+            [
+                {"name": "Aldi", "amount": 10000.0},
+                {"name": "Lidl", "amount": float(lidl_total)},
+            ],
+        )
+
+    def test_merchant_rules(self):
+        category = Category.objects.create(user_id=USER_ID, name="Food", type="expense")
+        Rule.objects.create(
+            user_id=USER_ID,
+            name="Lidl",
+            priority=1,
+            match_type=RuleMatchType.MERCHANT,
+            match_value="LIDL Magyarorszag",
+            action_set_category=str(category.id),
+        )
+        # what RuleViewSet does on save
+        ensure_merchant("LIDL Magyarorszag")
+        raw = (REVOLUT_HEADER + "".join(revolut_row(i) for i in range(10))).encode()
+        fi = make_import()
+        adapter = RevolutCsvAdapter(raw, USER_ID, fi.id)
+        # the categoriser is built before the import's first row of the merchant
+        adapter.bulk_insert(adapter.parse(), categorise=ImportCategoriser(USER_ID))
+        self.assertEqual(adapter.progress.rows_categorised, 10)
+        Transaction.objects.create(
+            user_id=USER_ID, import_file=fi, amount=-5, counterparty="Spar"
+        )
+
+        for pushdown in (False, True):
+            Transaction.objects.update(category=None, rule_id=None)
+            self.assertEqual(apply_rules_for_user(USER_ID, pushdown=pushdown), 10)
+            self.assertEqual(
+                set(
+                    Transaction.objects.filter(category=category).values_list(
+                        "merchant__key", flat=True
+                    )
+                ),
+                {"lidl"},
+            )
+
+
+@override_settings(DASHBOARD_CACHE=True)
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fi = make_import()
+        for day, amount in [(1, -100), (2, 400)]:
+            Transaction.objects.create(
+                user_id=USER_ID,
+                import_file=self.fi,
+                booking_date=date(2024, 3, day),
+                amount=amount,
+            )
+        rollup.add_transactions(USER_ID, self.fi.transactions.all())
+
+    def test_cached_until_data_version_changes(self):
+        factory = APIRequestFactory()
+        first = cashflow_view(factory.get("/", **AUTH_HEADERS))
+        with self.assertNumQueries(0):
+            again = cashflow_view(factory.get("/", **AUTH_HEADERS))
+        self.assertEqual(first.data, again.data)
+        self.assertEqual(first["ETag"], again["ETag"])
+
+        with self.assertNumQueries(0):
+            response = cashflow_view(
+                factory.get("/", HTTP_IF_NONE_MATCH=first["ETag"], **AUTH_HEADERS)
+            )
+        self.assertEqual(response.status_code, 304)
+
+        view = TransactionViewSet.as_view({"delete": "destroy"})
+        txn = self.fi.transactions.get(amount=-100)
+        with self.captureOnCommitCallbacks(execute=True):
+            view(factory.delete("/", **AUTH_HEADERS), pk=txn.pk)
+
+        response = cashflow_view(
+            factory.get("/", HTTP_IF_NONE_MATCH=first["ETag"], **AUTH_HEADERS)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["expense"], 0.0)
+
+    @override_settings(DASHBOARD_CACHE=False)
+    def test_off_without_a_shared_cache(self):
+        # the workers' version bumps would not reach a per-process cache
+        factory = APIRequestFactory()
+        cashflow_view(factory.get("/", **AUTH_HEADERS))
+        with CaptureQueriesContext(connection) as queries:
+            response = cashflow_view(factory.get("/", **AUTH_HEADERS))
+        self.assertTrue(queries)
+        self.assertNotIn("ETag", response)
+
+
+class MonthlyReportTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.fi = make_import()
+        Transaction.objects.create(
+            user_id=USER_ID,
+            import_file=self.fi,
+            booking_date=date(2024, 3, 1),
+            amount=-100,
+        )
+
+    def request_report(self):
+        request = APIRequestFactory().get(
+            "/", {"year": 2024, "month": 3}, **AUTH_HEADERS
+        )
+        with mock.patch("ingestion.reports.views.render_report_task") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = monthly_report(request)
+        return response, task.delay.call_count
+
+    def test_unchanged_month_reuses_rendered_file(self):
+        response, queued = self.request_report()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(queued, 1)
+        report = Report.objects.get(id=response.data["id"])
+        self.assertEqual(report.status, ReportStatus.PENDING)
+
+        # while pending, a repeat request does not queue another render
+        response, queued = self.request_report()
+        self.assertEqual((response.status_code, queued), (202, 0))
+
+        # what render_report_task leaves behind
+        path = Path(self.media.name) / report.storage_path
+        path.parent.mkdir(parents=True)
+        path.write_bytes(b"%PDF")
+        Report.objects.filter(id=report.id).update(status=ReportStatus.READY)
+
+        response, queued = self.request_report()
+        self.assertEqual((response.status_code, queued), (200, 0))
+        self.assertIn("file_url", response.data)
+        status_response = report_status(
+            APIRequestFactory().get("/", **AUTH_HEADERS), report_id=report.id
+        )
+        self.assertEqual(status_response.data["status"], ReportStatus.READY)
+
+        self.fi.transactions.update(amount=-120)
+        response, queued = self.request_report()
+        self.assertEqual((response.status_code, queued), (202, 1))
+        self.assertEqual(Report.objects.count(), 1)
+
+    def test_report_changed_while_rendering_is_discarded(self):
+        response, _ = self.request_report()
+        report = Report.objects.get(id=response.data["id"])
+
+        def render_during_edit(context):
+            self.fi.transactions.update(amount=-120)
+            return b"%PDF"
+
+        with mock.patch(
+            "ingestion.reports.tasks.render_pdf", side_effect=render_during_edit
+        ), mock.patch.object(render_report_task, "delay") as delay:
+            render_report_task(str(report.id))
+        report.refresh_from_db()
+        self.assertEqual(report.status, ReportStatus.PENDING)
+        delay.assert_called_once_with(str(report.id))
+        self.assertFalse((Path(self.media.name) / report.storage_path).exists())
+
+        with mock.patch("ingestion.reports.tasks.render_pdf", return_value=b"%PDF"):
+            render_report_task(str(report.id))
+        report.refresh_from_db()
+        self.assertEqual((report.status, report.size_bytes), (ReportStatus.READY, 4))
+        # the stored fingerprint is the rendered input's: no re-render
+        response, queued = self.request_report()
+        self.assertEqual((response.status_code, queued), (200, 0))
+
+
+class ImportProgressTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def run_import(self, raw: bytes, **kwargs) -> FileImport:
+        fi = make_import(**kwargs)
+        path = Path(self.media.name) / fi.storage_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(raw)
+        with mock.patch("ingestion.tasks.apply_rules_task") as self.apply_rules:
+            parse_import_task(str(fi.id))
+        fi.refresh_from_db()
+        return fi
+
+    def test_progress_counters(self):
+        rows = [revolut_row(i) for i in range(1200)] + [
+            revolut_row(i) for i in range(300)
+        ]
+        raw = (REVOLUT_HEADER + "".join(rows)).encode()
+        fi = self.run_import(raw)
+
+        self.assertEqual(fi.status, FileStatus.PARSED)
+        self.assertEqual(fi.rows_parsed, 1500)
+        self.assertEqual(fi.rows_inserted, 1200)
+        self.assertEqual(fi.rows_deduplicated, 300)
+        self.assertEqual(fi.bytes_parsed, len(raw))
+        self.assertEqual(fi.transactions.count(), 1200)
+        self.assertTrue(fi.transactions.filter(description_norm="lidl 7").exists())
+
+        factory = APIRequestFactory()
+        view = ImportViewSet.as_view({"get": "import_status"})
+        response = view(factory.get("/", **AUTH_HEADERS), pk=fi.pk)
+        self.assertEqual(response.data["rows_inserted"], 1200)
+
+        # as routed: with the action's own renderer
+        view = ImportViewSet.as_view(
+            {"get": "import_events"}, **ImportViewSet.import_events.kwargs
+        )
+        response = view(
+            factory.get("/", HTTP_ACCEPT="text/event-stream", **AUTH_HEADERS),
+            pk=fi.pk,
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            re.findall(r"^event: (\w+)$", body, re.M), ["progress", "done"]
+        )
+        self.assertIn('"rows_parsed":1500', body)
+
+    def test_event_stream_token_and_terminal_state(self):
+        fi = make_import(status=FileStatus.PROCESSING)
+        factory = APIRequestFactory()
+        token_view = ImportViewSet.as_view({"post": "import_events_token"})
+        response = token_view(factory.post("/", **AUTH_HEADERS), pk=fi.pk)
+        token = response.data["token"]
+        view = ImportViewSet.as_view(
+            {"get": "import_events"}, **ImportViewSet.import_events.kwargs
+        )
+
+        # EventSource sends no headers: only a valid token for this import
+        for params, pk in [
+            ({"token": "forged"}, fi.pk),
+            ({"token": token}, make_import().pk),
+            ({}, fi.pk),
+        ]:
+            self.assertEqual(view(factory.get("/", params), pk=pk).status_code, 401)
+
+        # the stream ends at its deadline; EventSource reconnects with the
+        # same token, past its max age, while the import is in progress
+        with mock.patch.object(ImportViewSet, "sse_max_duration", 0):
+            response = view(factory.get("/", {"token": token}), pk=fi.pk)
+            with mock.patch("ingestion.views.time.sleep"):
+                body = b"".join(response.streaming_content).decode()
+        self.assertEqual(re.findall(r"^event: (\w+)$", body, re.M), ["progress"])
+        later = time.time() + EVENTS_TOKEN_MAX_AGE + ImportViewSet.sse_max_duration
+        with mock.patch("django.core.signing.time.time", return_value=later):
+            response = view(factory.get("/", {"token": token}), pk=fi.pk)
+            self.assertEqual(response.status_code, 200)
+            response.close()
+            # a finished import's stream only opens with a fresh token
+            FileImport.objects.filter(pk=fi.pk).update(status=FileStatus.PARSED)
+            response = view(factory.get("/", {"token": token}), pk=fi.pk)
+            self.assertEqual(response.status_code, 401)
+        FileImport.objects.filter(pk=fi.pk).update(status=FileStatus.PROCESSING)
+
+        def fail_import(seconds):
+            FileImport.objects.filter(pk=fi.pk).update(
+                status=FileStatus.FAILED, error_message="broken"
+            )
+
+        response = view(
+            factory.get("/", {"token": token}, HTTP_ACCEPT="text/event-stream"),
+            pk=fi.pk,
+        )
+        self.assertEqual(response.status_code, 200)
+        with mock.patch("ingestion.views.time.sleep", side_effect=fail_import) as sleep:
+            body = b"".join(response.streaming_content).decode()
+        # the stream ends as soon as the import fails, not at the deadline
+        sleep.assert_called_once()
+        self.assertEqual(
+            re.findall(r"^event: (\w+)$", body, re.M), ["progress", "progress", "done"]
+        )
+        self.assertIn('"status":"failed"', body)
+
+    def test_resumes_after_worker_crash(self):
+        raw = (REVOLUT_HEADER + "".join(revolut_row(i) for i in range(2500))).encode()
+        fi = make_import()
+        path = Path(self.media.name) / fi.storage_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(raw)
+
+        heartbeat = state.heartbeat
+        calls = []
+
+        def dying_heartbeat(fi, **fields):
+            calls.append(fields)
+            if len(calls) == 3:  # profile hints, batch 1, batch 2
+                raise SystemExit("worker killed")
+            heartbeat(fi, **fields)
+
+        with mock.patch("ingestion.tasks.state.heartbeat", dying_heartbeat):
+            with self.assertRaises(SystemExit):
+                parse_import_task(str(fi.id))
+        fi.refresh_from_db()
+        self.assertEqual(fi.status, FileStatus.PROCESSING)
+        # batch 2 rolled back together with its progress
+        self.assertEqual((fi.rows_parsed, fi.transactions.count()), (1000, 1000))
+
+        # the immediate redelivery finds the dead claim's heartbeat fresh:
+        # the worker may still be alive, so it checks again once it is stale
+        with mock.patch.object(
+            parse_import_task, "retry", side_effect=RuntimeError("retry")
+        ) as retry:
+            with self.assertRaisesMessage(RuntimeError, "retry"):
+                parse_import_task(str(fi.id))
+        retry.assert_called_once_with(countdown=settings.IMPORT_STALE_AFTER)
+        # the retry runs after the countdown, without new heartbeats
+        FileImport.objects.filter(id=fi.id).update(
+            heartbeat_at=F("heartbeat_at")
+            - timedelta(seconds=settings.IMPORT_STALE_AFTER + 1)
+        )
+        parse_import_task(str(fi.id))
+        fi.refresh_from_db()
+        self.assertEqual(fi.status, FileStatus.PARSED)
+        self.assertEqual(fi.attempts, 2)
+        self.assertEqual(
+            (fi.rows_parsed, fi.rows_inserted, fi.rows_deduplicated),
+            (2500, 2500, 0),
+        )
+        self.assertEqual(fi.transactions.count(), 2500)
+        self.assertEqual(
+            MonthlyRollup.objects.filter(user_id=USER_ID).aggregate(n=Sum("txn_count"))[
+                "n"
+            ],
+            2500,
+        )
+        # parsed imports are not claimed again
+        self.assertIsNone(state.claim(fi.id))
+
+    def test_failed_import_reverts_committed_batches(self):
+        seed_default_rules(USER_ID)
+        parse = RevolutCsvAdapter.parse
+
+        def failing_parse(adapter, *args):
+            for i, row in enumerate(parse(adapter, *args)):
+                if i == 2100:  # after two committed batches
+                    raise RuntimeError("broken statement")
+                yield row
+
+        raw = (REVOLUT_HEADER + "".join(revolut_row(i) for i in range(2500))).encode()
+        with mock.patch.object(RevolutCsvAdapter, "parse", failing_parse):
+            fi = self.run_import(raw)
+
+        self.assertEqual(fi.status, FileStatus.FAILED)
+        self.assertEqual(fi.rows_parsed, 2000)
+        self.assertFalse(fi.transactions.exists())
+        self.assertFalse(
+            Category.objects.filter(user_id=USER_ID).exclude(reference_count=0).exists()
+        )
+        self.assertFalse(MonthlyRollup.objects.filter(user_id=USER_ID).exists())
+
+    def test_reclaimed_worker_cannot_finish(self):
+        fi = make_import()
+        first = state.claim(fi.id)
+        with override_settings(IMPORT_STALE_AFTER=0):
+            second = state.claim(fi.id)
+        with self.assertRaises(state.ImportNotClaimed):
+            state.heartbeat(first, rows_parsed=1)
+        with self.assertRaises(state.ImportNotClaimed):
+            state.finish(first, FileStatus.PARSED)
+        state.finish(second, FileStatus.PARSED)
+        fi.refresh_from_db()
+        self.assertEqual((fi.status, fi.rows_parsed), (FileStatus.PARSED, 0))
+
+    def test_fused_pipeline_matches_staged(self):
+        rows = [
+            revolut_row(i).replace("Lidl", "Lidl" if i % 3 else "Spar")
+            for i in range(50)
+        ]
+        raw = (REVOLUT_HEADER + "".join(rows) + "".join(rows[:5])).encode()
+
+        def categorised(user_id):
+            return (
+                sorted(
+                    Transaction.objects.filter(user_id=user_id).values_list(
+                        "description_raw", "category__name"
+                    )
+                ),
+                sorted(
+                    Category.objects.filter(user_id=user_id).values_list(
+                        "name", "reference_count"
+                    )
+                ),
+                sorted(
+                    MonthlyRollup.objects.filter(user_id=user_id).values_list(
+                        "period", "category__name", "sign", "total", "txn_count"
+                    )
+                ),
+            )
+
+        results = []
+        for user_id, pipeline in [("staged-user", "staged"), ("fused-user", "fused")]:
+            seed_default_rules(user_id)
+            with override_settings(INGEST_PIPELINE=pipeline):
+                fi = self.run_import(raw, user_id=user_id)
+            if pipeline == "staged":
+                self.assertEqual(fi.rows_categorised, 0)
+                # the follow-up run only reads this import's rows
+                self.apply_rules.delay.assert_called_once_with(
+                    user_id, import_id=str(fi.id)
+                )
+                apply_rules_task(user_id, import_id=str(fi.id))
+                fi.refresh_from_db()
+            self.assertEqual(fi.rows_categorised, 50)
+            results.append(categorised(user_id))
+        self.assertEqual(results[0], results[1])
+
+
+@override_settings(TASK_COALESCING=True)
+class TaskCoalescingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_triggers_coalesce_until_the_run_starts(self):
+        with mock.patch.object(apply_rules_task, "apply_async") as apply_async:
+            for _ in range(12):
+                coalesce.dispatch(apply_rules_task, USER_ID)
+            coalesce.dispatch(apply_rules_task, "other-user")
+            self.assertEqual(apply_async.call_count, 2)
+
+            # the queued run starts: later triggers need a new run
+            apply_rules_task(USER_ID)
+            coalesce.dispatch(apply_rules_task, USER_ID)
+            self.assertEqual(apply_async.call_count, 3)
+
+    def test_runs_are_serialized_per_user(self):
+        with coalesce.user_lock(apply_rules_task, USER_ID):
+            with mock.patch.object(
+                apply_rules_task, "retry", side_effect=RuntimeError("retry")
+            ) as retry:
+                with self.assertRaisesMessage(RuntimeError, "retry"):
+                    apply_rules_task(USER_ID)
+                retry.assert_called_once()
+                # other users are not blocked
+                self.assertEqual(apply_rules_task("other-user"), 0)
+        self.assertEqual(apply_rules_task(USER_ID), 0)
+
+
+class ContentAddressedUploadTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.raw = (REVOLUT_HEADER + revolut_row(1)).encode()
+        self.checksum = hashlib.sha256(self.raw).hexdigest()
+
+    def upload(self, user_id=USER_ID):
+        headers = {**AUTH_HEADERS, "HTTP_X_USER_ID": user_id}
+        request = APIRequestFactory().post(
+            "/",
+            {"file": SimpleUploadedFile("Statement 1.CSV", self.raw)},
+            format="multipart",
+            **headers,
+        )
+        view = ImportViewSet.as_view({"post": "create"})
+        with mock.patch("ingestion.views.parse_import_task") as task:
+            response = view(request)
+        return response, task.delay.call_count
+
+    def test_reupload_of_parsed_file_is_not_requeued(self):
+        response, queued = self.upload()
+        self.assertEqual((response.status_code, queued), (201, 1))
+        fi = FileImport.objects.get(id=response.data["id"])
+        self.assertEqual(fi.storage_path, f"imports/{self.checksum}.csv")
+        self.assertEqual(fi.checksum_sha256, self.checksum)
+        self.assertEqual(
+            sorted(p.name for p in (Path(self.media.name) / "imports").iterdir()),
+            [f"{self.checksum}.csv"],
+        )
+
+        view = ImportViewSet.as_view({"get": "checksum"})
+        request = APIRequestFactory().get(
+            "/", {"sha256": self.checksum}, **AUTH_HEADERS
+        )
+        self.assertFalse(view(request).data["exists"])
+
+        FileImport.objects.filter(id=fi.id).update(status=FileStatus.PARSED)
+        self.assertTrue(view(request).data["exists"])
+        response, queued = self.upload()
+        self.assertEqual((response.status_code, queued), (200, 0))
+        self.assertEqual(response.data["id"], str(fi.id))
+
+    def test_shared_file_is_kept_until_last_import_is_deleted(self):
+        first, _ = self.upload()
+        second, _ = self.upload(user_id="other-user")
+        path = Path(self.media.name) / first.data["storage_path"]
+        self.assertEqual(first.data["storage_path"], second.data["storage_path"])
+
+        view = ImportViewSet.as_view({"delete": "destroy"})
+        factory = APIRequestFactory()
+        view(factory.delete("/", **AUTH_HEADERS), pk=first.data["id"])
+        self.assertTrue(path.exists())
+        view(
+            factory.delete("/", **{**AUTH_HEADERS, "HTTP_X_USER_ID": "other-user"}),
+            pk=second.data["id"],
+        )
+        self.assertFalse(path.exists())
+
+    def test_cleanup_racing_an_upload_of_the_same_file(self):
+        view = ImportViewSet.as_view({"delete": "destroy"})
+        delete = APIRequestFactory().delete("/", **AUTH_HEADERS)
+        replace, unlink = os.replace, Path.unlink
+        first, _ = self.upload()
+        path = Path(self.media.name) / first.data["storage_path"]
+
+        # another user uploads the same bytes while the file is moved aside
+        def replace_then_upload(src, dst):
+            replace(src, dst)
+            if str(dst).endswith(".deleted"):
+                self.upload(user_id="other-user")
+
+        with mock.patch("os.replace", side_effect=replace_then_upload):
+            view(delete, pk=first.data["id"])
+        self.assertTrue(path.exists())
+
+        # ... or after the references were checked, before the unlink
+        def upload_then_unlink(self_, *args, **kwargs):
+            if self_.name.endswith(".deleted"):
+                self.upload()
+            unlink(self_, *args, **kwargs)
+
+        second = FileImport.objects.get(user_id="other-user")
+        other = {**AUTH_HEADERS, "HTTP_X_USER_ID": "other-user"}
+        with mock.patch.object(
+            Path, "unlink", autospec=True, side_effect=upload_then_unlink
+        ):
+            view(APIRequestFactory().delete("/", **other), pk=second.id)
+        self.assertTrue(FileImport.objects.filter(user_id=USER_ID).exists())
+        self.assertEqual(
+            [p.name for p in path.parent.iterdir()], [f"{self.checksum}.csv"]
+        )
@@ -0,0 +1,36 @@
+"""
+Normalised transaction text (Transaction.description_norm).
+
+Rules, search and grouping compare against this form instead of the raw
+bank text: case-folded, accents folded (Hungarian "á", "ő", "ű" -> "a",
+"o", "u"), masked card numbers and long reference numbers removed and
+whitespace collapsed. Rule values are folded the same way (fold()), so a
+rule for "fizetés" matches "FIZETES" as well as "Fizetés".
+"""
+
+import re
+import unicodedata
+
+# "4321 **** **** 1234", "XXXXXXXXXXXX1234", "432112******1234"
+_CARD_NUMBER = re.compile(r"\b\d{0,6}(?:[ -]?[*x]{4,})+[ -]?\d{0,4}\b")
+# account, reference and authorisation numbers
+_LONG_NUMBER = re.compile(r"\b\d{8,}\b")
+_SPACES = re.compile(r"\s+")
+
+
+def strip_accents(text: str) -> str:
+    """Drop combining marks; a regex pattern keeps its meaning."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def fold(text: str | None) -> str:
+    """Case- and accent-folded text with whitespace collapsed."""
+    return _SPACES.sub(" ", strip_accents((text or "").casefold())).strip()
+
+
+def normalize_description(description: str | None, counterparty: str | None) -> str:
+    """description_norm of a transaction: its description and counterparty."""
+    text = fold(f"{description or ''} {counterparty or ''}")
+    text = _LONG_NUMBER.sub(" ", _CARD_NUMBER.sub(" ", text))
+    return _SPACES.sub(" ", text).strip()
@@ -0,0 +1,114 @@
+import base64
+import binascii
+from datetime import date
+from uuid import UUID
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class TransactionCursorPagination(BasePagination):
+    """
+    Keyset pagination on (booking_date DESC, id DESC).
+
+    The cursor encodes the position of the last row of the previous page and
+    the next page is selected with a WHERE on that position, so page N costs
+    the same as page 1 (no OFFSET). Backed by the (user_id, booking_date
+    DESC NULLS LAST, id DESC) index on Transaction.
+
+    Rows without a booking date come last (NULLS LAST, as in the index), so
+    the WHERE spells out the NULL case instead of relying on a row-value
+    comparison, which NULLs would not satisfy:
+
+        booking_date < d OR (booking_date = d AND id < pk)
+            OR booking_date IS NULL
+        -- or, for a cursor inside the undated rows:
+        booking_date IS NULL AND id < pk
+    """
+
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        limit = self.page_size + 1
+        queryset = queryset.order_by(F("booking_date").desc(nulls_last=True), "-id")
+        if cursor is not None:
+            queryset = queryset.filter(self.after(*cursor))
+        rows = list(queryset[:limit])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        self.next_position = self.position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def after(booking_date, pk):
+        """Rows after (booking_date, pk) in the list order."""
+        if booking_date is None:
+            return Q(booking_date__isnull=True, id__lt=pk)
+        return (
+            Q(booking_date__lt=booking_date)
+            | Q(booking_date=booking_date, id__lt=pk)
+            | Q(booking_date__isnull=True)
+        )
+
+    @staticmethod
+    def position(row):
+        # rows are model instances or values() dicts
+        if isinstance(row, dict):
+            return row["booking_date"], row["id"]
+        return row.booking_date, row.id
+
+    def encode_cursor(self, position):
+        booking_date, pk = position
+        raw = f"{booking_date.isoformat() if booking_date else ''}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode("ascii")).decode("ascii")
+            booking_date, pk = raw.split("|")
+            booking_date = date.fromisoformat(booking_date) if booking_date else None
+            return booking_date, UUID(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
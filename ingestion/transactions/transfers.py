@@ -0,0 +1,202 @@
+"""
+Transfer detection.
+
+Money moved between a user's own accounts shows up twice: as an outflow in
+one statement and as an inflow of the same amount in another. Such pairs
+are marked is_transfer (and point at each other through transfer_peer), so
+cashflow and spending widgets do not count them.
+
+Pairs are found with a sort-merge: the candidate rows are sorted by
+(|amount|, currency, booking_date) once, each (|amount|, currency) run is
+split into outflows and inflows, and the two date-ordered lists are merged
+with a sliding window of TRANSFER_WINDOW_DAYS. Each outflow takes the
+closest-dated inflow from a different import. That is O(n log n) for the
+sort and near linear for the merge, instead of comparing every pair.
+
+Rules with action_mark_transfer mark the rows they match as transfers
+without a peer (e.g. a savings account whose statement is not imported).
+"""
+
+import uuid
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from ingestion.dashboard.cache import bump_data_version
+from ingestion.dashboard.rollup import RollupDelta
+from ingestion.models import Rule, Transaction
+from ingestion.rules.engine import CompiledRuleSet
+from ingestion.rules.utils import rule_text
+
+CANDIDATE_FIELDS = (
+    "id",
+    "user_id",
+    "import_file_id",
+    "booking_date",
+    "amount",
+    "currency",
+    "category_id",
+    "is_transfer",
+    "description_norm",
+    "description_raw",
+    "counterparty",
+    "merchant",
+)
+
+
+def match_pairs(rows, window_days: int, new_import_id=None) -> list[tuple]:
+    """
+    (outflow, inflow) pairs among `rows` (Transactions with a booking date
+    and a non-zero amount): opposite amounts in the same currency, booked
+    at most `window_days` apart, from different imports. With
+    `new_import_id` one side of every pair comes from that import.
+    """
+    window = timedelta(days=window_days)
+
+    def key(t):
+        return abs(t.amount), t.currency
+
+    pairs = []
+    ordered = sorted(rows, key=lambda t: (abs(t.amount), t.currency, t.booking_date))
+    for _, run in groupby(ordered, key=key):
+        run = list(run)
+        outflows = [t for t in run if t.amount < 0]
+        inflows = [t for t in run if t.amount > 0]
+        if not outflows or not inflows:
+            continue
+        taken = [False] * len(inflows)
+        lo = 0
+        for out in outflows:
+            # inflows booked too early for this (and every later) outflow
+            while (
+                lo < len(inflows)
+                and inflows[lo].booking_date < out.booking_date - window
+            ):
+                lo += 1
+            best = None
+            i = lo
+            while (
+                i < len(inflows)
+                and inflows[i].booking_date <= out.booking_date + window
+            ):
+                inflow = inflows[i]
+                if (
+                    not taken[i]
+                    and inflow.import_file_id != out.import_file_id
+                    and (
+                        new_import_id is None
+                        or new_import_id in (inflow.import_file_id, out.import_file_id)
+                    )
+                ):
+                    gap = abs((inflow.booking_date - out.booking_date).days)
+                    if best is None or gap < best[0]:
+                        best = (gap, i)
+                i += 1
+            if best is not None:
+                taken[best[1]] = True
+                pairs.append((out, inflows[best[1]]))
+    return pairs
+
+
+def mark_rule_transfers(user_id: str, rows) -> list:
+    """The rows of `rows` an enabled action_mark_transfer rule matches."""
+    rules = list(
+        Rule.objects.filter(
+            Q(user_id=user_id) | Q(user_id="default"),
+            enabled=True,
+            action_mark_transfer=True,
+        ).order_by("priority")
+    )
+    if not rules:
+        return []
+    ruleset = CompiledRuleSet(rules)
+    return [
+        t
+        for t in rows
+        if ruleset.match(rule_text(t), t.amount, t.merchant_id) is not None
+    ]
+
+
+def detect_transfers(user_id: str, import_id=None, window_days=None) -> int:
+    """
+    Mark the user's transfers. With `import_id` only the rows that could
+    pair with that import's rows (same window around its dates) are read,
+    which is how new imports are handled incrementally. Returns the number
+    of rows newly marked.
+    """
+    window_days = settings.TRANSFER_WINDOW_DAYS if window_days is None else window_days
+    if import_id is not None:
+        import_id = uuid.UUID(str(import_id))
+    qs = Transaction.objects.filter(
+        user_id=user_id, is_transfer=False, booking_date__isnull=False
+    ).exclude(amount=0)
+
+    with transaction.atomic():
+        if import_id is not None:
+            new_rows = list(
+                qs.filter(import_file_id=import_id)
+                .select_for_update()
+                .only(*CANDIDATE_FIELDS)
+            )
+            if not new_rows:
+                return 0
+            window = timedelta(days=window_days)
+            first = min(t.booking_date for t in new_rows) - window
+            last = max(t.booking_date for t in new_rows) + window
+            others = list(
+                qs.exclude(import_file_id=import_id)
+                .filter(booking_date__range=(first, last))
+                .select_for_update()
+                .only(*CANDIDATE_FIELDS)
+            )
+            rows = new_rows + others
+            by_rule = mark_rule_transfers(user_id, new_rows)
+        else:
+            rows = list(qs.select_for_update().only(*CANDIDATE_FIELDS))
+            by_rule = mark_rule_transfers(user_id, rows)
+
+        marked = {t.id: t for t in by_rule}
+        pairs = match_pairs(
+            [t for t in rows if t.id not in marked], window_days, import_id
+        )
+        for out, inflow in pairs:
+            out.transfer_peer_id, inflow.transfer_peer_id = inflow.id, out.id
+            marked[out.id], marked[inflow.id] = out, inflow
+        if not marked:
+            return 0
+
+        delta = RollupDelta()
+        for txn in marked.values():
+            delta.add_txn(txn, -1)
+            txn.is_transfer = True
+            delta.add_txn(txn, 1)
+        Transaction.objects.bulk_update(
+            list(marked.values()), ["is_transfer", "transfer_peer"], batch_size=1000
+        )
+        delta.apply(user_id)
+        bump_data_version(user_id)
+    return len(marked)
+
+
+def release_peers(qs):
+    """
+    Unmark the peers of the transfers in `qs`; call before deleting the
+    rows in `qs`, so the other half is counted as ordinary money again.
+    """
+    peers = list(
+        Transaction.objects.filter(transfer_peer__in=qs)
+        .exclude(id__in=qs.values("id"))
+        .only(*CANDIDATE_FIELDS, "transfer_peer")
+    )
+    if not peers:
+        return
+    delta = RollupDelta()
+    for txn in peers:
+        delta.add_txn(txn, -1)
+        txn.is_transfer, txn.transfer_peer_id = False, None
+        delta.add_txn(txn, 1)
+    Transaction.objects.bulk_update(peers, ["is_transfer", "transfer_peer"])
+    delta.apply(peers[0].user_id)
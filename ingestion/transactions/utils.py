@@ -1,8 +1,24 @@
 import hashlib
-from django.db import transaction
-from ingestion.models import Transaction
+from decimal import Decimal
 
 
-def compute_txn_hash(txn):
-    key = f"{txn.user_id}|{txn.booking_date}|{txn.amount}|{txn.description_raw.strip()}|{txn.counterparty.strip()}"
+def compute_fingerprint(
+    user_id, booking_date, amount, description_raw, counterparty
+) -> str:
+    """
+    Stable identity of a transaction, used to drop re-imported rows.
+    The amount is quantized so parsed values and stored values hash the same.
+    """
+    amount = Decimal(amount).quantize(Decimal("0.01"))
+    key = f"{user_id}|{booking_date}|{amount}|{(description_raw or '').strip()}|{(counterparty or '').strip()}"
     return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def compute_txn_hash(txn):
+    return compute_fingerprint(
+        txn.user_id,
+        txn.booking_date,
+        txn.amount,
+        txn.description_raw,
+        txn.counterparty,
+    )
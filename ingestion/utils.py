@@ -1,6 +1,13 @@
 import os
+from django.core import signing
 from supabase import create_client
 
+# query-string tokens of the import progress stream (EventSource cannot send
+# an Authorization header)
+EVENTS_TOKEN_SALT = "ingestion.import-events"
+EVENTS_TOKEN_MAX_AGE = 60
+
+
 def get_user_id(request):
     """
     Extracts the user ID from the X-User-Id header.
@@ -41,3 +48,30 @@ def get_access_token(request):
     #     return None
 
     return access_token
+
+
+def sign_events_token(user_id: str, import_id) -> str:
+    """Short-lived token that opens the progress stream of one import."""
+    return signing.dumps(
+        {"user_id": user_id, "import_id": str(import_id)}, salt=EVENTS_TOKEN_SALT
+    )
+
+
+def read_events_token(token: str, import_id, in_progress=False) -> str | None:
+    """
+    The user id of a valid token for `import_id`, otherwise None. Tokens
+    expire after EVENTS_TOKEN_MAX_AGE seconds, unless the import is
+    `in_progress`: EventSource reconnects with the same URL whenever a
+    stream ends, until the import is parsed or failed.
+    """
+    try:
+        data = signing.loads(
+            token,
+            salt=EVENTS_TOKEN_SALT,
+            max_age=None if in_progress else EVENTS_TOKEN_MAX_AGE,
+        )
+    except signing.BadSignature:  # also SignatureExpired
+        return None
+    if data.get("import_id") != str(import_id):
+        return None
+    return data.get("user_id")
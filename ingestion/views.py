@@ -1,32 +1,95 @@
 from django.shortcuts import render
-import hashlib, os
+from django.http import StreamingHttpResponse
+import hashlib, os, tempfile, uuid
 from django.conf import settings
 from rest_framework import status, viewsets, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from .models import FileImport, FileStatus
-from .serializers import FileImportSerializer
+from .serializers import FileImportSerializer, FileImportStatusSerializer
 from .tasks import parse_import_task, apply_rules_task
+from .rules.tasks import recategorise_rule_task
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from .serializers import ImportUploadSerializer, TransactionSerializer
+from .serializers import TRANSACTION_LIST_VALUES, transaction_values_to_dict
+from .renderers import EventStreamRenderer, ORJSONRenderer
 from pathlib import Path
 from django.utils.text import get_valid_filename
 import time
-from ingestion.models import Transaction
-from .models import Rule
+from ingestion.models import Transaction, MonthlyRollup
+from .models import Rule, RuleMatchType
 from .serializers import RuleSerializer
 from .models import Category
 from .serializers import CategorySerializer
-from .utils import get_user_id, get_access_token
-
-
-def sha256sum(path: str) -> str:
+from .utils import (
+    EVENTS_TOKEN_MAX_AGE,
+    get_user_id,
+    get_access_token,
+    read_events_token,
+    sign_events_token,
+)
+from .transactions.pagination import TransactionCursorPagination
+from .transactions.merchants import ensure_merchant
+from .transactions.normalize import fold
+from .transactions.transfers import release_peers
+from .imports import state
+from . import coalesce
+from .dashboard import rollup
+from .dashboard.cache import bump_data_version, cached_dashboard_view
+from django.db import transaction
+
+
+def receive_upload(file, directory: Path) -> tuple[Path, str]:
+    """
+    Stream an upload into a temporary file under `directory`, hashing the
+    chunks on the way. Returns (temporary path, sha256 hex digest).
+    """
     h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
+    with tempfile.NamedTemporaryFile(
+        dir=directory, suffix=".part", delete=False
+    ) as dest:
+        for chunk in file.chunks():
             h.update(chunk)
-    return h.hexdigest()
+            dest.write(chunk)
+    return Path(dest.name), h.hexdigest()
+
+
+def remove_unreferenced_files(storage_paths):
+    """
+    Delete import files that no FileImport points to any more.
+
+    An upload of the same bytes may publish the file meanwhile. It creates
+    its FileImport before moving the file into place, and an unreferenced
+    file is moved aside before the references are checked again, so either
+    that check sees the new row and the file is put back, or the upload
+    moves its copy in after ours was moved aside.
+    """
+    for storage_path in storage_paths:
+        if FileImport.objects.filter(storage_path=storage_path).exists():
+            continue
+        path = Path(settings.MEDIA_ROOT) / storage_path
+        aside = path.with_name(f"{path.name}.{uuid.uuid4().hex}.deleted")
+        try:
+            os.replace(path, aside)
+        except FileNotFoundError:
+            continue
+        if FileImport.objects.filter(storage_path=storage_path).exists():
+            # same name, same bytes: overwriting the upload's copy is fine
+            os.replace(aside, path)
+        else:
+            aside.unlink()
+
+
+def parsed_import(user_id: str, checksum: str):
+    return (
+        FileImport.objects.filter(
+            user_id=user_id, checksum_sha256=checksum, status=FileStatus.PARSED
+        )
+        .order_by("-created_at")
+        .first()
+    )
 
 
 class ImportViewSet(
@@ -78,27 +141,24 @@ class ImportViewSet(
         if not file:
             return Response({"detail": "No file"}, status=400)
 
-        media_root = Path(settings.MEDIA_ROOT)
-        import_dir = media_root / "imports"
+        import_dir = Path(settings.MEDIA_ROOT) / "imports"
         import_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path, checksum = receive_upload(file, import_dir)
 
-        safe_name = get_valid_filename(file.name)
-        import_rel = f"imports/{safe_name}"
-        full_path = media_root / import_rel
-
-        # név ütközés elkerülés
-        base, ext = os.path.splitext(import_rel)
-        i = 1
-        while full_path.exists():
-            import_rel = f"{base}_{i}{ext}"
-            full_path = settings.MEDIA_ROOT / import_rel
-            i += 1
+        # the same file was already imported: nothing to parse again
+        existing = parsed_import(user_id, checksum)
+        if existing is not None:
+            tmp_path.unlink()
+            return Response(
+                self.get_serializer(existing).data, status=status.HTTP_200_OK
+            )
 
-        with open(full_path, "wb+") as dest:
-            for chunk in file.chunks():
-                dest.write(chunk)
+        # content-addressed: identical uploads share one file
+        ext = os.path.splitext(get_valid_filename(file.name))[1].lower()
+        import_rel = f"imports/{checksum}{ext}"
 
-        checksum = sha256sum(str(full_path))
+        # the row first: a concurrent cleanup of the shared file then keeps
+        # it (see remove_unreferenced_files)
         rec = FileImport.objects.create(
             user_id=user_id,
             original_name=file.name,
@@ -108,10 +168,12 @@ class ImportViewSet(
             checksum_sha256=checksum,
             status=FileStatus.UPLOADED,
         )
+        os.replace(tmp_path, Path(settings.MEDIA_ROOT) / import_rel)
         # queue feldolgozásra
+        if state.transition(rec.id, FileStatus.QUEUED):
+            rec.status = FileStatus.QUEUED
         parse_import_task.delay(str(rec.id))
         s = self.get_serializer(rec)
-        time.sleep(2)
         return Response(s.data, status=status.HTTP_201_CREATED)
 
     @extend_schema(
@@ -124,21 +186,28 @@ class ImportViewSet(
             instance = self.get_queryset().get(pk=pk)
         except FileImport.DoesNotExist:
             return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
-        file_path = Path(settings.MEDIA_ROOT) / instance.storage_path
-        if file_path.exists():
-            file_path.unlink()
-        instance.delete()
+        with transaction.atomic():
+            release_peers(instance.transactions.all())
+            rollup.remove_transactions(instance.user_id, instance.transactions.all())
+            instance.delete()
+            bump_data_version(instance.user_id)
+        remove_unreferenced_files([instance.storage_path])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=["delete"], url_path="delete_all")
     def delete_all_imports(self, request):
         queryset = self.get_queryset()
         count = queryset.count()
-        for instance in queryset:
-            file_path = Path(settings.MEDIA_ROOT) / instance.storage_path
-            if file_path.exists():
-                file_path.unlink()
-        queryset.delete()
+        storage_paths = set(queryset.values_list("storage_path", flat=True))
+        with transaction.atomic():
+            release_peers(Transaction.objects.filter(import_file__in=queryset))
+            rollup.remove_transactions(
+                get_user_id(request),
+                Transaction.objects.filter(import_file__in=queryset),
+            )
+            queryset.delete()
+            bump_data_version(get_user_id(request))
+        remove_unreferenced_files(storage_paths)
         return Response({"deleted": count}, status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=["get"], url_path="latest")
@@ -159,9 +228,162 @@ class ImportViewSet(
         serializer = self.get_serializer(latest)
         return Response(serializer.data)
 
+    @extend_schema(
+        summary="Pre-flight checksum check",
+        description=(
+            "Whether a file with this SHA-256 is already imported and parsed "
+            "for the user, so the client can skip uploading it again."
+        ),
+        parameters=[
+            OpenApiParameter(name="sha256", required=True, type=str),
+        ],
+    )
+    @action(detail=False, methods=["get"], url_path="checksum")
+    def checksum(self, request):
+        uid = get_user_id(request)
+        access_token = get_access_token(request)
+
+        if access_token is None or uid is None:
+            return Response(
+                {"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        checksum = (request.query_params.get("sha256") or "").lower()
+        if len(checksum) != 64:
+            return Response({"detail": "Invalid sha256"}, status=400)
+
+        existing = parsed_import(uid, checksum)
+        return Response(
+            {
+                "exists": existing is not None,
+                "import": self.get_serializer(existing).data if existing else None,
+            }
+        )
+
+    @extend_schema(
+        summary="Import progress",
+        description="Status and progress counters of a single import.",
+        responses=FileImportStatusSerializer,
+    )
+    @action(detail=True, methods=["get"], url_path="status")
+    def import_status(self, request, pk=None):
+        uid = get_user_id(request)
+        access_token = get_access_token(request)
+
+        if access_token is None or uid is None:
+            return Response(
+                {"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        fi = FileImport.objects.filter(user_id=uid, pk=pk).first()
+        if fi is None:
+            return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(FileImportStatusSerializer(fi).data)
+
+    @extend_schema(
+        summary="Import progress stream token",
+        description=(
+            "A token for the progress stream of one import: it opens the "
+            f"stream within {EVENTS_TOKEN_MAX_AGE} seconds, and any time while "
+            "the import is in progress. `EventSource` cannot send the "
+            "Authorization header, so the stream takes it as `?token=`."
+        ),
+        responses={
+            200: {"type": "object", "properties": {"token": {"type": "string"}}}
+        },
+    )
+    @action(detail=True, methods=["post"], url_path="events-token")
+    def import_events_token(self, request, pk=None):
+        uid = get_user_id(request)
+        access_token = get_access_token(request)
+
+        if access_token is None or uid is None:
+            return Response(
+                {"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED
+            )
+        if not FileImport.objects.filter(user_id=uid, pk=pk).exists():
+            return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {"token": sign_events_token(uid, pk), "expires_in": EVENTS_TOKEN_MAX_AGE}
+        )
+
+    @extend_schema(
+        summary="Import progress stream",
+        description=(
+            "Server-sent events with the import's progress; one event per "
+            "change, the stream ends once the import is parsed or failed. "
+            "Authenticated by the usual headers or by `?token=` from "
+            "events-token (for `EventSource`); the token keeps working for "
+            "reconnects until the import is parsed or failed."
+        ),
+        parameters=[OpenApiParameter("token", str, required=False)],
+        responses={(200, "text/event-stream"): FileImportStatusSerializer},
+    )
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="events",
+        renderer_classes=[EventStreamRenderer],
+    )
+    def import_events(self, request, pk=None):
+        token = request.query_params.get("token")
+        if token:
+            in_progress = (
+                FileImport.objects.filter(pk=pk)
+                .exclude(status__in=(FileStatus.PARSED, FileStatus.FAILED))
+                .exists()
+            )
+            uid = read_events_token(token, pk, in_progress=in_progress)
+            access_token = token if uid else None
+        else:
+            uid = get_user_id(request)
+            access_token = get_access_token(request)
+
+        if access_token is None or uid is None:
+            return Response(
+                {"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        if not FileImport.objects.filter(user_id=uid, pk=pk).exists():
+            return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(
+            self._progress_events(uid, pk), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # no proxy buffering
+        return response
+
+    # every open stream holds a worker: poll gently and hand the client
+    # back to EventSource's reconnect soon
+    sse_poll_interval = 1.0
+    sse_max_duration = 60
+
+    def _progress_events(self, user_id, pk):
+        last = None
+        deadline = time.monotonic() + self.sse_max_duration
+        while True:
+            fi = FileImport.objects.filter(user_id=user_id, pk=pk).first()
+            if fi is None:
+                yield EventStreamRenderer.event({"detail": "Not found"}, "error")
+                return
+            data = FileImportStatusSerializer(fi).data
+            if data != last:
+                yield EventStreamRenderer.event(data, "progress")
+                last = data
+            if fi.status in (FileStatus.PARSED, FileStatus.FAILED):
+                yield EventStreamRenderer.event(data, "done")
+                return
+            if time.monotonic() > deadline:
+                # the client's EventSource reconnects by itself
+                return
+            time.sleep(self.sse_poll_interval)
+
 
 class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TransactionSerializer
+    pagination_class = TransactionCursorPagination
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
     def get_queryset(self):
         user_id = get_user_id(self.request)
@@ -172,7 +394,11 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
                 {"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED
             )
 
-        qs = Transaction.objects.filter(user_id=user_id).order_by("-booking_date")
+        qs = (
+            Transaction.objects.filter(user_id=user_id)
+            .select_related("category")
+            .order_by("-booking_date")
+        )
 
         date_from = self.request.query_params.get("date_from")
         date_to = self.request.query_params.get("date_to")
@@ -184,9 +410,27 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
             qs = qs.filter(booking_date__lte=date_to)
         if category_id:
             qs = qs.filter(category_id=category_id)
+        if q := self.request.query_params.get("q"):
+            # description_norm is already folded, so a plain substring
+            # match is case- and accent-insensitive (no LOWER() per row)
+            qs = qs.filter(description_norm__contains=fold(q))
 
         return qs
 
+    def list(self, request, *args, **kwargs):
+        """
+        Read-optimised list: one values() query with the category joined,
+        rows turned into dicts directly instead of through the serializer.
+        """
+        qs = self.get_queryset()
+        if isinstance(qs, Response):
+            return qs
+
+        page = self.paginate_queryset(qs.values(*TRANSACTION_LIST_VALUES))
+        return self.get_paginated_response(
+            [transaction_values_to_dict(row) for row in page]
+        )
+
     @extend_schema(
         summary="Delete a transaction.",
         description="Deletes a transaction by ID.",
@@ -197,7 +441,13 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
             instance = self.get_queryset().get(pk=pk)
         except Transaction.DoesNotExist:
             return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
-        instance.delete()
+        with transaction.atomic():
+            release_peers(Transaction.objects.filter(pk=instance.pk))
+            delta = rollup.RollupDelta()
+            delta.add_txn(instance, -1)
+            delta.apply(instance.user_id)
+            instance.delete()
+            bump_data_version(instance.user_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=["get"], url_path="get")
@@ -224,12 +474,13 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
                 {"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED
             )
 
-        task = apply_rules_task.delay(user_id)
+        # explicit full-user pass; a pass that is already queued covers it
+        task = coalesce.dispatch(apply_rules_task, user_id)
 
         return Response(
             {
-                "task_id": task.id,
-                "status": "Task started",
+                "task_id": task.id if task else None,
+                "status": "Task started" if task else "Task already queued",
                 "message": "Rules are being applied in the background",
             },
             status=status.HTTP_202_ACCEPTED,
@@ -243,10 +494,13 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
 
         cat_id = request.data.get("category_id") or request.data.get("category")
+        old_category_id = instance.category_id
+        # a manual choice is kept when rules change (see rules.recategorise)
+        instance.rule_id = instance.rule_version = None
 
         if cat_id in (None, "", "null"):
             instance.category = None
-            instance.save()
+            self._save_with_rollup(instance, old_category_id)
             serializer = self.get_serializer(instance)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -269,18 +523,47 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
             )
 
         instance.category = category
-        instance.save()
+        self._save_with_rollup(instance, old_category_id)
         serializer = self.get_serializer(instance)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @staticmethod
+    def _save_with_rollup(instance, old_category_id):
+        with transaction.atomic():
+            instance.save()
+            if old_category_id != instance.category_id:
+                delta = rollup.RollupDelta()
+                delta.move_txn(instance, old_category_id, instance.category_id)
+                delta.apply(instance.user_id)
+                bump_data_version(instance.user_id)
+
     @action(detail=False, methods=["get"], url_path="available-years-and-months")
     def available_years_and_months(self, request):
-        txns = self.get_queryset()
-        dates = txns.exclude(booking_date=None).dates("booking_date", "month")
+        user_id = get_user_id(request)
+        access_token = get_access_token(request)
+
+        if access_token is None or user_id is None:
+            return Response(
+                {"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        # served from the monthly rollups instead of a DISTINCT over transactions
+        qs = MonthlyRollup.objects.filter(user_id=user_id).exclude(period="")
+        date_from = request.query_params.get("date_from")
+        date_to = request.query_params.get("date_to")
+        category_id = request.query_params.get("category_id")
+        if date_from:
+            qs = qs.filter(period__gte=date_from[:7])
+        if date_to:
+            qs = qs.filter(period__lte=date_to[:7])
+        if category_id:
+            qs = qs.filter(category_id=category_id)
+
+        periods = qs.values_list("period", flat=True).distinct().order_by("period")
         result = {}
-        for d in dates:
-            year = d.year
-            month = d.month
+        for period in periods:
+            year = int(period[:4])
+            month = int(period[5:])
             if year not in result:
                 result[year] = []
             result[year].append(month)
@@ -306,11 +589,32 @@ class RuleViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         user_id = get_user_id(self.request)
-        serializer.save(user_id=user_id)
+        rule = serializer.save(user_id=user_id)
+        self._ensure_merchant(rule)
+        self._recategorise(user_id, rule.id)
 
     def perform_update(self, serializer):
         user_id = get_user_id(self.request)
-        serializer.save(user_id=user_id)
+        # the rows matched by the previous version become stale
+        rule = serializer.save(user_id=user_id, version=serializer.instance.version + 1)
+        self._ensure_merchant(rule)
+        self._recategorise(user_id, rule.id)
+
+    def perform_destroy(self, instance):
+        rule_id = instance.id
+        instance.delete()
+        self._recategorise(get_user_id(self.request), rule_id)
+
+    @staticmethod
+    def _ensure_merchant(rule):
+        if rule.match_type == RuleMatchType.MERCHANT:
+            ensure_merchant(rule.match_value)
+
+    @staticmethod
+    def _recategorise(user_id, rule_id):
+        transaction.on_commit(
+            lambda: recategorise_rule_task.delay(user_id, str(rule_id))
+        )
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
@@ -337,20 +641,31 @@ class CategoryViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         user_id = get_user_id(self.request)
         serializer.save(user_id=user_id)
+        # dashboards show category names and types
+        bump_data_version(user_id)
+
+    def perform_destroy(self, instance):
+        # its transactions become uncategorized (SET_NULL)
+        with transaction.atomic():
+            rollup.move_category(instance.id, None)
+            instance.delete()
+            bump_data_version(get_user_id(self.request))
 
 
-from decimal import Decimal
-from django.db.models import Sum, F, Value, Case, When, DecimalField, Count
-from django.db.models.functions import ExtractMonth, ExtractYear
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db.models import Q
 
-from ingestion.models import Transaction
-import re
+from ingestion.dashboard import widgets
+
+# The dashboard endpoints read MonthlyRollup rows and compute their widget
+# with ingestion.dashboard.widgets. Only top-merchants needs per-row text and
+# still reads transactions.
 
 
 @api_view(["GET"])
+@cached_dashboard_view
 def cashflow_view(request):
     """Monthly income and expense totals."""
     user_id = get_user_id(request)
@@ -359,43 +674,11 @@ def cashflow_view(request):
     if access_token is None or user_id is None:
         return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
 
-    qs = (
-        Transaction.objects.filter(user_id=user_id, is_transfer=False)
-        .exclude(booking_date=None)
-        .annotate(year=ExtractYear("booking_date"), month=ExtractMonth("booking_date"))
-        .values("year", "month")
-        .annotate(
-            income=Sum(
-                Case(
-                    When(amount__gt=0, then=F("amount")),
-                    default=Value(0),
-                    output_field=DecimalField(max_digits=14, decimal_places=2),
-                )
-            ),
-            expense=Sum(
-                Case(
-                    When(amount__lt=0, then=F("amount")),
-                    default=Value(0),
-                    output_field=DecimalField(max_digits=14, decimal_places=2),
-                )
-            ),
-        )
-        .order_by("year", "month")
-    )
-
-    data = [
-        {
-            "year": int(r["year"]),
-            "month": int(r["month"]),
-            "income": float(r["income"] or 0),
-            "expense": abs(float(r["expense"] or 0)),
-        }
-        for r in qs
-    ]
-    return Response(data)
+    return Response(widgets.cashflow(widgets.fetch_rollup_rows(user_id)))
 
 
 @api_view(["GET"])
+@cached_dashboard_view
 def categories_view(request):
     """Breakdown of expenses by category."""
     user_id = get_user_id(request)
@@ -404,30 +687,11 @@ def categories_view(request):
     if access_token is None or user_id is None:
         return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
 
-    qs = (
-        Transaction.objects.filter(user_id=user_id, is_transfer=False, amount__lt=0)
-        .values("category__name", "category__type")
-        .annotate(
-            total=Sum(
-                F("amount") * Value(-1),
-                output_field=DecimalField(max_digits=14, decimal_places=2),
-            )
-        )
-        .order_by("-total")
-    )
-
-    data = [
-        {
-            "category": r["category__name"] or "Egyéb",
-            "type": r["category__type"],
-            "value": float(r["total"] or 0),
-        }
-        for r in qs
-    ]
-    return Response(data)
+    return Response(widgets.categories_summary(widgets.fetch_rollup_rows(user_id)))
 
 
 @api_view(["GET"])
+@cached_dashboard_view
 def top_merchants_view(request):
     """Top counterparties by spending."""
     user_id = get_user_id(request)
@@ -437,30 +701,11 @@ def top_merchants_view(request):
         return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
 
     limit = int(request.query_params.get("limit", 5))
-
-    qs = (
-        Transaction.objects.filter(user_id=user_id, is_transfer=False, amount__lt=0)
-        .values("counterparty")
-        .annotate(
-            total=Sum(
-                F("amount") * Value(-1),
-                output_field=DecimalField(max_digits=14, decimal_places=2),
-            )
-        )
-        .order_by("-total")[:limit]
-    )
-
-    data = [
-        {
-            "name": r["counterparty"] or "(no counterparty)",
-            "amount": float(r["total"] or 0),
-        }
-        for r in qs
-    ]
-    return Response(data)
+    return Response(widgets.top_merchants(user_id, limit))
 
 
 @api_view(["GET"])
+@cached_dashboard_view
 def balance_summary(request):
     user_id = get_user_id(request)
     access_token = get_access_token(request)
@@ -468,50 +713,11 @@ def balance_summary(request):
     if access_token is None or user_id is None:
         return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
 
-    aggregates = (
-        Transaction.objects.filter(user_id=user_id)
-        .select_related("category")
-        .aggregate(
-            income=Sum(
-                Case(
-                    When(category__type="income", then=F("amount")),
-                    default=Value(0),
-                    output_field=DecimalField(),
-                )
-            ),
-            expense=Sum(
-                Case(
-                    When(category__type="expense", then=F("amount")),
-                    default=Value(0),
-                    output_field=DecimalField(),
-                )
-            ),
-        )
-    )
-
-    income = aggregates.get("income") or Decimal("0")
-    expense = aggregates.get("expense") or Decimal("0")
-    net_savings = income - expense
-
-    # Nettó egyenleg (kumulativ megtakaritas)
-    total_balance = net_savings
-
-    return Response(
-        {
-            "income": income,
-            "expense": expense,
-            "net_savings": net_savings,
-            "total_balance": total_balance,
-        }
-    )
-
-
-from datetime import date
-from dateutil.relativedelta import relativedelta
-from django.db.models.functions import TruncMonth
+    return Response(widgets.balance_summary(widgets.fetch_rollup_rows(user_id)))
 
 
 @api_view(["GET"])
+@cached_dashboard_view
 def monthly_balance(request):
     user_id = get_user_id(request)
     access_token = get_access_token(request)
@@ -520,53 +726,12 @@ def monthly_balance(request):
         return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
 
     months = int(request.GET.get("months", 6))
-    today = date.today()
-    start_date = today - relativedelta(months=months - 1)
-    start_date = start_date.replace(day=1)
-
-    # csoportosítás hónap szerint
-    qs = (
-        Transaction.objects.filter(user_id=user_id, booking_date__gte=start_date)
-        .select_related("category")
-        .annotate(month=TruncMonth("booking_date"))
-        .values("month")
-        .annotate(
-            income=Sum(
-                Case(
-                    When(category__type="income", then=F("amount")),
-                    default=Value(0),
-                    output_field=DecimalField(),
-                )
-            ),
-            expense=Sum(
-                Case(
-                    When(category__type="expense", then=F("amount")),
-                    default=Value(0),
-                    output_field=DecimalField(),
-                )
-            ),
-        )
-        .order_by("month")
-    )
-
-    # JSON formázás
-    result = []
-    for row in qs:
-        income = row.get("income") or Decimal("0")
-        expense = row.get("expense") or Decimal("0")
-        result.append(
-            {
-                "month": row["month"].strftime("%Y-%m"),
-                "income": income,
-                "expense": expense,
-                "net": income - expense,
-            }
-        )
-
-    return Response(result)
+    rows = widgets.fetch_rollup_rows(user_id)
+    return Response(widgets.monthly_balance(rows, months=months))
 
 
 @api_view(["GET"])
+@cached_dashboard_view
 def category_expenses(request):
     user_id = get_user_id(request)
     access_token = get_access_token(request)
@@ -574,60 +739,17 @@ def category_expenses(request):
     if access_token is None or user_id is None:
         return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
 
-    period = request.GET.get("period")
-    today = date.today()
-
-    start_date = None
-    end_date = None
-
-    if period:
-        try:
-            year, month = map(int, period.split("-"))
-            start_date = date(year, month, 1)
-        except Exception:
-            return Response(
-                {"detail": "Invalid period format (use YYYY-MM)"}, status=400
-            )
-
-        # hónap utolsó napja (következő hónap első napja mint felső zárt határ)
-        if start_date.month == 12:
-            end_date = date(start_date.year + 1, 1, 1)
-        else:
-            end_date = date(start_date.year, start_date.month + 1, 1)
+    try:
+        period = widgets.parse_period(request.GET.get("period"))
+    except Exception:
+        return Response({"detail": "Invalid period format (use YYYY-MM)"}, status=400)
 
-    # tranzakciók összesítése kategóriánként
-    qs = Transaction.objects.filter(
-        user_id=user_id,
-        category__type="expense",
-    )
-    # ha period meg van adva, akkor időszakra szűrünk, különben nincs dátum limit
-    if start_date and end_date:
-        qs = qs.filter(booking_date__gte=start_date, booking_date__lt=end_date)
-
-    qs = (
-        qs.select_related("category")
-        .values(name=F("category__name"))
-        .annotate(amount=Sum("amount"))
-        .order_by("amount")
-    )
-
-    # top 5
-    data = [
-        {
-            "category": row["name"],
-            "amount": row["amount"],
-        }
-        for row in list(qs)[:5]
-        if row["amount"]
-    ]
-
-    return Response(data)
-
-from django.db.models.functions import ExtractWeekDay
-from django.db.models import Q
+    rows = widgets.fetch_rollup_rows(user_id)
+    return Response(widgets.category_expenses(rows, period=period))
 
 
 @api_view(["GET"])
+@cached_dashboard_view
 def spending_patterns(request):
     user_id = get_user_id(request)
     access_token = get_access_token(request)
@@ -635,32 +757,11 @@ def spending_patterns(request):
     if access_token is None or user_id is None:
         return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
 
-    # Hét napjának sorrendje (Django: 1=Vasárnap, 7=Szombat)
-    day_map = {1: "Sun", 2: "Mon", 3: "Tue", 4: "Wed", 5: "Thu", 6: "Fri", 7: "Sat"}
-
-    qs = (
-        Transaction.objects.filter(user_id=user_id, category__type="expense")
-        .exclude(booking_date__isnull=True)
-        .annotate(weekday=ExtractWeekDay("booking_date"))
-        .values("weekday")
-        .annotate(amount=Sum("amount"))
-        .order_by("weekday")
-    )
-
-    result = []
-    for row in qs:
-        weekday = int(row["weekday"])
-        result.append(
-            {
-                "day": day_map.get(weekday, str(weekday)),
-                "amount": row["amount"] or 0,
-            }
-        )
-
-    return Response({"by_weekday": result})
+    return Response(widgets.spending_patterns(widgets.fetch_rollup_rows(user_id)))
 
 
 @api_view(["GET"])
+@cached_dashboard_view
 def category_coverage(request):
     user_id = get_user_id(request)
     access_token = get_access_token(request)
@@ -668,46 +769,80 @@ def category_coverage(request):
     if access_token is None or user_id is None:
         return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
 
-    total_transactions = Transaction.objects.filter(user_id=user_id).count()
-    categorized_transactions = Transaction.objects.filter(
-        user_id=user_id, category__isnull=False
-    ).count()
+    return Response(widgets.category_coverage(widgets.fetch_rollup_rows(user_id)))
 
-    coverage_percentage = (
-        (categorized_transactions / total_transactions) * 100
-        if total_transactions > 0
-        else 0
-    )
 
-    return Response(
-        {
-            "total_transactions": total_transactions,
-            "categorized_transactions": categorized_transactions,
-            "coverage_percentage": round(coverage_percentage, 2),
-        }
-    )
+@api_view(["GET"])
+@cached_dashboard_view
+def avg_expense_per_category(request):
+    user_id = get_user_id(request)
+    access_token = get_access_token(request)
+
+    if access_token is None or user_id is None:
+        return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+
+    rows = widgets.fetch_rollup_rows(user_id)
+    return Response(widgets.avg_expense_per_category(rows))
+
+
+DASHBOARD_WIDGETS = {
+    "cashflow": lambda rows, params: widgets.cashflow(rows),
+    "categories-summary": lambda rows, params: widgets.categories_summary(rows),
+    "top-merchants": lambda rows, params: widgets.top_merchants(
+        params["user_id"], params["limit"]
+    ),
+    "balance-summary": lambda rows, params: widgets.balance_summary(rows),
+    "monthly-balance": lambda rows, params: widgets.monthly_balance(
+        rows, months=params["months"]
+    ),
+    "category-expenses": lambda rows, params: widgets.category_expenses(
+        rows, period=params["period"]
+    ),
+    "spending-patterns": lambda rows, params: widgets.spending_patterns(rows),
+    "category-coverage": lambda rows, params: widgets.category_coverage(rows),
+    "avg-expense-per-category": lambda rows, params: widgets.avg_expense_per_category(
+        rows
+    ),
+}
 
 
 @api_view(["GET"])
-def avg_expense_per_category(request):
+@cached_dashboard_view
+def dashboard_bundle(request):
+    """
+    Every dashboard widget in one response, computed from a single fetch of
+    the user's rollup rows (plus one query for top-merchants).
+
+    ?widgets=cashflow,top-merchants selects widgets (default: all); the
+    single-endpoint parameters months, period and limit are accepted too.
+    """
     user_id = get_user_id(request)
     access_token = get_access_token(request)
 
     if access_token is None or user_id is None:
         return Response({"detail": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
 
-    qs = (
-        Transaction.objects.filter(user_id=user_id, category__type="expense")
-        .values("category__name")
-        .annotate(avg_amount=Sum("amount") / Count("id"))
-        .order_by("category__name")
+    requested = request.query_params.get("widgets")
+    names = (
+        [w.strip() for w in requested.split(",") if w.strip()]
+        if requested
+        else list(DASHBOARD_WIDGETS)
     )
+    unknown = [name for name in names if name not in DASHBOARD_WIDGETS]
+    if unknown:
+        return Response(
+            {"detail": f"Unknown widgets: {', '.join(unknown)}"}, status=400
+        )
 
-    data = [
-        {
-            "category": r["category__name"] or "Egyéb",
-            "average_expense": float(r["avg_amount"] or 0),
+    try:
+        params = {
+            "user_id": user_id,
+            "limit": int(request.query_params.get("limit", 5)),
+            "months": int(request.query_params.get("months", 6)),
+            "period": widgets.parse_period(request.query_params.get("period")),
         }
-        for r in qs
-    ]
-    return Response(data)
+    except ValueError:
+        return Response({"detail": "Invalid limit, months or period"}, status=400)
+
+    rows = widgets.fetch_rollup_rows(user_id)
+    return Response({name: DASHBOARD_WIDGETS[name](rows, params) for name in names})